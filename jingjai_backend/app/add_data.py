@@ -1,39 +1,29 @@
-from database import SessionLocal
-from models import Brand, Product
-from datetime import datetime
+# app/add_data.py
+"""
+Add the Alexander Wang brand and a few of its products.
 
-db = SessionLocal()
+Goes through the catalog importer, so re-running it updates instead of
+duplicating. Products seeded before skus existed are matched once
+app/migrate_catalog_import.py has backfilled their skus; run it first on
+such databases. Run from the jingjai_backend directory:
+    python -m app.add_data
+"""
+import psycopg
 
-try:
-    # Add Alexander Wang brand
-    brand = Brand(
-        name="Alexander Wang",
-        logo="AW",
-        api_endpoint="alexander-wang",
-        is_featured=False,
-        created_at=datetime.utcnow()
-    )
-    db.add(brand)
-    db.commit()
-    db.refresh(brand)
-    print(f"Added brand: {brand.name}")
-
-    # Add some products
-    products = [
-        Product(brand_id=brand.id, name="Attica", model="Alexander Wang", created_at=datetime.utcnow()),
-        Product(brand_id=brand.id, name="Rocco", model="Alexander Wang", created_at=datetime.utcnow()),
-        Product(brand_id=brand.id, name="Rockie", model="Alexander Wang", created_at=datetime.utcnow()),
-    ]
+from .database import libpq_dsn
+from .catalog_import import import_records
 
-    for product in products:
-        db.add(product)
+products = [
+    {"brand": "Alexander Wang", "brand_logo": "AW", "name": "Attica", "model": "Alexander Wang"},
+    {"brand": "Alexander Wang", "brand_logo": "AW", "name": "Rocco", "model": "Alexander Wang"},
+    {"brand": "Alexander Wang", "brand_logo": "AW", "name": "Rockie", "model": "Alexander Wang"},
+]
 
-    db.commit()
-    print(f"Added {len(products)} products")
+try:
+    with psycopg.connect(libpq_dsn()) as conn:
+        stats = import_records(conn, products, derive_skus=True)
+    print(f"Added {stats.inserted} products ({stats.updated} updated, {stats.unchanged} unchanged)")
     print("Data added successfully!")
 
 except Exception as e:
-    db.rollback()
     print(f"Error: {e}")
-finally:
-    db.close()
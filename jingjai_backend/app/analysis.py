@@ -0,0 +1,366 @@
+# app/analysis.py
+"""
+AI analysis queue for authentication requests.
+
+The authentications table is the queue: a worker claims open rows (PENDING,
+or PROCESSING with an expired lease) with FOR UPDATE SKIP LOCKED, flips them
+to PROCESSING and pushes analysis_visible_at out by the lease. While the
+analyzer runs, the lease is extended periodically. A worker that dies simply
+lets the lease lapse and another worker picks the row up.
+
+analysis_attempts doubles as a fencing token. Results are only written if
+the row is still on the attempt that was claimed, so a slow worker whose
+lease expired cannot overwrite a newer result. Failures are retried with
+exponential backoff, and after MAX_ATTEMPTS the row is parked as FAILED.
+Completion enqueues an ``authentication.completed`` outbox event.
+
+Before the analyzer runs, the photos are checked against every earlier
+authentication's perceptual hashes (app.phash). Near-duplicates are stored
+on the row, and an AUTHENTIC verdict on reused photos is downgraded to
+INCONCLUSIVE for a human to look at. Submissions without a product_id get
+catalog candidates from the product image index (app.embeddings).
+
+Analyzers are pluggable: AI_ANALYZER=stub (default), model (app.inference's
+batching server) or "package.module:Class".
+"""
+import asyncio
+import hashlib
+import importlib
+import logging
+import os
+import random
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .outbox import enqueue_event
+from .phash import check_photos
+from .status_stream import record_status_change
+from .storage import Storage, content_key, get_storage, key_from_url, sha256_of_key
+
+logger = logging.getLogger(__name__)
+
+PENDING = "PENDING"
+PROCESSING = "PROCESSING"
+COMPLETED = "COMPLETED"
+FAILED = "FAILED"
+OPEN_STATUSES = (PENDING, PROCESSING)
+
+CONCURRENCY = int(os.getenv("AI_ANALYSIS_CONCURRENCY", "4"))
+LEASE = timedelta(seconds=int(os.getenv("AI_ANALYSIS_LEASE_SECONDS", "120")))
+MAX_ATTEMPTS = int(os.getenv("AI_ANALYSIS_MAX_ATTEMPTS", "5"))
+POLL_INTERVAL_SECONDS = 1.0
+BASE_BACKOFF_SECONDS = 5.0
+MAX_BACKOFF_SECONDS = 600.0
+PHOTO_HASH_ENABLED = os.getenv("PHOTO_HASH_ENABLED", "true").lower() == "true"
+
+jobs_claimed = metrics.counter("analysis.jobs_claimed", "Authentications claimed for analysis")
+jobs_completed = metrics.counter("analysis.jobs_completed", "Analyses written back")
+jobs_retried = metrics.counter("analysis.jobs_retried", "Analyses rescheduled after an error")
+jobs_failed = metrics.counter("analysis.jobs_failed", "Analyses parked after exhausting retries")
+stale_results = metrics.counter("analysis.stale_results", "Results dropped because the lease was lost")
+queue_depth = metrics.gauge("analysis.queue_depth", "Open authentications awaiting analysis")
+oldest_open_age = metrics.gauge("analysis.oldest_open_seconds", "Age of the oldest open authentication")
+in_flight = metrics.gauge("analysis.in_flight", "Analyses currently running")
+analyze_seconds = metrics.histogram("analysis.analyze_seconds", "Analyzer run time per authentication")
+end_to_end_seconds = metrics.histogram(
+    "analysis.latency_seconds", "Time from submission to result",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800, 3600)
+)
+
+@dataclass
+class AnalysisJob:
+    authentication_id: int
+    user_id: int
+    attempt: int
+    brand_name: Optional[str]
+    product_name: Optional[str]
+    product_id: Optional[int]
+    created_at: datetime
+    # Storage keys, preferring the pipeline's normalized analysis variant
+    photo_keys: List[str] = field(default_factory=list)
+
+@dataclass
+class AnalysisResult:
+    result: str  # AUTHENTIC, FAKE, INCONCLUSIVE
+    confidence: float
+    notes: Optional[str] = None
+
+class Analyzer(ABC):
+    name = "base"
+
+    @abstractmethod
+    def analyze(self, job: AnalysisJob, storage: Storage) -> AnalysisResult:
+        """Run one analysis (called from a worker thread)"""
+
+class StubAnalyzer(Analyzer):
+    """
+    Deterministic local stand-in for the model.
+
+    The verdict is derived from the photo content hashes and the product, so
+    the same submission always gets the same answer.
+    """
+    name = "stub"
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+
+    def analyze(self, job: AnalysisJob, storage: Storage) -> AnalysisResult:
+        if self.latency:
+            time.sleep(self.latency)
+        if not job.photo_keys:
+            return AnalysisResult("INCONCLUSIVE", 0.0, "No photos to analyze")
+
+        digest = hashlib.sha256("|".join(
+            [job.brand_name or "", job.product_name or ""] + sorted(sha256_of_key(key) for key in job.photo_keys)
+        ).encode()).digest()
+        score = int.from_bytes(digest[:4], "big") / 2 ** 32
+        if score < 0.15:
+            return AnalysisResult("FAKE", round(0.6 + score * 2, 3), "Stub model: inconsistent details")
+        if score < 0.25:
+            return AnalysisResult("INCONCLUSIVE", round(0.3 + score, 3), "Stub model: needs clearer photos")
+        return AnalysisResult("AUTHENTIC", round(0.7 + score * 0.3, 3), "Stub model: no issues found")
+
+def load_analyzer(spec: Optional[str] = None) -> Analyzer:
+    spec = spec or os.getenv("AI_ANALYZER", "stub")
+    if spec == "stub":
+        return StubAnalyzer(latency=float(os.getenv("AI_STUB_LATENCY", "0")))
+    if spec == "model":
+        # Batched NumPy inference; main starts inference_server alongside
+        from .inference import ModelAnalyzer
+        return ModelAnalyzer()
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+def _photo_keys(storage: Storage, urls: Optional[List[str]]) -> List[str]:
+    keys = []
+    for url in urls or []:
+        key = key_from_url(url)
+        if key is None:
+            continue
+        variant = content_key(sha256_of_key(key), "jpg", variant="analysis")
+        keys.append(variant if storage.exists(variant) else key)
+    return keys
+
+def _backoff(attempts: int) -> timedelta:
+    delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * (2 ** (attempts - 1)))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+def claim_jobs(db: Session, storage: Storage, limit: int, lease: timedelta = LEASE) -> List[AnalysisJob]:
+    """Lease up to ``limit`` open authentications, oldest first"""
+    now = datetime.utcnow()
+    rows = db.query(models.Authentication).filter(
+        models.Authentication.status.in_(OPEN_STATUSES),
+        or_(models.Authentication.analysis_visible_at.is_(None), models.Authentication.analysis_visible_at <= now)
+    ).order_by(models.Authentication.created_at).limit(limit).with_for_update(skip_locked=True).all()
+
+    jobs = []
+    for row in rows:
+        if row.status != PROCESSING:
+            record_status_change(db, row.user_id, row.id, PROCESSING)
+        row.status = PROCESSING
+        row.analysis_attempts = (row.analysis_attempts or 0) + 1
+        row.analysis_visible_at = now + lease
+        jobs.append(AnalysisJob(
+            authentication_id=row.id,
+            user_id=row.user_id,
+            attempt=row.analysis_attempts,
+            brand_name=row.brand_name,
+            product_name=row.product_name,
+            product_id=row.product_id,
+            created_at=row.created_at,
+            photo_keys=_photo_keys(storage, row.photos_uploaded),
+        ))
+    db.commit()
+    jobs_claimed.inc(len(jobs))
+    return jobs
+
+def _fenced(db: Session, job: AnalysisJob):
+    return db.query(models.Authentication).filter(
+        models.Authentication.id == job.authentication_id,
+        models.Authentication.status == PROCESSING,
+        models.Authentication.analysis_attempts == job.attempt
+    )
+
+def extend_lease(db: Session, job: AnalysisJob, lease: timedelta = LEASE) -> bool:
+    updated = _fenced(db, job).update(
+        {"analysis_visible_at": datetime.utcnow() + lease}, synchronize_session=False
+    )
+    db.commit()
+    return bool(updated)
+
+def apply_duplicates(result: AnalysisResult, duplicates: List[Dict]) -> AnalysisResult:
+    """Reused photos rule out an automatic AUTHENTIC verdict"""
+    if not duplicates:
+        return result
+    others = sorted({d["authentication_id"] for d in duplicates})
+    note = f"Photos match earlier authentication(s) {', '.join(f'#{i}' for i in others[:5])}"
+    notes = f"{result.notes}; {note}" if result.notes else note
+    if result.result == "AUTHENTIC":
+        return AnalysisResult("INCONCLUSIVE", result.confidence, notes)
+    return AnalysisResult(result.result, result.confidence, notes)
+
+def complete_job(db: Session, job: AnalysisJob, result: AnalysisResult,
+                 duplicates: Optional[List[Dict]] = None, product_candidates: Optional[List[Dict]] = None) -> bool:
+    now = datetime.utcnow()
+    values = {
+        "status": COMPLETED,
+        "authentication_result": result.result,
+        "confidence_score": result.confidence,
+        "authenticator_notes": func.coalesce(models.Authentication.authenticator_notes, result.notes),
+        "completed_at": now,
+        "analysis_visible_at": None,
+        "analysis_error": None,
+    }
+    if duplicates is not None:
+        values["photo_duplicates"] = duplicates
+    if product_candidates is not None:
+        values["product_candidates"] = product_candidates
+    updated = _fenced(db, job).update(values, synchronize_session=False)
+    if not updated:
+        db.rollback()
+        stale_results.inc()
+        return False
+
+    record_status_change(db, job.user_id, job.authentication_id, COMPLETED, result.result, result.confidence)
+    enqueue_event(db, "authentication.completed", "authentication", str(job.authentication_id), {
+        "authentication_id": job.authentication_id,
+        "user_id": job.user_id,
+        "result": result.result,
+        "confidence_score": result.confidence,
+    })
+    db.commit()
+    jobs_completed.inc()
+    end_to_end_seconds.observe((now - job.created_at).total_seconds())
+    return True
+
+def fail_job(db: Session, job: AnalysisJob, error: str):
+    if job.attempt >= MAX_ATTEMPTS:
+        values = {"status": FAILED, "analysis_visible_at": None, "analysis_error": error}
+        jobs_failed.inc()
+        logger.error(f"Analysis of authentication {job.authentication_id} failed permanently: {error}")
+    else:
+        values = {"status": PENDING, "analysis_visible_at": datetime.utcnow() + _backoff(job.attempt),
+                  "analysis_error": error}
+        jobs_retried.inc()
+    if _fenced(db, job).update(values, synchronize_session=False):
+        record_status_change(db, job.user_id, job.authentication_id, values["status"])
+    db.commit()
+
+def refresh_queue_metrics(db: Session):
+    count, oldest = db.query(
+        func.count(models.Authentication.id),
+        func.min(models.Authentication.created_at)
+    ).filter(models.Authentication.status.in_(OPEN_STATUSES)).one()
+    db.commit()
+    queue_depth.set(count)
+    oldest_open_age.set((datetime.utcnow() - oldest).total_seconds() if oldest else 0.0)
+
+class AnalysisWorkerPool:
+    """Keeps up to ``concurrency`` analyses running, claiming more as slots free up"""
+
+    def __init__(self, session_factory: Callable[[], Session], analyzer: Optional[Analyzer] = None,
+                 storage_factory: Callable[[], Storage] = get_storage, concurrency: int = CONCURRENCY,
+                 lease: timedelta = LEASE, poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.analyzer = analyzer or load_analyzer()
+        self.storage_factory = storage_factory
+        self.concurrency = concurrency
+        self.lease = lease
+        self.poll_interval = poll_interval
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="analysis")
+        self._running: Set[asyncio.Task] = set()
+
+    def _run_db(self, fn: Callable[..., Any], *args):
+        db = self.session_factory()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    async def _heartbeat(self, job: AnalysisJob):
+        while True:
+            await asyncio.sleep(self.lease.total_seconds() / 3)
+            if not await asyncio.to_thread(self._run_db, extend_lease, job, self.lease):
+                return
+
+    def _check_duplicates(self, job: AnalysisJob, storage: Storage) -> Optional[List[Dict]]:
+        # Best effort: a hashing problem must not hold up the verdict
+        try:
+            return self._run_db(check_photos, storage, job.authentication_id, job.photo_keys)
+        except Exception as e:
+            logger.warning(f"Photo hash check of authentication {job.authentication_id} failed: {e}")
+            return None
+
+    def _suggest_products(self, job: AnalysisJob, storage: Storage) -> Optional[List[Dict]]:
+        from .embeddings import suggest_products  # embeddings imports inference, which imports this module
+        try:
+            return [{"product_id": product_id, "score": score}
+                    for product_id, score in suggest_products(storage, job.photo_keys)]
+        except Exception as e:
+            logger.warning(f"Product suggestions for authentication {job.authentication_id} failed: {e}")
+            return None
+
+    async def _process(self, job: AnalysisJob, storage: Storage):
+        loop = asyncio.get_running_loop()
+        heartbeat = asyncio.create_task(self._heartbeat(job))
+        duplicates = candidates = None
+        try:
+            if PHOTO_HASH_ENABLED and job.photo_keys:
+                duplicates = await loop.run_in_executor(self._executor, self._check_duplicates, job, storage)
+            if job.product_id is None and job.photo_keys:
+                candidates = await loop.run_in_executor(self._executor, self._suggest_products, job, storage)
+            started = time.perf_counter()
+            result = await loop.run_in_executor(self._executor, self.analyzer.analyze, job, storage)
+            analyze_seconds.observe(time.perf_counter() - started)
+        except Exception as e:
+            logger.warning(f"Analysis of authentication {job.authentication_id} failed: {e}")
+            await asyncio.to_thread(self._run_db, fail_job, job, f"{type(e).__name__}: {e}"[:1000])
+            return
+        finally:
+            heartbeat.cancel()
+        result = apply_duplicates(result, duplicates or [])
+        await asyncio.to_thread(self._run_db, complete_job, job, result, duplicates, candidates)
+
+    def _start(self, job: AnalysisJob, storage: Storage):
+        task = asyncio.create_task(self._process(job, storage))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def run(self):
+        last_metrics = 0.0
+        try:
+            while True:
+                free = self.concurrency - len(self._running)
+                claimed = []
+                try:
+                    if free > 0:
+                        storage = self.storage_factory()
+                        claimed = await asyncio.to_thread(self._run_db, claim_jobs, storage, free, self.lease)
+                        for job in claimed:
+                            self._start(job, storage)
+                    if time.monotonic() - last_metrics > 5:
+                        await asyncio.to_thread(self._run_db, refresh_queue_metrics)
+                        last_metrics = time.monotonic()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Analysis queue error: {e}")
+                in_flight.set(len(self._running))
+
+                if len(self._running) >= self.concurrency:
+                    # Claim again as soon as a slot frees up
+                    await asyncio.wait(self._running, return_when=asyncio.FIRST_COMPLETED)
+                elif not claimed:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            for task in self._running:
+                task.cancel()
+            self._executor.shutdown(wait=False)
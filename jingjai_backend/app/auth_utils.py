@@ -1,44 +1,98 @@
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, Header, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 from jose import JWTError, jwt
-from .database import get_db
+from .database import SessionLocal, get_db
 from .models import User
 import os
+import hmac
 from datetime import datetime
+from typing import Optional
 
 # JWT settings
 SECRET_KEY = os.getenv("SECRET_KEY", "your-secret-key-here-change-in-production")
 ALGORITHM = "HS256"
 
+# Shared secret for internal/back-office endpoints (reports, queues, metrics)
+ADMIN_API_KEY = os.getenv("ADMIN_API_KEY")
+
 security = HTTPBearer()
+optional_security = HTTPBearer(auto_error=False)
 
-async def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db)
-) -> User:
-    """Get current authenticated user from JWT token"""
-    
-    credentials_exception = HTTPException(
+def _credentials_exception() -> HTTPException:
+    return HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
         detail="Could not validate credentials",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    
+
+def _token_user_id(credentials: HTTPAuthorizationCredentials) -> int:
     try:
         payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: int = payload.get("user_id")
-        if user_id is None:
-            raise credentials_exception
     except JWTError:
-        raise credentials_exception
-    
+        raise _credentials_exception()
+    user_id = payload.get("user_id")
+    if user_id is None:
+        raise _credentials_exception()
+    return user_id
+
+def _authenticate(db: Session, user_id: int) -> User:
     user = db.query(User).filter(User.id == user_id).first()
     if user is None:
-        raise credentials_exception
+        raise _credentials_exception()
     
     # Update last login
     user.last_login = datetime.utcnow()
     db.commit()
     
     return user
+
+async def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db)
+) -> User:
+    """Get current authenticated user from JWT token"""
+    return _authenticate(db, _token_user_id(credentials))
+
+async def get_current_user_id(
+    credentials: HTTPAuthorizationCredentials = Depends(security)
+) -> int:
+    """
+    Authenticate like get_current_user, but with a session closed before returning.
+
+    For long-lived responses (SSE streams): a get_db session is only cleaned
+    up after the response body finishes, which would pin a pooled connection
+    for the life of the stream.
+    """
+    user_id = _token_user_id(credentials)
+    db = SessionLocal()
+    try:
+        _authenticate(db, user_id)
+    finally:
+        db.close()
+    return user_id
+
+async def get_optional_current_user(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(optional_security),
+    db: Session = Depends(get_db)
+) -> Optional[User]:
+    """Get the authenticated user if a valid token was sent, otherwise None"""
+    
+    if credentials is None:
+        return None
+    
+    try:
+        payload = jwt.decode(credentials.credentials, SECRET_KEY, algorithms=[ALGORITHM])
+    except JWTError:
+        return None
+    
+    user_id = payload.get("user_id")
+    if user_id is None:
+        return None
+    
+    return db.query(User).filter(User.id == user_id).first()
+
+def require_admin_key(x_admin_key: Optional[str] = Header(None, alias="X-Admin-Key")):
+    """Guard for back-office endpoints; disabled entirely if ADMIN_API_KEY is unset"""
+    if not ADMIN_API_KEY or not x_admin_key or not hmac.compare_digest(x_admin_key, ADMIN_API_KEY):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin access required")
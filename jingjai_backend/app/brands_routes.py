@@ -3,7 +3,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 from typing import Optional, List
 from .database import get_db
-from .models import Brand, Product, ProductCategory
+from .models import Brand, Product, ProductCategory, User
 from .schemas import (
     Brand as BrandSchema, 
     BrandWithProducts,
@@ -12,6 +12,10 @@ from .schemas import (
     BrandsResponse,
     ProductsResponse
 )
+from .auth_utils import get_optional_current_user
+from .serialization import (
+    BRANDS, JSONBytesResponse, Projection, brand_fields, product_dicts, product_fields
+)
 
 router = APIRouter(prefix="/brands", tags=["brands"])
 
@@ -19,6 +23,7 @@ router = APIRouter(prefix="/brands", tags=["brands"])
 def get_all_brands(
     featured_only: Optional[bool] = Query(False, description="Get only featured brands"),
     active_only: Optional[bool] = Query(True, description="Get only active brands"),
+    projection: Projection = Depends(brand_fields),
     db: Session = Depends(get_db)
 ):
     """Get all brands with optional filtering"""
@@ -30,24 +35,27 @@ def get_all_brands(
     if featured_only:
         query = query.filter(Brand.is_featured == True)
     
-    brands = query.order_by(Brand.name).all()
+    brands = projection.dicts(query.with_entities(*projection.columns).order_by(Brand.name))
     
-    return BrandsResponse(
-        brands=brands,
-        total=len(brands)
-    )
+    return JSONBytesResponse({
+        "brands": brands,
+        "total": len(brands)
+    })
 
 @router.get("/featured", response_model=BrandsResponse)
-def get_featured_brands(db: Session = Depends(get_db)):
+def get_featured_brands(
+    projection: Projection = Depends(brand_fields),
+    db: Session = Depends(get_db)
+):
     """Get only featured brands"""
-    brands = db.query(Brand).filter(
+    brands = projection.dicts(db.query(*projection.columns).filter(
         and_(Brand.is_featured == True, Brand.is_active == True)
-    ).order_by(Brand.name).all()
+    ).order_by(Brand.name))
     
-    return BrandsResponse(
-        brands=brands,
-        total=len(brands)
-    )
+    return JSONBytesResponse({
+        "brands": brands,
+        "total": len(brands)
+    })
 
 @router.get("/{brand_id}", response_model=BrandWithProducts)
 def get_brand_by_id(brand_id: int, db: Session = Depends(get_db)):
@@ -67,12 +75,14 @@ def get_brand_products(
     featured_only: Optional[bool] = Query(False, description="Get only featured products"),
     limit: Optional[int] = Query(50, description="Limit number of results"),
     offset: Optional[int] = Query(0, description="Offset for pagination"),
+    projection: Projection = Depends(product_fields),
+    current_user: Optional[User] = Depends(get_optional_current_user),
     db: Session = Depends(get_db)
 ):
     """Get products for a specific brand with filtering options"""
     
     # Verify brand exists
-    brand = db.query(Brand).filter(Brand.id == brand_id).first()
+    brand = db.query(*BRANDS.columns).filter(Brand.id == brand_id).first()
     if not brand:
         raise HTTPException(status_code=404, detail="Brand not found")
     
@@ -103,13 +113,13 @@ def get_brand_products(
     total = query.count()
     
     # Apply pagination and ordering
-    products = query.order_by(Product.name).offset(offset).limit(limit).all()
+    rows = query.with_entities(*projection.columns).order_by(Product.name).offset(offset).limit(limit)
     
-    return ProductsResponse(
-        products=products,
-        total=total,
-        brand=brand
-    )
+    return JSONBytesResponse({
+        "products": product_dicts(db, current_user, rows, projection),
+        "total": total,
+        "brand": dict(zip(BRANDS.fields, brand))
+    })
 
 @router.get("/{brand_id}/categories")
 def get_brand_categories(brand_id: int, db: Session = Depends(get_db)):
@@ -0,0 +1,191 @@
+# app/catalog_changes.py
+"""
+Catalog delta sync for clients that keep a local copy of the catalog.
+
+A client calls GET /catalog/changes without a watermark once and gets every
+active brand, category and product. After that it sends back the watermark
+from its last response and gets only what changed since then:
+- inserted or updated rows, to upsert locally
+- deactivated or deleted rows, as ids to drop
+
+Changes are read from the (updated_at, id) indexes on brands,
+product_categories and products, and from catalog_tombstones, which a
+delete trigger fills. All four are walked as one feed ordered by
+(timestamp, source, id). The watermark is the opaque position of the last
+row sent, so a large delta is paged with ``has_more`` and nothing is sent
+twice.
+
+updated_at is taken before commit, so a slow transaction could commit a row
+behind a watermark already handed out. Rows therefore only enter the feed
+once they are SETTLE old, which delays changes by that much and never loses
+one. A watermark older than the tombstone retention cannot see every delete.
+Such a client gets a full snapshot with ``reset`` set instead.
+"""
+import asyncio
+import base64
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from heapq import merge
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy import true, tuple_
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .serialization import BRANDS, PRODUCTS, projection
+
+logger = logging.getLogger(__name__)
+
+SETTLE = timedelta(seconds=int(os.getenv("CATALOG_CHANGES_SETTLE_SECONDS", "60")))
+TOMBSTONE_RETENTION = timedelta(days=int(os.getenv("CATALOG_TOMBSTONE_RETENTION_DAYS", "30")))
+DEFAULT_LIMIT = 500
+MAX_LIMIT = 5000
+
+# Feed order among rows with the same timestamp
+BRAND, CATEGORY, PRODUCT, TOMBSTONE = range(4)
+
+CATEGORIES = projection(models.ProductCategory, tuple(schemas.ProductCategory.model_fields))
+# Tombstone entity -> key in the "removed" lists
+REMOVED_KEYS = {"brand": "brands", "category": "categories", "product": "products"}
+
+@dataclass(frozen=True, order=True)
+class Watermark:
+    changed_at: datetime
+    source: int = BRAND
+    row_id: int = 0
+
+def encode_watermark(watermark: Watermark) -> str:
+    raw = f"{watermark.changed_at.isoformat()}|{watermark.source}|{watermark.row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_watermark(token: str) -> Optional[Watermark]:
+    """Decode a token produced by encode_watermark, or None if it is malformed"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        changed_at, source, row_id = base64.urlsafe_b64decode(padded).decode().split("|", 2)
+        return Watermark(datetime.fromisoformat(changed_at), int(source), int(row_id))
+    except (ValueError, UnicodeDecodeError):
+        return None
+
+def _after(changed_at, row_id, source: int, since: Optional[Watermark]):
+    """Rows of ``source`` strictly after ``since`` in (timestamp, source, id) order"""
+    if since is None:
+        return true()
+    if source < since.source:
+        return changed_at > since.changed_at
+    if source == since.source:
+        return tuple_(changed_at, row_id) > tuple_(since.changed_at, since.row_id)
+    return changed_at >= since.changed_at
+
+def _fetch(db: Session, model, columns, source: int, since: Optional[Watermark],
+           cutoff: datetime, limit: int, active_only: bool) -> List[Tuple[Watermark, Any]]:
+    query = db.query(model.updated_at, model.id, *columns).filter(
+        _after(model.updated_at, model.id, source, since),
+        model.updated_at <= cutoff
+    )
+    if active_only:
+        query = query.filter(model.is_active == True)
+    rows = query.order_by(model.updated_at, model.id).limit(limit).all()
+    return [(Watermark(row[0], source, row[1]), row[2:]) for row in rows]
+
+def _fetch_tombstones(db: Session, since: Watermark, cutoff: datetime, limit: int) -> List[Tuple[Watermark, Any]]:
+    tombstone = models.CatalogTombstone
+    rows = db.query(tombstone.deleted_at, tombstone.id, tombstone.entity, tombstone.entity_id).filter(
+        _after(tombstone.deleted_at, tombstone.id, TOMBSTONE, since),
+        tombstone.deleted_at <= cutoff
+    ).order_by(tombstone.deleted_at, tombstone.id).limit(limit).all()
+    return [(Watermark(row[0], TOMBSTONE, row[1]), row[2:]) for row in rows]
+
+def get_changes(db: Session, since: Optional[Watermark], limit: int = DEFAULT_LIMIT) -> Dict[str, Any]:
+    """One page of the change feed after ``since`` (None for a full snapshot)"""
+    now = datetime.utcnow()
+    cutoff = now - SETTLE
+    reset = since is None or since.changed_at < now - TOMBSTONE_RETENTION
+    if reset:
+        since = None
+
+    # Each source is an index range scan; limit + 1 rows apiece is enough to merge one page and see if more remain
+    sources = [
+        _fetch(db, models.Brand, BRANDS.columns, BRAND, since, cutoff, limit + 1, reset),
+        _fetch(db, models.ProductCategory, CATEGORIES.columns, CATEGORY, since, cutoff, limit + 1, reset),
+        _fetch(db, models.Product, PRODUCTS.columns, PRODUCT, since, cutoff, limit + 1, reset),
+    ]
+    # A fresh copy has nothing to remove
+    if not reset:
+        sources.append(_fetch_tombstones(db, since, cutoff, limit + 1))
+    db.commit()
+
+    page = []
+    for item in merge(*sources, key=lambda item: item[0]):
+        if len(page) == limit:
+            break
+        page.append(item)
+    has_more = sum(len(rows) for rows in sources) > limit
+
+    changes = {"brands": [], "categories": [], "products": []}
+    removed = {"brands": [], "categories": [], "products": []}
+    for position, row in page:
+        if position.source == TOMBSTONE:
+            entity, entity_id = row
+            removed[REMOVED_KEYS[entity]].append(entity_id)
+            continue
+        key, fields = [
+            ("brands", BRANDS.fields), ("categories", CATEGORIES.fields), ("products", PRODUCTS.fields)
+        ][position.source]
+        record = dict(zip(fields, row))
+        if record["is_active"]:
+            changes[key].append(record)
+        else:
+            removed[key].append(record["id"])
+
+    # Once caught up, move the watermark to the cutoff so idle clients never age past the retention
+    watermark = page[-1][0] if page else since
+    if not has_more:
+        watermark = max(watermark, Watermark(cutoff)) if watermark else Watermark(cutoff)
+
+    return {
+        **changes,
+        "removed": removed,
+        "watermark": encode_watermark(watermark),
+        "has_more": has_more,
+        "reset": reset,
+    }
+
+def purge_tombstones(db: Session, batch_size: int = 5000) -> int:
+    """Delete tombstones past the retention in batches; returns the number removed"""
+    removed = 0
+    cutoff = datetime.utcnow() - TOMBSTONE_RETENTION
+    while True:
+        ids = [row.id for row in db.query(models.CatalogTombstone.id).filter(
+            models.CatalogTombstone.deleted_at < cutoff
+        ).limit(batch_size)]
+        if not ids:
+            break
+        db.query(models.CatalogTombstone).filter(
+            models.CatalogTombstone.id.in_(ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+        removed += len(ids)
+        if len(ids) < batch_size:
+            break
+    return removed
+
+async def retention_loop(session_factory: Callable[[], Session], interval_seconds: float = 3600.0):
+    """Periodically drop tombstones no client can still need; run as a background task"""
+    def purge_once() -> int:
+        db = session_factory()
+        try:
+            return purge_tombstones(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            removed = await asyncio.to_thread(purge_once)
+            if removed:
+                logger.info(f"Purged {removed} old catalog tombstones")
+        except Exception as e:
+            logger.error(f"Catalog tombstone cleanup failed: {e}")
+        await asyncio.sleep(interval_seconds)
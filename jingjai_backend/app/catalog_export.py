@@ -0,0 +1,170 @@
+# app/catalog_export.py
+"""
+Full catalog dumps as NDJSON or CSV, optionally gzipped.
+
+Products are read with their brand and category joined through a
+server-side cursor (``yield_per``), and encoded and compressed one batch at
+a time. Memory stays flat whatever the catalog size: nothing goes through
+the ORM identity map, and no more than one batch of rows is held at once.
+
+The column names match app.catalog_import, so an export can be fed back
+into the importer unchanged (image_urls is written as a JSON array in CSV).
+
+Run from the jingjai_backend directory:
+    python -m app.catalog_export catalog.ndjson.gz [--format csv] [--brand-id 3]
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+import zlib
+from datetime import datetime
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+from sqlalchemy import select
+from sqlalchemy.engine import Engine
+
+from . import models
+from .database import engine as default_engine
+
+BATCH_SIZE = 2000
+FORMATS = ("ndjson", "csv")
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv; charset=utf-8"}
+
+_COLUMNS = (
+    ("id", models.Product.id),
+    ("sku", models.Product.sku),
+    ("brand_id", models.Product.brand_id),
+    ("brand", models.Brand.name),
+    ("brand_slug", models.Brand.api_endpoint),
+    ("brand_logo", models.Brand.logo),
+    ("category_id", models.Product.category_id),
+    ("category", models.ProductCategory.name),
+    ("category_display", models.ProductCategory.display_name),
+    ("name", models.Product.name),
+    ("model", models.Product.model),
+    ("description", models.Product.description),
+    ("price", models.Product.price),
+    ("price_numeric", models.Product.price_numeric),
+    ("currency", models.Product.currency),
+    ("image_urls", models.Product.image_urls),
+    ("thumbnail_url", models.Product.thumbnail_url),
+    ("color", models.Product.color),
+    ("material", models.Product.material),
+    ("dimensions", models.Product.dimensions),
+    ("is_active", models.Product.is_active),
+    ("is_featured", models.Product.is_featured),
+    ("stock_status", models.Product.stock_status),
+    ("created_at", models.Product.created_at),
+    ("updated_at", models.Product.updated_at),
+)
+FIELDS = tuple(name for name, _ in _COLUMNS)
+
+def export_query(brand_id: Optional[int] = None, include_inactive: bool = False):
+    query = select(*(column.label(name) for name, column in _COLUMNS)).select_from(
+        models.Product
+    ).join(
+        models.Brand, models.Brand.id == models.Product.brand_id
+    ).outerjoin(
+        models.ProductCategory, models.ProductCategory.id == models.Product.category_id
+    ).order_by(models.Product.id)
+    if brand_id is not None:
+        query = query.where(models.Product.brand_id == brand_id)
+    if not include_inactive:
+        query = query.where(models.Product.is_active == True, models.Brand.is_active == True)
+    return query
+
+def iter_batches(brand_id: Optional[int] = None, include_inactive: bool = False,
+                 batch_size: int = BATCH_SIZE, engine: Engine = default_engine) -> Iterator[Sequence[Any]]:
+    """Row tuples in batches from a server-side cursor; the connection is held until exhausted or closed"""
+    with engine.connect() as conn:
+        result = conn.execution_options(yield_per=batch_size).execute(export_query(brand_id, include_inactive))
+        for batch in result.partitions():
+            yield batch
+
+def _json_default(value: Any):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+def encode_ndjson(batches: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    for batch in batches:
+        lines = [json.dumps(dict(zip(FIELDS, row)), default=_json_default, separators=(",", ":")) for row in batch]
+        yield ("\n".join(lines) + "\n").encode("utf-8")
+
+def _csv_value(value: Any) -> Any:
+    if isinstance(value, list):
+        return json.dumps(value)
+    if isinstance(value, datetime):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    return value
+
+def encode_csv(batches: Iterable[Sequence[Any]]) -> Iterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for batch in batches:
+        writer.writerows([_csv_value(value) for value in row] for row in batch)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+def gzip_chunks(chunks: Iterable[bytes], level: int = 6) -> Iterator[bytes]:
+    """Compress a byte stream on the fly into a single gzip member"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip header and trailer
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+def export_chunks(fmt: str = "ndjson", compress: bool = False, brand_id: Optional[int] = None,
+                  include_inactive: bool = False, batch_size: int = BATCH_SIZE,
+                  engine: Engine = default_engine) -> Iterator[bytes]:
+    """The encoded export as a stream of byte chunks (sync; Starlette runs it in its threadpool)"""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    batches = iter_batches(brand_id, include_inactive, batch_size, engine)
+    chunks = encode_ndjson(batches) if fmt == "ndjson" else encode_csv(batches)
+    return gzip_chunks(chunks) if compress else chunks
+
+def export_filename(fmt: str, compress: bool) -> str:
+    stamp = datetime.utcnow().strftime("%Y%m%d-%H%M%S")
+    return f"catalog-{stamp}.{fmt}" + (".gz" if compress else "")
+
+def export_file(path: str, fmt: Optional[str] = None, brand_id: Optional[int] = None,
+                include_inactive: bool = False, batch_size: int = BATCH_SIZE) -> int:
+    """Write an export to ``path`` ("-" for stdout); gzip and format follow the file name. Returns bytes written"""
+    compress = path.endswith(".gz")
+    base = path[:-3] if compress else path
+    fmt = fmt or ("csv" if base.endswith(".csv") else "ndjson")
+    output = sys.stdout.buffer if path == "-" else open(path, "wb")
+    written = 0
+    try:
+        for chunk in export_chunks(fmt, compress, brand_id, include_inactive, batch_size):
+            output.write(chunk)
+            written += len(chunk)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    return written
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the product catalog")
+    parser.add_argument("path", help="Output file (.gz compresses), or - for stdout")
+    parser.add_argument("--format", choices=FORMATS, default=None)
+    parser.add_argument("--brand-id", type=int, default=None)
+    parser.add_argument("--include-inactive", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    written = export_file(args.path, args.format, args.brand_id, args.include_inactive, args.batch_size)
+    if args.path != "-":
+        print(f"✅ Wrote {written:,} bytes to {args.path} in {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,309 @@
+# app/catalog_import.py
+"""
+Streaming catalog importer for brand product feeds (CSV or JSONL).
+
+The file is read in chunks of ``batch_size`` rows. Each chunk is validated
+in Python and COPYed into a temporary staging table. Three set-based
+statements then upsert it:
+- brands, by name (new brands only)
+- categories, by (brand_id, name)
+- products, by sku, with the last row winning when a chunk repeats a sku
+
+The product upsert skips rows whose values are unchanged, so re-importing
+the same feed rewrites nothing and leaves updated_at alone. Each chunk is
+its own transaction, and a re-run after a failure simply upserts again.
+
+Recognised columns (only sku, brand and name are required):
+    sku, brand, brand_logo, category, category_display, name, model,
+    description, price, price_numeric, currency, image_urls, thumbnail_url,
+    color, material, dimensions, is_active, is_featured, stock_status
+In CSV, image_urls is a JSON array or "|"-separated URLs.
+
+Run from the jingjai_backend directory:
+    python -m app.catalog_import catalog.csv [--format jsonl] [--batch-size 20000]
+"""
+import argparse
+import csv
+import gzip
+import io
+import json
+import logging
+import re
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import psycopg
+
+from .database import libpq_dsn
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 20_000
+
+STAGE_COLUMNS = (
+    "line", "sku", "brand", "brand_slug", "brand_logo", "category", "category_display", "name", "model",
+    "description", "price", "price_numeric", "currency", "image_urls", "thumbnail_url", "color",
+    "material", "dimensions", "is_active", "is_featured", "stock_status",
+)
+
+CREATE_STAGE = """
+CREATE TEMP TABLE IF NOT EXISTS catalog_stage (
+    line bigint, sku text, brand text, brand_slug text, brand_logo text, category text,
+    category_display text, name text, model text, description text, price text,
+    price_numeric double precision, currency text, image_urls json, thumbnail_url text,
+    color text, material text, dimensions text, is_active boolean, is_featured boolean,
+    stock_status text
+) ON COMMIT DELETE ROWS
+"""
+
+UPSERT_BRANDS = """
+INSERT INTO brands (name, logo, api_endpoint, is_featured, is_active, created_at, updated_at)
+SELECT DISTINCT ON (s.brand) s.brand, coalesce(s.brand_logo, upper(left(s.brand, 2))), s.brand_slug,
+       false, true, %(now)s, %(now)s
+FROM catalog_stage s
+WHERE NOT EXISTS (SELECT 1 FROM brands b WHERE b.name = s.brand)
+ORDER BY s.brand, s.line DESC
+ON CONFLICT DO NOTHING
+"""
+
+UPSERT_CATEGORIES = """
+INSERT INTO product_categories (brand_id, name, display_name, is_active, updated_at)
+SELECT DISTINCT ON (b.id, s.category) b.id, s.category, coalesce(s.category_display, initcap(s.category)), true,
+       %(now)s
+FROM catalog_stage s
+JOIN brands b ON b.name = s.brand
+WHERE s.category IS NOT NULL
+ORDER BY b.id, s.category, s.line DESC
+ON CONFLICT (brand_id, name) DO NOTHING
+"""
+
+# xmax = 0 only for freshly inserted rows; the WHERE leaves identical rows untouched
+UPSERT_PRODUCTS = """
+WITH upserted AS (
+    INSERT INTO products (
+        sku, brand_id, category_id, name, model, description, price, price_numeric, currency,
+        image_urls, thumbnail_url, color, material, dimensions, is_active, is_featured, stock_status,
+        created_at, updated_at
+    )
+    SELECT DISTINCT ON (s.sku)
+        s.sku, b.id, c.id, s.name, s.model, s.description, s.price, s.price_numeric,
+        coalesce(s.currency, 'USD'), s.image_urls, s.thumbnail_url, s.color, s.material, s.dimensions,
+        coalesce(s.is_active, true), coalesce(s.is_featured, false), coalesce(s.stock_status, 'in_stock'),
+        %(now)s, %(now)s
+    FROM catalog_stage s
+    JOIN brands b ON b.name = s.brand
+    LEFT JOIN product_categories c ON c.brand_id = b.id AND c.name = s.category
+    ORDER BY s.sku, s.line DESC
+    ON CONFLICT (sku) DO UPDATE SET
+        brand_id = EXCLUDED.brand_id,
+        category_id = EXCLUDED.category_id,
+        name = EXCLUDED.name,
+        model = EXCLUDED.model,
+        description = EXCLUDED.description,
+        price = EXCLUDED.price,
+        price_numeric = EXCLUDED.price_numeric,
+        currency = EXCLUDED.currency,
+        image_urls = EXCLUDED.image_urls,
+        thumbnail_url = coalesce(EXCLUDED.thumbnail_url, products.thumbnail_url),
+        color = EXCLUDED.color,
+        material = EXCLUDED.material,
+        dimensions = EXCLUDED.dimensions,
+        is_active = EXCLUDED.is_active,
+        is_featured = EXCLUDED.is_featured,
+        stock_status = EXCLUDED.stock_status,
+        updated_at = EXCLUDED.updated_at
+    WHERE (products.brand_id, products.category_id, products.name, products.model, products.description,
+           products.price, products.price_numeric, products.currency, products.image_urls::jsonb,
+           products.color, products.material, products.dimensions, products.is_active,
+           products.is_featured, products.stock_status)
+        IS DISTINCT FROM
+          (EXCLUDED.brand_id, EXCLUDED.category_id, EXCLUDED.name, EXCLUDED.model, EXCLUDED.description,
+           EXCLUDED.price, EXCLUDED.price_numeric, EXCLUDED.currency, EXCLUDED.image_urls::jsonb,
+           EXCLUDED.color, EXCLUDED.material, EXCLUDED.dimensions, EXCLUDED.is_active,
+           EXCLUDED.is_featured, EXCLUDED.stock_status)
+       OR (EXCLUDED.thumbnail_url IS NOT NULL AND products.thumbnail_url IS DISTINCT FROM EXCLUDED.thumbnail_url)
+    RETURNING (xmax = 0) AS inserted
+)
+SELECT count(*) FILTER (WHERE inserted), count(*) FILTER (WHERE NOT inserted) FROM upserted
+"""
+
+COUNT_STAGED = """
+SELECT count(DISTINCT s.sku), count(DISTINCT s.sku) FILTER (WHERE b.id IS NOT NULL)
+FROM catalog_stage s LEFT JOIN brands b ON b.name = s.brand
+"""
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    rejected: int = 0
+    inserted: int = 0
+    updated: int = 0
+    unchanged: int = 0
+    unmatched: int = 0  # Brand could not be created (e.g. api_endpoint taken by another name)
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.read / self.seconds if self.seconds else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.read} rows: {self.inserted} inserted, {self.updated} updated, "
+                f"{self.unchanged} unchanged, {self.rejected} rejected, {self.unmatched} unmatched "
+                f"({self.rows_per_second:,.0f} rows/s)")
+
+def slugify(value: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-")
+
+def derive_sku(brand: str, name: str) -> str:
+    """Stable sku for feeds (and seed data) that have none"""
+    return f"{slugify(brand)}:{slugify(name)}"
+
+_PRICE = re.compile(r"[^0-9.]")
+
+def _text(value: Any) -> Optional[str]:
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value or None
+
+def _flag(value: Any) -> Optional[bool]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ("1", "true", "yes", "y", "t")
+
+def _image_urls(value: Any) -> Optional[str]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, str):
+        value = value.strip()
+        urls = json.loads(value) if value.startswith("[") else [url.strip() for url in value.split("|")]
+    else:
+        urls = list(value)
+    urls = [url for url in urls if url]
+    return json.dumps(urls) if urls else None
+
+def normalize(record: Dict[str, Any], line: int, derive_skus: bool = False) -> Tuple:
+    """One feed record -> a catalog_stage row; raises ValueError for unusable rows"""
+    brand = _text(record.get("brand"))
+    name = _text(record.get("name"))
+    if not brand or not name:
+        raise ValueError("brand and name are required")
+    sku = _text(record.get("sku"))
+    if not sku:
+        if not derive_skus:
+            raise ValueError("sku is required")
+        sku = derive_sku(brand, name)
+
+    price = _text(record.get("price"))
+    price_numeric = record.get("price_numeric")
+    if price_numeric in (None, "") and price:
+        digits = _PRICE.sub("", price)
+        price_numeric = digits if digits.count(".") <= 1 and digits.strip(".") else None
+    price_numeric = float(price_numeric) if price_numeric not in (None, "") else None
+
+    category = _text(record.get("category"))
+    return (
+        line, sku, brand, slugify(brand), _text(record.get("brand_logo")),
+        category.lower() if category else None, _text(record.get("category_display")),
+        name, _text(record.get("model")), _text(record.get("description")), price, price_numeric,
+        (_text(record.get("currency")) or "USD").upper(), _image_urls(record.get("image_urls")),
+        _text(record.get("thumbnail_url")), _text(record.get("color")), _text(record.get("material")),
+        _text(record.get("dimensions")), _flag(record.get("is_active")), _flag(record.get("is_featured")),
+        _text(record.get("stock_status")),
+    )
+
+def read_records(path: str, fmt: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+    """Stream dicts from a CSV or JSONL file (optionally .gz); "-" reads stdin"""
+    base = path[:-3] if path.endswith(".gz") else path
+    fmt = fmt or ("jsonl" if base.endswith((".jsonl", ".ndjson", ".json")) else "csv")
+    if path == "-":
+        stream = io.TextIOWrapper(sys.stdin.buffer, encoding="utf-8", newline="")
+    elif path.endswith(".gz"):
+        stream = gzip.open(path, "rt", encoding="utf-8", newline="")
+    else:
+        stream = open(path, encoding="utf-8", newline="")
+    with stream:
+        if fmt == "csv":
+            yield from csv.DictReader(stream)
+        else:
+            for text in stream:
+                if text.strip():
+                    yield json.loads(text)
+
+def _chunks(records: Iterable[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def import_records(conn: psycopg.Connection, records: Iterable[Dict[str, Any]], batch_size: int = BATCH_SIZE,
+                   derive_skus: bool = False,
+                   progress: Optional[Callable[[ImportStats], None]] = None) -> ImportStats:
+    """Upsert a stream of feed records, one transaction per chunk"""
+    stats = ImportStats()
+    started = time.perf_counter()
+    conn.execute(CREATE_STAGE)
+    conn.commit()
+
+    copy_sql = f"COPY catalog_stage ({', '.join(STAGE_COLUMNS)}) FROM STDIN"
+    for chunk in _chunks(records, batch_size):
+        rows = []
+        for record in chunk:
+            stats.read += 1
+            try:
+                rows.append(normalize(record, stats.read, derive_skus))
+            except (ValueError, TypeError) as e:
+                stats.rejected += 1
+                logger.debug(f"Row {stats.read} rejected: {e}")
+        if not rows:
+            continue
+
+        params = {"now": datetime.utcnow()}
+        with conn.transaction():
+            with conn.cursor() as cur:
+                with cur.copy(copy_sql) as copy:
+                    for row in rows:
+                        copy.write_row(row)
+                cur.execute(UPSERT_BRANDS, params)
+                cur.execute(UPSERT_CATEGORIES, params)
+                distinct, matched = cur.execute(COUNT_STAGED).fetchone()
+                inserted, updated = cur.execute(UPSERT_PRODUCTS, params).fetchone()
+        stats.inserted += inserted
+        stats.updated += updated
+        stats.unchanged += matched - inserted - updated
+        stats.unmatched += distinct - matched
+        stats.seconds = time.perf_counter() - started
+        if progress:
+            progress(stats)
+
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+def import_file(path: str, fmt: Optional[str] = None, batch_size: int = BATCH_SIZE,
+                derive_skus: bool = False) -> ImportStats:
+    def report(stats: ImportStats):
+        logger.info(f"Imported {stats.summary()}")
+
+    with psycopg.connect(libpq_dsn()) as conn:
+        return import_records(conn, read_records(path, fmt), batch_size, derive_skus, report)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Import a product catalog feed")
+    parser.add_argument("path", help="CSV or JSONL file (.gz ok), or - for stdin")
+    parser.add_argument("--format", choices=["csv", "jsonl"], default=None)
+    parser.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    parser.add_argument("--derive-skus", action="store_true", help="Build skus from brand and name when missing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    stats = import_file(args.path, args.format, args.batch_size, args.derive_skus)
+    print(f"✅ {stats.summary()}")
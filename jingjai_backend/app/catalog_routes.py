@@ -0,0 +1,47 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy.orm import Session
+from typing import Optional
+from .database import get_db
+from .schemas import CatalogChanges
+from .auth_utils import require_admin_key
+from .catalog_export import BATCH_SIZE, MEDIA_TYPES, export_chunks, export_filename
+from .catalog_changes import DEFAULT_LIMIT, MAX_LIMIT, decode_watermark, get_changes
+from .serialization import JSONBytesResponse
+
+router = APIRouter(prefix="/catalog", tags=["catalog"])
+
+@router.get("/export", dependencies=[Depends(require_admin_key)])
+def export_catalog(
+    fmt: str = Query("ndjson", alias="format", pattern="^(ndjson|csv)$", description="ndjson or csv"),
+    compress: bool = Query(False, alias="gzip", description="Compress the stream with gzip"),
+    brand_id: Optional[int] = Query(None, description="Only this brand's products"),
+    include_inactive: bool = Query(False, description="Include inactive products and brands"),
+    batch_size: int = Query(BATCH_SIZE, ge=100, le=20000, description="Rows per database fetch")
+):
+    """Stream every product with its brand and category, in constant memory"""
+    chunks = export_chunks(fmt, compress, brand_id, include_inactive, batch_size)
+    return StreamingResponse(chunks, media_type=MEDIA_TYPES[fmt], headers={
+        "Content-Disposition": f'attachment; filename="{export_filename(fmt, compress)}"',
+    })
+
+@router.get("/changes", response_model=CatalogChanges)
+def get_catalog_changes(
+    since: Optional[str] = Query(None, description="Watermark from the previous response; omit for a full snapshot"),
+    limit: int = Query(DEFAULT_LIMIT, ge=1, le=MAX_LIMIT, description="Maximum number of changes per page"),
+    db: Session = Depends(get_db)
+):
+    """
+    Brands, categories and products changed since a watermark, for local catalog copies.
+
+    Upsert the returned rows, drop the ids under ``removed`` and store the new
+    watermark. Call again straight away while ``has_more`` is true. If
+    ``reset`` is true, clear the local copy first.
+    """
+    watermark = None
+    if since:
+        watermark = decode_watermark(since)
+        if watermark is None:
+            raise HTTPException(status_code=400, detail="Invalid watermark")
+    
+    return JSONBytesResponse(get_changes(db, watermark, limit))
@@ -10,6 +10,10 @@ engine = create_engine(SQLALCHEMY_DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+def libpq_dsn() -> str:
+    """Connection string for direct psycopg connections (LISTEN, COPY)"""
+    return engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+
 def get_db():
     db = SessionLocal()
     try:
@@ -0,0 +1,346 @@
+# app/embeddings.py
+"""
+Image-embedding index over catalog product photos.
+
+Every catalog image (Product.image_urls and thumbnail_url) is embedded into
+a unit-length float32 vector. All vectors are stored as one contiguous
+(N, DIM) matrix, with a parallel array of product ids, so a query is a
+single matrix-vector product: cosine similarity is a dot product of unit
+vectors. np.argpartition then picks the top rows without sorting the rest.
+
+Large catalogs can add a coarse quantizer (IVF). Spherical k-means splits
+the vectors into nlist clusters, and rows are stored grouped by cluster. A
+query then scores the centroids first and scans only the nprobe nearest
+clusters' slices of the matrix.
+
+The index is built offline and saved as a versioned directory of .npy files
+that API processes map read-only. A rebuild switches the CURRENT pointer,
+and processes pick the new version up on their next query.
+
+Build from the jingjai_backend directory:
+    python -m app.embeddings build [--nlist 0]
+"""
+import argparse
+import importlib
+import logging
+import os
+import shutil
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .images import fetch_into_storage
+from .inference import preprocess
+from .storage import UPLOAD_DIR, Storage, content_key, get_storage, key_from_url, sha256_of_key
+from .uploads import record_uploads
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.getenv("PRODUCT_INDEX_DIR", os.path.join(UPLOAD_DIR, "product_index"))
+IVF_MIN_ROWS = 50_000  # Below this an exact scan is already fast enough
+IVF_NPROBE = int(os.getenv("PRODUCT_INDEX_NPROBE", "8"))
+KMEANS_SAMPLE = 100_000
+MIN_SCORE = float(os.getenv("PRODUCT_MATCH_MIN_SCORE", "0.5"))
+
+query_seconds = metrics.histogram(
+    "embeddings.query_seconds", "Product index lookup time",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+indexed_images = metrics.gauge("embeddings.indexed", "Catalog images in the product index")
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+class StubEmbedder:
+    """
+    Color layout plus color histogram of the preprocessed photo.
+
+    An 8x8 grid of mean colors and a 4x4x4 RGB histogram, centered and
+    normalized: 256 dimensions. Stable under re-encoding and resizing, which
+    is enough to match a photo to the catalog shot it came from.
+    """
+    dim = 256
+
+    def embed(self, batch: np.ndarray) -> np.ndarray:
+        """(B, 64, 64, 3) in [-1, 1] -> (B, dim) unit vectors"""
+        count = len(batch)
+        grid = batch.reshape(count, 8, 8, 8, 8, 3).mean(axis=(2, 4)).reshape(count, -1)
+        levels = np.clip(((batch + 1) * 2).astype(np.int64), 0, 3).reshape(count, -1, 3)
+        bins = levels[..., 0] * 16 + levels[..., 1] * 4 + levels[..., 2]
+        bins += np.arange(count)[:, None] * 64
+        histogram = np.bincount(bins.ravel(), minlength=count * 64).reshape(count, 64).astype(np.float32)
+        histogram = np.sqrt(histogram / bins.shape[1])  # Hellinger: dot product of sqrt histograms
+        features = np.hstack([grid, histogram - histogram.mean(axis=1, keepdims=True)])
+        return normalize(features)
+
+def load_embedder(spec: Optional[str] = None):
+    spec = spec or os.getenv("EMBEDDING_MODEL", "stub")
+    if spec == "stub":
+        return StubEmbedder()
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+def kmeans(vectors: np.ndarray, nlist: int, iterations: int = 10, seed: int = 0) -> np.ndarray:
+    """Spherical k-means; returns (nlist, dim) unit centroids"""
+    rng = np.random.default_rng(seed)
+    if len(vectors) > KMEANS_SAMPLE:
+        vectors = vectors[rng.choice(len(vectors), KMEANS_SAMPLE, replace=False)]
+    centroids = np.array(vectors[rng.choice(len(vectors), nlist, replace=False)])
+    for _ in range(iterations):
+        assignments = (vectors @ centroids.T).argmax(axis=1)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = ~sums.any(axis=1)
+        # Reseed empty clusters instead of letting them collapse
+        sums[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+        centroids = normalize(sums)
+    return centroids
+
+def _current_version(directory: str) -> Optional[str]:
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+class ProductEmbeddingIndex:
+    def __init__(self, vectors: np.ndarray, product_ids: np.ndarray,
+                 centroids: Optional[np.ndarray] = None, offsets: Optional[np.ndarray] = None):
+        self.vectors = vectors  # (N, dim) float32, unit rows; grouped by cluster with IVF
+        self.product_ids = product_ids  # (N,) int64
+        self.centroids = centroids  # (nlist, dim) or None for exact search
+        self.offsets = offsets  # (nlist + 1,) row ranges of each cluster
+
+    def __len__(self) -> int:
+        return len(self.product_ids)
+
+    @classmethod
+    def empty(cls, dim: int = StubEmbedder.dim) -> "ProductEmbeddingIndex":
+        return cls(np.zeros((0, dim), dtype=np.float32), np.zeros(0, dtype=np.int64))
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, product_ids: Sequence[int], nlist: Optional[int] = None) -> "ProductEmbeddingIndex":
+        vectors = np.ascontiguousarray(normalize(vectors))
+        product_ids = np.asarray(product_ids, dtype=np.int64)
+        if nlist is None:
+            nlist = int(4 * np.sqrt(len(vectors))) if len(vectors) >= IVF_MIN_ROWS else 0
+        if not nlist:
+            return cls(vectors, product_ids)
+
+        centroids = kmeans(vectors, nlist)
+        assignments = np.concatenate([
+            (vectors[start:start + 65536] @ centroids.T).argmax(axis=1)
+            for start in range(0, len(vectors), 65536)
+        ])
+        order = np.argsort(assignments, kind="stable")
+        offsets = np.zeros(nlist + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(np.bincount(assignments, minlength=nlist))
+        return cls(np.ascontiguousarray(vectors[order]), product_ids[order], centroids, offsets)
+
+    def save(self, directory: str = INDEX_DIR):
+        """Write a new version and switch CURRENT to it; readers never see a mix"""
+        version = f"v{time.time_ns()}"
+        os.makedirs(os.path.join(directory, version))
+        arrays = {"vectors": self.vectors, "product_ids": self.product_ids}
+        if self.centroids is not None:
+            arrays.update(centroids=self.centroids, offsets=self.offsets)
+        for name, array in arrays.items():
+            np.save(os.path.join(directory, version, f"{name}.npy"), array)
+
+        previous = _current_version(directory)
+        tmp_path = os.path.join(directory, f"CURRENT.{os.getpid()}.tmp")
+        with open(tmp_path, "w") as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(directory, "CURRENT"))
+        # Keep the previous version for processes still mapping it
+        for name in os.listdir(directory):
+            if name.startswith("v") and name not in (version, previous):
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    @classmethod
+    def load(cls, directory: str = INDEX_DIR) -> Optional["ProductEmbeddingIndex"]:
+        version = _current_version(directory)
+        if version is None:
+            return None
+        path = os.path.join(directory, version)
+        vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        product_ids = np.load(os.path.join(path, "product_ids.npy"))
+        centroids = offsets = None
+        if os.path.exists(os.path.join(path, "centroids.npy")):
+            centroids = np.load(os.path.join(path, "centroids.npy"))
+            offsets = np.load(os.path.join(path, "offsets.npy"))
+        return cls(vectors, product_ids, centroids, offsets)
+
+    def _rows(self, queries: np.ndarray, nprobe: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Best score of any query photo per candidate row, and the rows' product ids"""
+        if self.centroids is None:
+            return (queries @ self.vectors.T).max(axis=0), self.product_ids
+        # Probe the clusters nearest to any of the query photos
+        centroid_scores = (queries @ self.centroids.T).max(axis=0)
+        nprobe = min(nprobe, len(self.centroids))
+        probes = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+        scores, ids = [], []
+        for cluster in probes:
+            start, end = self.offsets[cluster], self.offsets[cluster + 1]
+            if end > start:
+                scores.append((queries @ self.vectors[start:end].T).max(axis=0))
+                ids.append(self.product_ids[start:end])
+        if not scores:
+            return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+        return np.concatenate(scores), np.concatenate(ids)
+
+    def search(self, queries: np.ndarray, k: int = 5, nprobe: int = IVF_NPROBE) -> List[Tuple[int, float]]:
+        """Top-k (product_id, cosine) for one or more photos of the same item"""
+        if not len(self):
+            return []
+        queries = normalize(np.atleast_2d(queries))
+        scores, ids = self._rows(queries, nprobe)
+        if not len(scores):
+            return []
+        # Products have several images; over-fetch rows, then keep each product's best
+        take = min(len(scores), k * 8)
+        top = np.argpartition(-scores, take - 1)[:take]
+        top = top[np.argsort(-scores[top])]
+        results: Dict[int, float] = {}
+        for row in top:
+            product_id = int(ids[row])
+            if product_id not in results:
+                results[product_id] = float(scores[row])
+                if len(results) == k:
+                    break
+        return list(results.items())
+
+_embedder = None
+_index = ProductEmbeddingIndex.empty()
+_index_version: Optional[str] = None
+_index_lock = threading.Lock()
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        _embedder = load_embedder()
+    return _embedder
+
+def get_product_index() -> ProductEmbeddingIndex:
+    """The saved index, reloaded whenever a rebuild replaced it"""
+    global _index, _index_version
+    version = _current_version(INDEX_DIR)
+    if version is not None and version != _index_version:
+        with _index_lock:
+            if version != _index_version:
+                try:
+                    _index = ProductEmbeddingIndex.load(INDEX_DIR) or _index
+                    _index_version = version
+                    indexed_images.set(len(_index))
+                except Exception as e:
+                    logger.warning(f"Could not load product index: {e}")
+    return _index
+
+def _image_source(storage: Storage, key: str):
+    # Any variant embeds the same; the thumbnail decodes fastest
+    thumb = content_key(sha256_of_key(key), "jpg", variant="thumb")
+    if storage.exists(thumb):
+        key = thumb
+    return storage.local_path(key) or storage.read_bytes(key)
+
+def embed_photos(storage: Storage, keys: Sequence[str]) -> np.ndarray:
+    return get_embedder().embed(np.stack([preprocess(_image_source(storage, key)) for key in keys]))
+
+def suggest_products(storage: Storage, photo_keys: Sequence[str], k: int = 5,
+                     min_score: float = MIN_SCORE) -> List[Tuple[int, float]]:
+    """Catalog products that look like the given photos, best first"""
+    index = get_product_index()
+    if not photo_keys or not len(index):
+        return []
+    queries = embed_photos(storage, photo_keys)
+    started = time.perf_counter()
+    matches = index.search(queries, k)
+    query_seconds.observe(time.perf_counter() - started)
+    return [(product_id, round(score, 4)) for product_id, score in matches if score >= min_score]
+
+def build_product_index(db: Session, storage: Storage, nlist: Optional[int] = None,
+                        batch_size: int = 256) -> ProductEmbeddingIndex:
+    """Embed every image of every active product"""
+    embedder = get_embedder()
+    vectors, product_ids = [], []
+    pending_keys, pending_ids = [], []
+    failed = 0
+
+    def flush():
+        nonlocal failed
+        tensors, ids = [], []
+        for key, product_id in zip(pending_keys, pending_ids):
+            try:
+                tensors.append(preprocess(_image_source(storage, key)))
+                ids.append(product_id)
+            except Exception as e:
+                failed += 1
+                logger.warning(f"Product {product_id}: could not decode {key}: {e}")
+        if tensors:
+            vectors.append(embedder.embed(np.stack(tensors)))
+            product_ids.extend(ids)
+        pending_keys.clear()
+        pending_ids.clear()
+
+    after_id = 0
+    while True:
+        products = db.query(models.Product.id, models.Product.image_urls, models.Product.thumbnail_url).filter(
+            models.Product.id > after_id,
+            models.Product.is_active == True
+        ).order_by(models.Product.id).limit(1000).all()
+        if not products:
+            break
+        after_id = products[-1].id
+
+        for product in products:
+            keys = set()
+            for url in (product.image_urls or []) + ([product.thumbnail_url] if product.thumbnail_url else []):
+                try:
+                    key = key_from_url(url)
+                    if key is None:
+                        stored = fetch_into_storage(storage, url)
+                        record_uploads(db, None, [stored])
+                        key = stored.key
+                    keys.add(key)
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"Product {product.id}: could not fetch {url}: {e}")
+            # The thumbnail is a variant of the first image; embed each original once
+            by_sha = {sha256_of_key(key): key for key in sorted(keys)}
+            for key in by_sha.values():
+                pending_keys.append(key)
+                pending_ids.append(product.id)
+                if len(pending_keys) >= batch_size:
+                    flush()
+        db.commit()
+        logger.info(f"Embedded {len(product_ids)} images, {failed} failed, last product {after_id}")
+    flush()
+
+    if not vectors:
+        return ProductEmbeddingIndex.empty(embedder.dim)
+    return ProductEmbeddingIndex.build(np.vstack(vectors), product_ids, nlist)
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Product image index maintenance")
+    parser.add_argument("command", choices=["build"])
+    parser.add_argument("--nlist", type=int, default=None, help="IVF clusters (0 = exact search)")
+    parser.add_argument("--dir", default=INDEX_DIR)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        index = build_product_index(db, get_storage(), args.nlist)
+        index.save(args.dir)
+        clusters = f", {len(index.centroids)} clusters" if index.centroids is not None else ""
+        print(f"✅ {len(index)} images of {len(set(index.product_ids.tolist()))} products indexed{clusters}")
+    finally:
+        db.close()
@@ -0,0 +1,126 @@
+# app/favorites.py
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy.orm import Session
+
+from . import models
+
+class FavoritesCache:
+    """
+    Per-user favorite product ids, kept in-process as sorted compact arrays.
+
+    Each cached user costs 4 bytes per favorite. Membership is a binary search
+    over the array, so annotating a page of products never touches the DB once
+    the user's set is loaded. Entries expire after ``ttl_seconds`` so changes
+    made by other worker processes are picked up.
+
+    Arrays handed out by get() are never modified: add/discard build a new
+    array and swap it in, so readers can search one without the lock.
+    """
+
+    def __init__(self, max_users: int = 10000, ttl_seconds: float = 60.0):
+        self.max_users = max_users
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        # In-flight DB loads per user, and users written to while one ran
+        self._loading: Dict[int, int] = {}
+        self._written: Set[int] = set()
+        self._lock = threading.Lock()
+
+    def _load(self, db: Session, user_id: int) -> array:
+        rows = db.query(models.Favorite.product_id).filter(
+            models.Favorite.user_id == user_id
+        ).order_by(models.Favorite.product_id).all()
+        return array("I", (row.product_id for row in rows))
+
+    def get(self, db: Session, user_id: int) -> array:
+        """Return the sorted product id array for a user, loading it on a miss"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(user_id)
+                return entry[1]
+            self._loading[user_id] = self._loading.get(user_id, 0) + 1
+
+        ids = None
+        try:
+            ids = self._load(db, user_id)
+        finally:
+            with self._lock:
+                # An add/discard that landed mid-load may be missing from ids; leave it to the next call
+                if ids is not None and user_id not in self._written:
+                    self._entries[user_id] = (now + self.ttl_seconds, ids)
+                    self._entries.move_to_end(user_id)
+                    while len(self._entries) > self.max_users:
+                        self._entries.popitem(last=False)
+                self._loading[user_id] -= 1
+                if not self._loading[user_id]:
+                    del self._loading[user_id]
+                    self._written.discard(user_id)
+        return ids
+
+    def contains_many(self, db: Session, user_id: int, product_ids: Iterable[int]) -> Dict[int, bool]:
+        """Check membership for a batch of product ids with a single cache lookup"""
+        ids = self.get(db, user_id)
+        size = len(ids)
+        result = {}
+        for product_id in product_ids:
+            index = bisect_left(ids, product_id)
+            result[product_id] = index < size and ids[index] == product_id
+        return result
+
+    def _mark_written(self, user_id: int):
+        # Caller holds the lock
+        if user_id in self._loading:
+            self._written.add(user_id)
+
+    def add(self, user_id: int, product_id: int):
+        """Record a new favorite in the cached set, if the user is cached"""
+        with self._lock:
+            self._mark_written(user_id)
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            ids = entry[1]
+            index = bisect_left(ids, product_id)
+            if index == len(ids) or ids[index] != product_id:
+                ids = array("I", ids)
+                ids.insert(index, product_id)
+                self._entries[user_id] = (entry[0], ids)
+
+    def discard(self, user_id: int, product_id: int):
+        """Drop a favorite from the cached set, if the user is cached"""
+        with self._lock:
+            self._mark_written(user_id)
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return
+            ids = entry[1]
+            index = bisect_left(ids, product_id)
+            if index < len(ids) and ids[index] == product_id:
+                ids = array("I", ids)
+                del ids[index]
+                self._entries[user_id] = (entry[0], ids)
+
+    def invalidate(self, user_id: int):
+        with self._lock:
+            self._mark_written(user_id)
+            self._entries.pop(user_id, None)
+
+favorites_cache = FavoritesCache()
+
+def annotate_favorites(db: Session, user: Optional[models.User], products: List) -> List:
+    """Set ``is_favorited`` on product response objects for the current user"""
+    if user is None or not products:
+        return products
+
+    flags = favorites_cache.contains_many(db, user.id, (product.id for product in products))
+    for product in products:
+        product.is_favorited = flags[product.id]
+    return products
@@ -0,0 +1,132 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from sqlalchemy import desc
+from sqlalchemy.dialects.postgresql import insert
+from typing import Optional
+import logging
+
+from .database import get_db
+from .models import User, Product, Favorite
+from .schemas import (
+    ProductsResponse,
+    FavoriteStatus,
+    FavoriteCheckResponse
+)
+from .auth_utils import get_current_user
+from .favorites import favorites_cache
+
+router = APIRouter(prefix="/favorites", tags=["favorites"])
+logger = logging.getLogger(__name__)
+
+MAX_CHECK_IDS = 200
+
+@router.get("/", response_model=ProductsResponse)
+def list_favorites(
+    limit: Optional[int] = Query(50, ge=1, le=100, description="Limit number of results"),
+    offset: Optional[int] = Query(0, ge=0, description="Offset for pagination"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """List the current user's favorite products, most recently added first"""
+
+    products = db.query(Product).join(
+        Favorite, Favorite.product_id == Product.id
+    ).filter(
+        Favorite.user_id == current_user.id
+    ).order_by(desc(Favorite.created_at)).offset(offset).limit(limit).all()
+
+    response = ProductsResponse(
+        products=products,
+        total=current_user.favorites_count or 0
+    )
+    for product in response.products:
+        product.is_favorited = True
+
+    return response
+
+@router.get("/check", response_model=FavoriteCheckResponse)
+def check_favorites(
+    product_ids: str = Query(..., description="Comma-separated product IDs"),
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Check which of the given products the current user has favorited"""
+
+    try:
+        ids = [int(value) for value in product_ids.split(",") if value.strip()]
+    except ValueError:
+        raise HTTPException(status_code=400, detail="product_ids must be integers")
+
+    if len(ids) > MAX_CHECK_IDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_CHECK_IDS} product IDs can be checked at once"
+        )
+
+    return FavoriteCheckResponse(
+        favorites=favorites_cache.contains_many(db, current_user.id, ids)
+    )
+
+@router.post("/{product_id}", response_model=FavoriteStatus)
+def add_favorite(
+    product_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Add a product to the current user's favorites (idempotent)"""
+
+    if not db.query(Product.id).filter(Product.id == product_id).first():
+        raise HTTPException(status_code=404, detail="Product not found")
+
+    try:
+        result = db.execute(
+            insert(Favorite)
+            .values(user_id=current_user.id, product_id=product_id)
+            .on_conflict_do_nothing(index_elements=["user_id", "product_id"])
+        )
+        if result.rowcount:
+            current_user.favorites_count = User.favorites_count + 1
+        db.commit()
+        db.refresh(current_user)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to add favorite: {e}")
+        raise HTTPException(status_code=500, detail="Failed to add favorite")
+
+    favorites_cache.add(current_user.id, product_id)
+
+    return FavoriteStatus(
+        product_id=product_id,
+        is_favorited=True,
+        favorites_count=current_user.favorites_count
+    )
+
+@router.delete("/{product_id}", response_model=FavoriteStatus)
+def remove_favorite(
+    product_id: int,
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """Remove a product from the current user's favorites (idempotent)"""
+
+    try:
+        deleted = db.query(Favorite).filter(
+            Favorite.user_id == current_user.id,
+            Favorite.product_id == product_id
+        ).delete(synchronize_session=False)
+        if deleted:
+            current_user.favorites_count = User.favorites_count - 1
+        db.commit()
+        db.refresh(current_user)
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to remove favorite: {e}")
+        raise HTTPException(status_code=500, detail="Failed to remove favorite")
+
+    favorites_cache.discard(current_user.id, product_id)
+
+    return FavoriteStatus(
+        product_id=product_id,
+        is_favorited=False,
+        favorites_count=current_user.favorites_count
+    )
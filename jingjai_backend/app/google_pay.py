@@ -1,198 +1,306 @@
-import json
+import os
+import random
+import threading
+import time
 import requests
-from typing import Dict, Optional
-from pathlib import Path
+from collections import OrderedDict
+from requests.adapters import HTTPAdapter
+from typing import Dict, Iterable, List, Optional
+from google.auth import jwt as google_jwt
 from google.auth.transport.requests import Request
 from google.oauth2 import service_account
 import logging
 
+from .ids import new_id
+
 logger = logging.getLogger(__name__)
 
+WALLET_SCOPES = ['https://www.googleapis.com/auth/wallet_object.issuer']
+WALLET_BASE_URL = 'https://walletobjects.googleapis.com/walletobjects/v1'
+
+# Status codes worth retrying: rate limiting and transient server errors
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+SAVE_URL_PREFIX = 'https://pay.google.com/gp/v/save/'
+# Origins allowed to show the save button, e.g. "https://jingjai.app,https://www.jingjai.app"
+WALLET_ORIGINS = [origin.strip() for origin in os.getenv("GOOGLE_WALLET_ORIGINS", "").split(",") if origin.strip()]
+SAVE_URL_TTL_SECONDS = 3600
+
+class _SaveUrlCache:
+    """Bounded LRU of signed save URLs keyed by the exact object set"""
+
+    def __init__(self, max_entries: int = 50000, ttl_seconds: float = SAVE_URL_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[tuple, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def put(self, key: tuple, url: str):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, url)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+class GoogleWalletError(Exception):
+    """Raised when the Wallet API returns a non-retryable error or retries run out"""
+
+    def __init__(self, message: str, status_code: Optional[int] = None, body: Optional[str] = None):
+        super().__init__(message)
+        self.status_code = status_code
+        self.body = body
+
 class GooglePayService:
-    def __init__(self, service_account_file: str, issuer_id: str):
+    """
+    Google Wallet Objects API client.
+
+    One instance is meant to be shared: all calls go through a single
+    keep-alive requests.Session, the OAuth token is refreshed by one thread at
+    a time (others wait and reuse it), and 429/5xx responses are retried with
+    jittered exponential backoff.
+    """
+
+    def __init__(
+        self,
+        service_account_file: Optional[str],
+        issuer_id: str,
+        base_url: str = WALLET_BASE_URL,
+        credentials=None,
+        max_retries: int = 4,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        timeout: float = 10.0,
+        pool_size: int = 32,
+        signer=None,
+        service_account_email: Optional[str] = None,
+        origins: Optional[List[str]] = None
+    ):
         self.service_account_file = service_account_file
         self.issuer_id = issuer_id
-        self.base_url = 'https://walletobjects.googleapis.com/walletobjects/v1'
-        self.credentials = None
-        self._authenticate()
-    
+        self.base_url = base_url.rstrip('/')
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.timeout = timeout
+        self.credentials = credentials
+        self._token_lock = threading.Lock()
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'Content-Type': 'application/json'})
+
+        if self.credentials is None:
+            self._authenticate()
+
+        # The RSA key is parsed once with the credentials and reused for every
+        # save JWT; callers may inject their own signer (tests, benchmarks).
+        self.signer = signer or getattr(self.credentials, 'signer', None)
+        self.service_account_email = (
+            service_account_email or getattr(self.credentials, 'service_account_email', None)
+        )
+        self.origins = origins if origins is not None else WALLET_ORIGINS
+        self._save_urls = _SaveUrlCache()
+
     def _authenticate(self):
-        """Authenticate with Google Pay API using service account"""
+        """Load service account credentials for the Wallet API"""
         try:
-            # Debug output
-            print(f"Debug - Service account file: {self.service_account_file}")
-            print(f"Debug - Issuer ID: {self.issuer_id}")
-            print(f"Debug - File exists: {Path(self.service_account_file).exists()}")
-            
-            scopes = ['https://www.googleapis.com/auth/wallet_object.issuer']
             self.credentials = service_account.Credentials.from_service_account_file(
-                self.service_account_file, scopes=scopes
+                self.service_account_file, scopes=WALLET_SCOPES
+            )
+            logger.info(
+                "Loaded Google Wallet service account",
+                extra={"client_email": self.credentials.service_account_email, "issuer_id": self.issuer_id}
             )
-            
-            # Verify the service account details
-            with open(self.service_account_file, 'r') as f:
-                sa_data = json.load(f)
-                print(f"Debug - Project ID: {sa_data.get('project_id')}")
-                print(f"Debug - Client Email: {sa_data.get('client_email')}")
-                print(f"Debug - Auth URI: {sa_data.get('auth_uri')}")
-                print(f"Debug - Token URI: {sa_data.get('token_uri')}")
-            
         except Exception as e:
-            logger.error(f"Authentication failed: {e}")
-            print(f"Debug - Authentication error: {e}")
+            logger.error(f"Google Wallet authentication failed: {e}")
             raise
-    
+
     def _get_access_token(self) -> str:
-        """Get access token for API requests"""
-        try:
-            if self.credentials.expired or not self.credentials.token:
-                print("Debug - Refreshing token...")
-                self.credentials.refresh(Request())
-                print(f"Debug - Token refreshed successfully")
-                print(f"Debug - Token (first 50 chars): {self.credentials.token[:50]}...")
-            
-            return self.credentials.token
-        except Exception as e:
-            print(f"Debug - Token refresh error: {e}")
-            raise
-    
+        """Return a valid access token, refreshing it at most once concurrently"""
+        credentials = self.credentials
+        if credentials.token and not credentials.expired:
+            return credentials.token
+
+        with self._token_lock:
+            # Another thread may have refreshed while we waited for the lock
+            if credentials.token and not credentials.expired:
+                return credentials.token
+            started = time.perf_counter()
+            credentials.refresh(Request(session=self.session))
+            logger.debug(
+                "Refreshed Google Wallet access token",
+                extra={"duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+            )
+            return credentials.token
+
+    def _backoff(self, attempt: int, retry_after: Optional[str] = None) -> float:
+        if retry_after:
+            try:
+                return min(self.backoff_max, float(retry_after))
+            except ValueError:
+                pass
+        # Full jitter: uniform over [0, base * 2^attempt], capped
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def _request(self, method: str, path: str, json_body: Optional[Dict] = None) -> Dict:
+        """Send one Wallet API call with retries on 429/5xx and connection errors"""
+        url = f'{self.base_url}/{path}'
+
+        for attempt in range(self.max_retries + 1):
+            started = time.perf_counter()
+            try:
+                response = self.session.request(
+                    method,
+                    url,
+                    json=json_body,
+                    headers={'Authorization': f'Bearer {self._get_access_token()}'},
+                    timeout=self.timeout
+                )
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    logger.error("Wallet API request failed", extra={"method": method, "path": path, "error": str(e)})
+                    raise GoogleWalletError(f"{method} {path} failed: {e}") from e
+                delay = self._backoff(attempt)
+                logger.warning(
+                    "Wallet API connection error, retrying",
+                    extra={"method": method, "path": path, "attempt": attempt + 1, "delay_s": round(delay, 3)}
+                )
+                time.sleep(delay)
+                continue
+
+            elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+            logger.debug(
+                "Wallet API response",
+                extra={"method": method, "path": path, "status": response.status_code, "duration_ms": elapsed_ms}
+            )
+
+            if response.status_code == 401 and attempt < self.max_retries:
+                # Token revoked or clock skew; force a refresh and try again
+                with self._token_lock:
+                    self.credentials.token = None
+                continue
+
+            if response.status_code in RETRYABLE_STATUS and attempt < self.max_retries:
+                delay = self._backoff(attempt, response.headers.get('Retry-After'))
+                logger.warning(
+                    "Wallet API returned retryable status",
+                    extra={"method": method, "path": path, "status": response.status_code,
+                           "attempt": attempt + 1, "delay_s": round(delay, 3)}
+                )
+                time.sleep(delay)
+                continue
+
+            if response.status_code >= 400:
+                logger.error(
+                    "Wallet API error",
+                    extra={"method": method, "path": path, "status": response.status_code}
+                )
+                raise GoogleWalletError(
+                    f"{method} {path} returned {response.status_code}",
+                    status_code=response.status_code,
+                    body=response.text
+                )
+
+            return response.json() if response.content else {}
+
+        raise GoogleWalletError(f"{method} {path} failed after {self.max_retries} retries")
+
+    def new_object_id(self, prefix: str = "pass") -> str:
+        """Generate a unique Wallet object ID in the required ``issuerId.suffix`` form"""
+        return f"{self.issuer_id}.{new_id(prefix)}"
+
     def create_loyalty_class(self, class_data: Dict) -> Dict:
         """Create a loyalty card class"""
-        headers = {
-            'Authorization': f'Bearer {self._get_access_token()}',
-            'Content-Type': 'application/json'
-        }
-        
-        url = f'{self.base_url}/loyaltyClass'
-        
-        # Debug output
-        print(f"Making request to: {url}")
-        print(f"Headers: {json.dumps(headers, indent=2)}")
-        print(f"Data: {json.dumps(class_data, indent=2)}")
-        
-        try:
-            response = requests.post(url, headers=headers, json=class_data)
-            
-            # Detailed debug output
-            print(f"Response status: {response.status_code}")
-            print(f"Response headers: {dict(response.headers)}")
-            print(f"Response text: {response.text}")
-            
-            if response.status_code == 401:
-                print("❌ 401 Unauthorized Error!")
-                print("This usually means:")
-                print("1. Invalid service account credentials")
-                print("2. Missing or wrong scopes")
-                print("3. Service account doesn't have proper permissions")
-                print("4. Google Wallet API not enabled")
-                
-                # Try to parse error details
-                try:
-                    error_data = response.json()
-                    print(f"Error details: {json.dumps(error_data, indent=2)}")
-                except:
-                    pass
-            
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-            logger.error(f"Failed to create loyalty class: {e}")
-            raise
-    
+        return self._request('POST', 'loyaltyClass', class_data)
+
     def create_loyalty_object(self, object_data: Dict) -> Dict:
         """Create a loyalty card object for a specific user"""
-        headers = {
-            'Authorization': f'Bearer {self._get_access_token()}',
-            'Content-Type': 'application/json'
-        }
-        
-        url = f'{self.base_url}/loyaltyObject'
-        
-        # Debug output
-        print(f"Making request to: {url}")
-        print(f"Headers: {json.dumps(headers, indent=2)}")
-        print(f"Data: {json.dumps(object_data, indent=2)}")
-        
-        try:
-            response = requests.post(url, headers=headers, json=object_data)
-            
-            # Detailed debug output
-            print(f"Response status: {response.status_code}")
-            print(f"Response headers: {dict(response.headers)}")
-            print(f"Response text: {response.text}")
-            
-            if response.status_code == 401:
-                print("❌ 401 Unauthorized Error!")
-                print("This usually means:")
-                print("1. Invalid service account credentials")
-                print("2. Missing or wrong scopes")
-                print("3. Service account doesn't have proper permissions")
-                print("4. Google Wallet API not enabled")
-                
-                # Try to parse error details
-                try:
-                    error_data = response.json()
-                    print(f"Error details: {json.dumps(error_data, indent=2)}")
-                except:
-                    pass
-            
-            response.raise_for_status()
-            return response.json()
-            
-        except requests.exceptions.RequestException as e:
-            print(f"Request failed: {e}")
-            logger.error(f"Failed to create loyalty object: {e}")
-            raise
-    
+        return self._request('POST', 'loyaltyObject', object_data)
+
+    def patch_loyalty_object(self, object_id: str, patch_data: Dict) -> Dict:
+        """Update fields (e.g. loyaltyPoints) on an existing loyalty object"""
+        return self._request('PATCH', f'loyaltyObject/{object_id}', patch_data)
+
+    def get_loyalty_object(self, object_id: str) -> Dict:
+        return self._request('GET', f'loyaltyObject/{object_id}')
+
     def create_generic_class(self, class_data: Dict) -> Dict:
         """Create a generic pass class"""
-        headers = {
-            'Authorization': f'Bearer {self._get_access_token()}',
-            'Content-Type': 'application/json'
-        }
-        
-        url = f'{self.base_url}/genericClass'
-        
-        try:
-            response = requests.post(url, headers=headers, json=class_data)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to create generic class: {e}")
-            raise
-    
+        return self._request('POST', 'genericClass', class_data)
+
     def create_generic_object(self, object_data: Dict) -> Dict:
         """Create a generic pass object"""
-        headers = {
-            'Authorization': f'Bearer {self._get_access_token()}',
-            'Content-Type': 'application/json'
-        }
-        
-        url = f'{self.base_url}/genericObject'
-        
-        try:
-            response = requests.post(url, headers=headers, json=object_data)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to create generic object: {e}")
-            raise
-    
-    def generate_add_to_wallet_url(self, object_id: str, object_type: str = 'loyaltyObject') -> str:
-        """Generate URL to add pass to Google Wallet"""
-        payload = {
+        return self._request('POST', 'genericObject', object_data)
+
+    def patch_generic_object(self, object_id: str, patch_data: Dict) -> Dict:
+        return self._request('PATCH', f'genericObject/{object_id}', patch_data)
+
+    def close(self):
+        self.session.close()
+
+    def generate_save_url(
+        self,
+        loyalty_object_ids: Iterable[str] = (),
+        generic_object_ids: Iterable[str] = ()
+    ) -> str:
+        """
+        Build a signed "Add to Google Wallet" URL for one or more existing objects
+
+        All objects go into a single RS256 save JWT so the user can add them in
+        one tap. URLs are cached per object set for SAVE_URL_TTL_SECONDS.
+        """
+        loyalty_ids = tuple(sorted(set(loyalty_object_ids)))
+        generic_ids = tuple(sorted(set(generic_object_ids)))
+        if not loyalty_ids and not generic_ids:
+            raise ValueError("At least one object id is required")
+
+        cache_key = (loyalty_ids, generic_ids)
+        cached = self._save_urls.get(cache_key)
+        if cached is not None:
+            return cached
+
+        if self.signer is None or not self.service_account_email:
+            raise GoogleWalletError("No service account signer is configured for save URLs")
+
+        objects = {}
+        if loyalty_ids:
+            objects["loyaltyObjects"] = [{"id": object_id} for object_id in loyalty_ids]
+        if generic_ids:
+            objects["genericObjects"] = [{"id": object_id} for object_id in generic_ids]
+
+        claims = {
+            "iss": self.service_account_email,
             "aud": "google",
-            "origins": ["www.example.com"],  # Replace with your domain
             "typ": "savetowallet",
-            "payload": {
-                object_type + "s": [{"id": object_id}]
-            }
+            "iat": int(time.time()),
+            "origins": self.origins,
+            "payload": objects,
         }
-        
-        # In production, you should sign this JWT with your private key
-        # For now, this is a placeholder
-        token = json.dumps(payload)  # This should be a proper JWT
-        
-        return f"https://pay.google.com/gp/v/save/{token}"
\ No newline at end of file
+        token = google_jwt.encode(self.signer, claims)
+        if isinstance(token, bytes):
+            token = token.decode()
+
+        url = f"{SAVE_URL_PREFIX}{token}"
+        self._save_urls.put(cache_key, url)
+        return url
+
+    def generate_add_to_wallet_url(self, object_id: str, object_type: str = 'loyaltyObject') -> str:
+        """Generate URL to add pass to Google Wallet"""
+        if object_type == 'loyaltyObject':
+            return self.generate_save_url(loyalty_object_ids=[object_id])
+        if object_type == 'genericObject':
+            return self.generate_save_url(generic_object_ids=[object_id])
+        raise ValueError(f"Unsupported object type: {object_type}")
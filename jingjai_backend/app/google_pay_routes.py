@@ -1,5 +1,5 @@
-# app/google_pay_payments.py
-from fastapi import APIRouter, HTTPException, Depends, status
+# app/google_pay_routes.py
+from fastapi import APIRouter, HTTPException, Depends, Header, status
 from sqlalchemy.orm import Session
 from pydantic import BaseModel, Field
 from typing import Dict, Optional, List
@@ -12,16 +12,25 @@ from datetime import datetime
 
 from .database import get_db
 from . import models
+from .ids import new_id
+from .idempotency import run_idempotent
+from .payment_gateways import PaymentGateway, GatewayError, get_gateway
+from .revenue import record_payment, record_refund, refunded_total
+from .outbox import enqueue_event
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/payments", tags=["payments"])
 
+PAYMENT_SCOPE = "payments.google_pay"
+REFUND_SCOPE = "payments.refund"
+
 # Pydantic models for Google Pay
 class PaymentMethodData(BaseModel):
     type: str
     description: str
     info: Dict
+    tokenizationData: Optional[Dict] = None  # {"type": ..., "token": ...}
 
 class PaymentData(BaseModel):
     apiVersionMinor: int
@@ -45,12 +54,11 @@ class PaymentResponse(BaseModel):
     currency: str
 
 class GooglePayService:
-    def __init__(self, merchant_id: str, merchant_name: str, gateway_merchant_id: str = None):
+    def __init__(self, merchant_id: str, merchant_name: str):
         self.merchant_id = merchant_id
         self.merchant_name = merchant_name
-        self.gateway_merchant_id = gateway_merchant_id or merchant_id
         
-    def create_payment_request(self, amount: float, currency: str = "USD") -> Dict:
+    def create_payment_request(self, gateway: PaymentGateway, amount: float, currency: str = "USD") -> Dict:
         """
         Create a Google Pay payment request configuration
         This returns the client-side configuration for Google Pay
@@ -67,10 +75,7 @@ class GooglePayService:
                     },
                     "tokenizationSpecification": {
                         "type": "PAYMENT_GATEWAY",
-                        "parameters": {
-                            "gateway": "example",  # Replace with your payment gateway
-                            "gatewayMerchantId": self.gateway_merchant_id
-                        }
+                        "parameters": gateway.tokenization_parameters()
                     }
                 }
             ],
@@ -112,17 +117,19 @@ google_pay_service = GooglePayService(
 )
 
 @router.get("/google-pay/config")
-async def get_google_pay_config():
+async def get_google_pay_config(gateway: PaymentGateway = Depends(get_gateway)):
     """
     Get Google Pay configuration for frontend
     """
     try:
         config = google_pay_service.create_payment_request(
+            gateway,
             amount=1.0,  # This will be dynamic based on the actual order
             currency="USD"
         )
         return {
             "success": True,
+            "gateway": gateway.name,
             "config": config
         }
     except Exception as e:
@@ -135,11 +142,60 @@ async def get_google_pay_config():
 @router.post("/google-pay/payment", response_model=PaymentResponse)
 async def process_google_pay_payment(
     payment_request: PaymentRequest,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    gateway: PaymentGateway = Depends(get_gateway),
     db: Session = Depends(get_db)
 ):
     """
     Process a Google Pay payment
+    
+    Retries carrying the same Idempotency-Key replay the first response.
+    """
+    return await run_idempotent(
+        db,
+        idempotency_key,
+        scope=PAYMENT_SCOPE,
+        payload=payment_request,
+        handler=lambda: _process_google_pay_payment(payment_request, gateway, db, idempotency_key)
+    )
+
+def payment_transaction_id(idempotency_key: Optional[str]) -> str:
     """
+    Our payment id, which is also the gateway's idempotency key.
+
+    With an Idempotency-Key it is derived from the key, so a retry after a
+    gateway timeout (502, which releases the key) reaches the gateway under
+    the same key and gets the first charge back instead of a second one.
+    """
+    return _keyed_id("txn", PAYMENT_SCOPE, idempotency_key)
+
+def refund_request_id(idempotency_key: Optional[str]) -> str:
+    """Our refund id and the gateway's idempotency key, derived like payment_transaction_id"""
+    return _keyed_id("rfnd", REFUND_SCOPE, idempotency_key)
+
+def _keyed_id(prefix: str, scope: str, idempotency_key: Optional[str]) -> str:
+    if not idempotency_key:
+        return new_id(prefix)
+    digest = hashlib.sha256(f"{scope}:{idempotency_key}".encode()).hexdigest()
+    return f"{prefix}_{digest[:32]}"
+
+def _payment_response(payment: models.Payment) -> PaymentResponse:
+    success = payment.status == "completed"
+    return PaymentResponse(
+        success=success,
+        transaction_id=payment.transaction_id,
+        status=payment.status,
+        message="Payment processed successfully" if success else "Payment failed",
+        amount=payment.amount,
+        currency=payment.currency
+    )
+
+async def _process_google_pay_payment(
+    payment_request: PaymentRequest,
+    gateway: PaymentGateway,
+    db: Session,
+    idempotency_key: Optional[str] = None
+) -> PaymentResponse:
     try:
         # Verify user exists
         user = db.query(models.User).filter(models.User.id == payment_request.user_id).first()
@@ -147,50 +203,76 @@ async def process_google_pay_payment(
             raise HTTPException(status_code=404, detail="User not found")
         
         # Extract payment token from Google Pay response
-        payment_method_data = payment_request.payment_data.paymentMethodData
+        tokenization_data = payment_request.payment_data.paymentMethodData.tokenizationData or {}
+        payment_token = tokenization_data.get("token")
+        if not payment_token:
+            raise HTTPException(status_code=400, detail="Payment token not found in payment data")
         
-        # In a real implementation, you would:
-        # 1. Decrypt the payment token
-        # 2. Extract card details
-        # 3. Process with your payment gateway (Stripe, Square, etc.)
-        # 4. Handle 3DS authentication if required
+        transaction_id = payment_transaction_id(idempotency_key)
+        # Rollups are keyed by currency code; "usd" and "USD" must land in one row
+        currency = payment_request.currency.upper()
         
-        # For demo purposes, we'll simulate a successful payment
-        transaction_id = f"txn_{payment_request.order_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
+        # Recorded by an earlier attempt whose stored response was lost
+        existing = db.query(models.Payment).filter(models.Payment.transaction_id == transaction_id).first()
+        if existing:
+            return _payment_response(existing)
         
-        # Here you would typically integrate with your payment processor
-        # payment_result = process_with_payment_gateway(payment_method_data, payment_request.amount)
+        try:
+            result = await gateway.charge(
+                payment_token,
+                payment_request.amount,
+                currency,
+                transaction_id
+            )
+        except GatewayError as e:
+            logger.error(f"Payment gateway error for {transaction_id}: {e}")
+            raise HTTPException(status_code=502, detail="Payment gateway unavailable")
+        
+        payment_status = "completed" if result.success else "failed"
         
         # Create payment record in database
         payment_record = models.Payment(
             user_id=payment_request.user_id,
             transaction_id=transaction_id,
             amount=payment_request.amount,
-            currency=payment_request.currency,
+            currency=currency,
             order_id=payment_request.order_id,
-            payment_method="google_pay",
-            status="completed",
+            payment_method=f"google_pay_{gateway.name}",
+            status=payment_status,
             description=payment_request.description,
+            gateway_reference=result.reference,
             created_at=datetime.utcnow()
         )
         
         db.add(payment_record)
+        if result.success:
+            record_payment(db, payment_record)
+        enqueue_event(db, f"payment.{payment_status}", "payment", transaction_id, {
+            "transaction_id": transaction_id,
+            "order_id": payment_request.order_id,
+            "user_id": payment_request.user_id,
+            "amount": payment_request.amount,
+            "currency": currency,
+            "status": payment_status,
+            "payment_method": payment_record.payment_method,
+        })
         db.commit()
         
-        logger.info(f"Google Pay payment processed: {transaction_id}")
+        logger.info(f"Google Pay payment {payment_status}: {transaction_id}")
         
         return PaymentResponse(
-            success=True,
+            success=result.success,
             transaction_id=transaction_id,
-            status="completed",
-            message="Payment processed successfully",
+            status=payment_status,
+            message="Payment processed successfully" if result.success else (result.message or "Payment failed"),
             amount=payment_request.amount,
-            currency=payment_request.currency
+            currency=currency
         )
         
     except HTTPException:
         raise
     except Exception as e:
+        db.rollback()
         logger.error(f"Payment processing failed: {e}")
         raise HTTPException(
             status_code=500,
@@ -237,65 +319,161 @@ async def refund_payment(
     transaction_id: str,
     amount: Optional[float] = None,
     reason: Optional[str] = None,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key"),
+    gateway: PaymentGateway = Depends(get_gateway),
     db: Session = Depends(get_db)
 ):
     """
     Refund a payment (partial or full)
+    
+    Retries carrying the same Idempotency-Key replay the first response.
     """
-    try:
-        payment = db.query(models.Payment).filter(
-            models.Payment.transaction_id == transaction_id
-        ).first()
-        
-        if not payment:
-            raise HTTPException(status_code=404, detail="Payment not found")
-        
-        if payment.status != "completed":
-            raise HTTPException(
-                status_code=400, 
-                detail="Only completed payments can be refunded"
-            )
-        
-        refund_amount = amount or payment.amount
-        
-        if refund_amount > payment.amount:
-            raise HTTPException(
-                status_code=400,
-                detail="Refund amount cannot exceed original payment amount"
-            )
-        
-        # Here you would process the refund with your payment gateway
-        # refund_result = process_refund_with_gateway(transaction_id, refund_amount)
-        
-        # Create refund record
-        refund_id = f"rfnd_{transaction_id}_{datetime.now().strftime('%Y%m%d%H%M%S')}"
-        
-        refund_record = models.Refund(
-            payment_id=payment.id,
-            refund_id=refund_id,
-            amount=refund_amount,
-            reason=reason,
-            status="completed",
-            created_at=datetime.utcnow()
+    return await run_idempotent(
+        db,
+        idempotency_key,
+        scope=REFUND_SCOPE,
+        payload={"transaction_id": transaction_id, "amount": amount, "reason": reason},
+        handler=lambda: _refund_payment(transaction_id, amount, reason, gateway, db, idempotency_key)
+    )
+
+def _refund_response(refund: models.Refund) -> Dict:
+    return {
+        "success": True,
+        "refund_id": refund.refund_id,
+        "amount_refunded": refund.amount,
+        "status": "completed",
+        "message": "Refund processed successfully"
+    }
+
+def _reserve_refund(
+    transaction_id: str,
+    amount: Optional[float],
+    reason: Optional[str],
+    refund_id: str,
+    db: Session
+) -> models.Refund:
+    """Record a pending refund, checked against the refundable balance under the payment lock"""
+    # Lock the payment so concurrent refunds can't both pass the balance check
+    payment = db.query(models.Payment).filter(
+        models.Payment.transaction_id == transaction_id
+    ).with_for_update().first()
+    
+    if not payment:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    
+    if payment.status not in ("completed", "partially_refunded"):
+        raise HTTPException(
+            status_code=400, 
+            detail="Only completed payments can be refunded"
         )
+    
+    # Pending refunds count too: they may already have gone through at the gateway
+    already_refunded = refunded_total(db, payment.id, include_pending=True)
+    refundable = round(payment.amount - already_refunded, 2)
+    refund_amount = refundable if amount is None else amount
+    
+    if refund_amount <= 0 or refund_amount > refundable:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Refund amount cannot exceed the remaining refundable amount ({refundable})"
+        )
+    
+    refund_record = models.Refund(
+        payment_id=payment.id,
+        refund_id=refund_id,
+        amount=refund_amount,
+        reason=reason,
+        status="pending",
+        created_at=datetime.utcnow()
+    )
+    db.add(refund_record)
+    db.commit()
+    return refund_record
+
+def _complete_refund(refund_record: models.Refund, gateway_reference: Optional[str], db: Session):
+    payment = db.query(models.Payment).filter(
+        models.Payment.id == refund_record.payment_id
+    ).with_for_update().first()
+    
+    refund_record.status = "completed"
+    refund_record.gateway_reference = gateway_reference
+    db.flush()
+    record_refund(db, payment, refund_record)
+    
+    # Update payment status if fully refunded
+    refunded = refunded_total(db, payment.id)
+    if round(payment.amount - refunded, 2) <= 0:
+        payment.status = "refunded"
+    else:
+        payment.status = "partially_refunded"
+    
+    enqueue_event(db, "refund.completed", "refund", refund_record.refund_id, {
+        "refund_id": refund_record.refund_id,
+        "transaction_id": payment.transaction_id,
+        "order_id": payment.order_id,
+        "user_id": payment.user_id,
+        "amount": refund_record.amount,
+        "currency": payment.currency,
+        "reason": refund_record.reason,
+        "payment_status": payment.status,
+    })
+    db.commit()
+
+async def _refund_payment(
+    transaction_id: str,
+    amount: Optional[float],
+    reason: Optional[str],
+    gateway: PaymentGateway,
+    db: Session,
+    idempotency_key: Optional[str] = None
+) -> Dict:
+    """
+    Refund in three steps: reserve a pending row, call the gateway, complete it.
+
+    No row lock is held across the gateway call. A retry after a gateway
+    timeout finds its pending row by the derived refund_id and calls the
+    gateway again under the same key, which returns the first refund.
+    """
+    try:
+        refund_id = refund_request_id(idempotency_key)
+        refund_record = db.query(models.Refund).filter(models.Refund.refund_id == refund_id).first()
+        if refund_record is not None and refund_record.status == "completed":
+            return _refund_response(refund_record)
+        if refund_record is not None and refund_record.status == "failed":
+            raise HTTPException(status_code=402, detail="Refund was declined by the payment gateway")
+        if refund_record is None:
+            refund_record = _reserve_refund(transaction_id, amount, reason, refund_id, db)
         
-        db.add(refund_record)
-        
-        # Update payment status if fully refunded
-        if refund_amount == payment.amount:
-            payment.status = "refunded"
-        else:
-            payment.status = "partially_refunded"
-        
+        payment = db.query(models.Payment).filter(models.Payment.id == refund_record.payment_id).first()
         db.commit()
+        gateway_reference = None
         
-        return {
-            "success": True,
-            "refund_id": refund_id,
-            "amount_refunded": refund_amount,
-            "status": "completed",
-            "message": "Refund processed successfully"
-        }
+        # Payments recorded before the gateway integration have no reference
+        # at the gateway; those are refunded locally only.
+        if payment.gateway_reference:
+            try:
+                result = await gateway.refund(
+                    payment.gateway_reference,
+                    refund_record.amount,
+                    payment.currency,
+                    refund_id
+                )
+            except GatewayError as e:
+                # Outcome unknown: the pending row keeps the amount reserved for the retry
+                logger.error(f"Payment gateway error for refund {refund_id}: {e}")
+                raise HTTPException(status_code=502, detail="Payment gateway unavailable")
+            
+            if not result.success:
+                refund_record.status = "failed"
+                db.commit()
+                raise HTTPException(
+                    status_code=402,
+                    detail=result.message or "Refund was declined by the payment gateway"
+                )
+            gateway_reference = result.reference
+        
+        _complete_refund(refund_record, gateway_reference, db)
+        return _refund_response(refund_record)
         
     except HTTPException:
         raise
@@ -0,0 +1,306 @@
+# app/idempotency.py
+"""
+Idempotency-Key support for retry-prone endpoints.
+
+The first request with a given key claims it by inserting an IN_PROGRESS row,
+runs the handler, and stores the serialized response. Retries with the same
+key and payload get the stored response replayed without re-running the
+handler; retries that arrive while the first is still running wait for it
+(in-process via an asyncio.Event, across workers by polling the row).
+Completed responses are also kept in a small in-memory LRU so hot retries
+never touch the database.
+
+The handler commits its own side effects, and the response is stored in a
+later transaction. A crash in between leaves the key IN_PROGRESS, and after
+LOCK_TIMEOUT the next retry runs the handler again. Handlers must therefore
+be idempotent by key themselves: derive their record ids from the key and
+return the existing record if it is already there, as the payment and
+refund handlers do.
+"""
+import asyncio
+import hashlib
+import inspect
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple, Union
+
+from fastapi import HTTPException
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_TTL = timedelta(hours=24)
+LOCK_TIMEOUT = timedelta(seconds=60)
+WAIT_TIMEOUT_SECONDS = 30.0
+POLL_INTERVAL_SECONDS = 0.1
+MAX_KEY_LENGTH = 255
+
+IN_PROGRESS = "IN_PROGRESS"
+COMPLETED = "COMPLETED"
+
+class _ResponseCache:
+    """Bounded LRU of completed responses keyed by (scope, key)"""
+
+    def __init__(self, max_entries: int = 10000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Tuple[str, str], tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key: Tuple[str, str]) -> Optional[tuple]:
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry[3] <= time.time():
+                del self._entries[cache_key]
+                return None
+            self._entries.move_to_end(cache_key)
+            return entry
+
+    def put(self, cache_key: Tuple[str, str], fingerprint: str, status_code: int, body: Any, expires_at: datetime):
+        # expires_at is naive UTC; convert via the remaining lifetime
+        remaining = (expires_at - datetime.utcnow()).total_seconds() if expires_at else 0
+        expires = time.time() + remaining
+        with self._lock:
+            self._entries[cache_key] = (fingerprint, status_code, body, expires)
+            self._entries.move_to_end(cache_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+response_cache = _ResponseCache()
+
+# Keys currently being processed by this worker, so local duplicates can
+# wait on an event instead of polling the database.
+_inflight: Dict[Tuple[str, str], asyncio.Event] = {}
+
+def fingerprint_request(payload: Any) -> str:
+    """Stable sha256 of a request payload"""
+    encoded = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode()).hexdigest()
+
+def _replay(status_code: int, body: Any) -> JSONResponse:
+    return JSONResponse(
+        status_code=status_code,
+        content=body,
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+def _check_fingerprint(stored: str, fingerprint: str):
+    if stored != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="Idempotency-Key was already used with a different request payload"
+        )
+
+def _try_claim(db: Session, scope: str, key: str, fingerprint: str) -> Tuple[bool, Optional[models.IdempotencyRecord]]:
+    """Claim the key for this request, or return the existing record"""
+    now = datetime.utcnow()
+    claim_values = {
+        "fingerprint": fingerprint,
+        "status": IN_PROGRESS,
+        "response_status": None,
+        "response_body": None,
+        "locked_until": now + LOCK_TIMEOUT,
+        "created_at": now,
+        "expires_at": now + IDEMPOTENCY_TTL,
+    }
+
+    result = db.execute(
+        insert(models.IdempotencyRecord)
+        .values(scope=scope, key=key, **claim_values)
+        .on_conflict_do_nothing(index_elements=["scope", "key"])
+    )
+    if result.rowcount:
+        db.commit()
+        return True, None
+
+    # Take over rows whose owner crashed mid-request or that have expired
+    taken = db.query(models.IdempotencyRecord).filter(
+        models.IdempotencyRecord.scope == scope,
+        models.IdempotencyRecord.key == key,
+        or_(
+            and_(
+                models.IdempotencyRecord.status == IN_PROGRESS,
+                models.IdempotencyRecord.locked_until < now
+            ),
+            models.IdempotencyRecord.expires_at < now
+        )
+    ).update(claim_values, synchronize_session=False)
+    db.commit()
+    if taken:
+        return True, None
+
+    record = db.query(models.IdempotencyRecord).populate_existing().filter(
+        models.IdempotencyRecord.scope == scope,
+        models.IdempotencyRecord.key == key
+    ).first()
+    db.commit()
+    return False, record
+
+def _complete(db: Session, scope: str, key: str, status_code: int, body: Any) -> datetime:
+    expires_at = datetime.utcnow() + IDEMPOTENCY_TTL
+    db.query(models.IdempotencyRecord).filter(
+        models.IdempotencyRecord.scope == scope,
+        models.IdempotencyRecord.key == key
+    ).update({
+        "status": COMPLETED,
+        "response_status": status_code,
+        "response_body": body,
+        "locked_until": None,
+        "expires_at": expires_at,
+    }, synchronize_session=False)
+    db.commit()
+    return expires_at
+
+def _release(db: Session, scope: str, key: str):
+    """Drop the claim after a server-side failure so a retry can run again"""
+    try:
+        db.rollback()
+        db.query(models.IdempotencyRecord).filter(
+            models.IdempotencyRecord.scope == scope,
+            models.IdempotencyRecord.key == key,
+            models.IdempotencyRecord.status == IN_PROGRESS
+        ).delete(synchronize_session=False)
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Failed to release idempotency key {scope}/{key}: {e}")
+
+async def run_idempotent(
+    db: Session,
+    key: Optional[str],
+    scope: str,
+    payload: Any,
+    handler: Callable[[], Union[Any, Awaitable[Any]]]
+) -> Any:
+    """
+    Run ``handler`` at most once per (scope, key).
+
+    Without a key the handler simply runs. Results and 4xx errors are stored
+    and replayed; 5xx errors release the key so the client may retry. The
+    handler may still run more than once per key (see the module docstring),
+    so it must be idempotent by key.
+    """
+    if not key:
+        result = handler()
+        return await result if inspect.isawaitable(result) else result
+
+    if len(key) > MAX_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key is too long")
+
+    fingerprint = fingerprint_request(payload)
+    cache_key = (scope, key)
+
+    cached = response_cache.get(cache_key)
+    if cached is not None:
+        _check_fingerprint(cached[0], fingerprint)
+        return _replay(cached[1], cached[2])
+
+    deadline = time.monotonic() + WAIT_TIMEOUT_SECONDS
+    while True:
+        claimed, record = _try_claim(db, scope, key, fingerprint)
+        if claimed:
+            break
+
+        if record is not None:
+            _check_fingerprint(record.fingerprint, fingerprint)
+            if record.status == COMPLETED:
+                response_cache.put(cache_key, record.fingerprint, record.response_status,
+                                   record.response_body, record.expires_at)
+                return _replay(record.response_status, record.response_body)
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise HTTPException(
+                status_code=409,
+                detail="A request with this Idempotency-Key is still being processed"
+            )
+        if record is None:
+            # Released between our insert and read; try to claim again
+            await asyncio.sleep(0)
+            continue
+
+        event = _inflight.get(cache_key)
+        if event is not None:
+            try:
+                await asyncio.wait_for(event.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await asyncio.sleep(min(POLL_INTERVAL_SECONDS, remaining))
+
+    event = asyncio.Event()
+    _inflight[cache_key] = event
+    try:
+        try:
+            result = handler()
+            if inspect.isawaitable(result):
+                result = await result
+        except HTTPException as exc:
+            if exc.status_code < 500:
+                db.rollback()
+                body = {"detail": jsonable_encoder(exc.detail)}
+                expires_at = _complete(db, scope, key, exc.status_code, body)
+                response_cache.put(cache_key, fingerprint, exc.status_code, body, expires_at)
+            else:
+                _release(db, scope, key)
+            raise
+        except Exception:
+            _release(db, scope, key)
+            raise
+
+        body = jsonable_encoder(result)
+        expires_at = _complete(db, scope, key, 200, body)
+        response_cache.put(cache_key, fingerprint, 200, body, expires_at)
+        return result
+    finally:
+        event.set()
+        _inflight.pop(cache_key, None)
+
+def purge_expired_keys(db: Session, batch_size: int = 1000) -> int:
+    """Delete expired idempotency rows in batches; returns the number removed"""
+    removed = 0
+    while True:
+        expired = db.query(models.IdempotencyRecord.scope, models.IdempotencyRecord.key).filter(
+            models.IdempotencyRecord.expires_at < datetime.utcnow()
+        ).limit(batch_size).all()
+        if not expired:
+            break
+        db.query(models.IdempotencyRecord).filter(
+            tuple_(models.IdempotencyRecord.scope, models.IdempotencyRecord.key).in_(
+                [tuple(row) for row in expired]
+            )
+        ).delete(synchronize_session=False)
+        db.commit()
+        removed += len(expired)
+        if len(expired) < batch_size:
+            break
+    return removed
+
+async def cleanup_loop(session_factory: Callable[[], Session], interval_seconds: float = 3600.0):
+    """Periodically purge expired keys; run as a background task"""
+    def purge_once() -> int:
+        db = session_factory()
+        try:
+            return purge_expired_keys(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            removed = await asyncio.to_thread(purge_once)
+            if removed:
+                logger.info(f"Purged {removed} expired idempotency keys")
+        except Exception as e:
+            logger.error(f"Idempotency key cleanup failed: {e}")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,137 @@
+# app/ids.py
+"""
+Time-sortable, collision-free identifiers (ULID layout).
+
+An ID is 128 bits: a 48-bit millisecond timestamp followed by 80 random bits,
+written as 26 Crockford base32 characters so IDs sort lexicographically by
+creation time. Within one process, IDs generated in the same millisecond
+reuse the random part and increment it, so they stay strictly increasing.
+Separate workers start from independent 80-bit random values, and the random
+state is reset in forked children so pre-fork servers never share a sequence.
+"""
+import os
+import threading
+import time
+from typing import List
+
+_ENCODING = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+# Two base32 characters per lookup: 10 bits -> 2 chars
+_PAIRS = [a + b for a in _ENCODING for b in _ENCODING]
+
+# Keep the top random bit clear so increments within a millisecond have
+# 2**79 of headroom before they could overflow into the timestamp.
+_RANDOM_MASK = (1 << 79) - 1
+_RANDOM_LIMIT = 1 << 80
+
+def _encode_time(ms: int) -> str:
+    """Encode a 48-bit millisecond timestamp as 10 base32 characters"""
+    pairs = _PAIRS
+    return (
+        pairs[(ms >> 40) & 1023]
+        + pairs[(ms >> 30) & 1023]
+        + pairs[(ms >> 20) & 1023]
+        + pairs[(ms >> 10) & 1023]
+        + pairs[ms & 1023]
+    )
+
+def _encode_high(high: int) -> str:
+    """Encode the top 60 random bits as 12 base32 characters"""
+    pairs = _PAIRS
+    return (
+        pairs[high >> 50]
+        + pairs[(high >> 40) & 1023]
+        + pairs[(high >> 30) & 1023]
+        + pairs[(high >> 20) & 1023]
+        + pairs[(high >> 10) & 1023]
+        + pairs[high & 1023]
+    )
+
+def _fresh_random() -> int:
+    return int.from_bytes(os.urandom(10), "big") & _RANDOM_MASK
+
+class IdGenerator:
+    """Thread-safe monotonic ULID generator"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._last_ms = -1
+        self._time_part = ""
+        self._random = 0
+        self._high = -1
+        self._head = ""
+
+    def _head_for(self, value: int) -> str:
+        """Timestamp plus the top 60 random bits, re-encoded only when they change"""
+        high = value >> 20
+        if high != self._high:
+            self._high = high
+            self._head = self._time_part + _encode_high(high)
+        return self._head
+
+    def _advance(self, count: int) -> int:
+        """Reserve ``count`` consecutive random values; caller holds the lock"""
+        ms = time.time_ns() // 1_000_000
+        if ms > self._last_ms:
+            self._last_ms = ms
+            self._time_part = _encode_time(ms)
+            self._random = _fresh_random()
+            self._high = -1
+        elif self._random + count >= _RANDOM_LIMIT:
+            # Exhausted this millisecond (or the clock went backwards); borrow
+            # the next one so ordering is preserved.
+            self._last_ms += 1
+            self._time_part = _encode_time(self._last_ms)
+            self._random = _fresh_random()
+            self._high = -1
+        else:
+            self._random += 1
+        start = self._random
+        self._random += count - 1
+        return start
+
+    def new(self) -> str:
+        """Return one new 26-character ID"""
+        with self._lock:
+            value = self._advance(1)
+            head = self._head_for(value)
+        return head + _PAIRS[(value >> 10) & 1023] + _PAIRS[value & 1023]
+
+    def new_many(self, count: int) -> List[str]:
+        """Return ``count`` new IDs in increasing order, taking the lock once"""
+        if count <= 0:
+            return []
+        with self._lock:
+            start = self._advance(count)
+            time_part = self._time_part
+        pairs = _PAIRS
+        ids = []
+        high = -1
+        head = ""
+        for value in range(start, start + count):
+            if value >> 20 != high:
+                high = value >> 20
+                head = time_part + _encode_high(high)
+            ids.append(head + pairs[(value >> 10) & 1023] + pairs[value & 1023])
+        return ids
+
+_generator = IdGenerator()
+
+if hasattr(os, "register_at_fork"):
+    # Children of pre-fork servers must not continue the parent's sequence
+    os.register_at_fork(after_in_child=_generator._reset)
+
+def new_id(prefix: str = "") -> str:
+    """Return a new time-sortable ID, optionally as ``{prefix}_{ulid}``"""
+    if prefix:
+        return f"{prefix}_{_generator.new()}"
+    return _generator.new()
+
+def new_ids(count: int, prefix: str = "") -> List[str]:
+    """Return ``count`` new IDs generated in one batch"""
+    ids = _generator.new_many(count)
+    if prefix:
+        return [f"{prefix}_{value}" for value in ids]
+    return ids
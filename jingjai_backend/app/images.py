@@ -0,0 +1,358 @@
+# app/images.py
+"""
+Background image pipeline for uploaded photos and product thumbnails.
+
+Upload handlers call image_pipeline.submit() and return at once. Queued
+images are decoded in a process pool, so the CPU-heavy work stays off the
+event loop and out of the GIL. Each image is:
+- EXIF-oriented, with metadata stripped
+- re-encoded as fixed-size JPEG variants (thumbnail and analysis)
+- stored next to its original under the same content address
+
+Results are written back to the uploads table, and to
+Product.thumbnail_url when the job belongs to a product. A periodic sweep
+re-queues uploads the in-memory queue lost (restart, queue full).
+
+Product thumbnails for catalog images can be backfilled from the
+jingjai_backend directory:
+    python -m app.images products [--workers 4] [--limit 1000]
+"""
+import argparse
+import asyncio
+import io
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Union
+
+import requests
+from PIL import Image, ImageOps
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .database import SessionLocal
+from .storage import Storage, StoredObject, content_key, get_storage, key_from_url, sha256_of_key
+from .uploads import ALLOWED_IMAGE_TYPES, MAX_FILE_BYTES, record_uploads, sniff_image_type
+
+try:
+    from pillow_heif import register_heif_opener
+    register_heif_opener()
+except ImportError:  # HEIC uploads are stored but fail processing
+    pass
+
+logger = logging.getLogger(__name__)
+
+# Variant name -> longest edge in pixels
+VARIANTS = {"analysis": 1024, "thumb": 256}
+JPEG_QUALITY = {"analysis": 90, "thumb": 80}
+# Decompression bomb limit. Pillow only warns past MAX_IMAGE_PIXELS (it raises
+# at twice that), so render_variants checks the header size itself
+MAX_IMAGE_PIXELS = 64_000_000
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+PIPELINE_WORKERS = int(os.getenv("IMAGE_PIPELINE_WORKERS", str(max(1, (os.cpu_count() or 2) - 1))))
+QUEUE_SIZE = 2000
+SWEEP_INTERVAL_SECONDS = 60
+SWEEP_GRACE = timedelta(seconds=30)
+
+images_processed = metrics.counter("images.processed", "Images rendered into variants")
+images_failed = metrics.counter("images.failed", "Images that could not be processed")
+queue_depth = metrics.gauge("images.queue_depth", "Images waiting for the process pool")
+render_seconds = metrics.histogram("images.render_seconds", "Decode/resize/encode time per image")
+
+@dataclass
+class ImageJob:
+    key: str
+    sha256: str
+    product_id: Optional[int] = None
+
+def render_variants(source: Union[str, bytes], variants: Dict[str, int] = VARIANTS, draft: bool = True) -> Dict[str, Any]:
+    """
+    Decode, orient and re-encode one image (runs in a worker process).
+
+    Returns the oriented size and the encoded bytes of each variant.
+    """
+    started = time.perf_counter()
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+        width, height = img.size
+        # Only the header has been read so far
+        if width * height > MAX_IMAGE_PIXELS:
+            raise Image.DecompressionBombError(
+                f"Image size ({width * height} pixels) exceeds limit of {MAX_IMAGE_PIXELS} pixels"
+            )
+        orientation = img.getexif().get(0x0112, 1)
+        if orientation in (5, 6, 7, 8):
+            width, height = height, width
+
+        if draft:
+            # JPEG only: let libjpeg decode at 1/2, 1/4 or 1/8 scale when the
+            # largest variant is still covered, which skips most of the IDCT work
+            largest = max(variants.values())
+            img.draft("RGB", (largest, largest))
+
+        # exif_transpose also drops the orientation tag; nothing else from
+        # the source (EXIF, GPS, XMP, ICC) is passed to save()
+        image = ImageOps.exif_transpose(img)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        rendered = {}
+        # Largest first, each smaller variant resized from the previous one
+        for name, edge in sorted(variants.items(), key=lambda item: -item[1]):
+            image = image.copy() if max(image.size) <= edge else _resized(image, edge)
+            buffer = io.BytesIO()
+            image.save(buffer, "JPEG", quality=JPEG_QUALITY.get(name, 85), optimize=True)
+            rendered[name] = buffer.getvalue()
+
+    return {"width": width, "height": height, "variants": rendered,
+            "seconds": time.perf_counter() - started}
+
+def _resized(image: Image.Image, edge: int) -> Image.Image:
+    image = image.copy()
+    image.thumbnail((edge, edge), Image.LANCZOS, reducing_gap=3.0)
+    return image
+
+def store_variants(storage: Storage, sha256: str, rendered: Dict[str, Any]) -> Dict[str, str]:
+    keys = {}
+    for name, data in rendered["variants"].items():
+        key = content_key(sha256, "jpg", variant=name)
+        storage.put_bytes(key, data)
+        keys[name] = key
+    return keys
+
+def mark_processed(db: Session, storage: Storage, sha256: str, rendered: Dict[str, Any],
+                   keys: Dict[str, str], product_ids: List[int] = ()):
+    db.query(models.StoredUpload).filter(models.StoredUpload.sha256 == sha256).update({
+        "width": rendered["width"],
+        "height": rendered["height"],
+        "variants": keys,
+        "processed_at": datetime.utcnow(),
+        "processing_error": None,
+    }, synchronize_session=False)
+    if product_ids and "thumb" in keys:
+        db.query(models.Product).filter(models.Product.id.in_(list(product_ids))).update(
+            {"thumbnail_url": storage.url(keys["thumb"])}, synchronize_session=False
+        )
+    db.commit()
+
+def mark_failed(db: Session, sha256: str, error: str):
+    # processed_at is set so the sweep does not retry a broken image forever
+    db.query(models.StoredUpload).filter(models.StoredUpload.sha256 == sha256).update({
+        "processed_at": datetime.utcnow(),
+        "processing_error": error[:1000],
+    }, synchronize_session=False)
+    db.commit()
+
+def find_unprocessed(db: Session, limit: int) -> List[ImageJob]:
+    rows = db.query(models.StoredUpload.storage_key, models.StoredUpload.sha256).filter(
+        models.StoredUpload.processed_at.is_(None),
+        models.StoredUpload.created_at < datetime.utcnow() - SWEEP_GRACE
+    ).order_by(models.StoredUpload.created_at).limit(limit).all()
+    db.commit()
+    return [ImageJob(key=row.storage_key, sha256=row.sha256) for row in rows]
+
+def _create_pool(workers: int) -> ProcessPoolExecutor:
+    # spawn, not fork: the API process has threads (DB pool, executors)
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+
+class ImagePipeline:
+    """Bounded queue in front of a process pool of image workers"""
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal,
+                 storage_factory: Callable[[], Storage] = get_storage,
+                 workers: int = PIPELINE_WORKERS, queue_size: int = QUEUE_SIZE):
+        self.session_factory = session_factory
+        self.storage_factory = storage_factory
+        self.workers = workers
+        self._queue: "asyncio.Queue[ImageJob]" = asyncio.Queue(maxsize=queue_size)
+        self._queued = set()
+        self._pool: Optional[ProcessPoolExecutor] = None
+
+    def submit(self, key: str, sha256: str, product_id: Optional[int] = None) -> bool:
+        """Queue an image without waiting; False if dropped (the sweep picks it up later)"""
+        if sha256 in self._queued:
+            return True
+        try:
+            self._queue.put_nowait(ImageJob(key=key, sha256=sha256, product_id=product_id))
+        except asyncio.QueueFull:
+            return False
+        self._queued.add(sha256)
+        queue_depth.set(self._queue.qsize())
+        return True
+
+    def submit_uploads(self, db: Session, stored: List[StoredObject]):
+        """
+        Queue just-registered uploads that have no variants yet.
+
+        Deduplicated uploads count too: an earlier copy may still be unprocessed
+        or have failed, and a re-upload is the user's way of retrying it.
+        """
+        if not stored:
+            return
+        rows = db.query(models.StoredUpload.storage_key, models.StoredUpload.sha256).filter(
+            models.StoredUpload.sha256.in_([obj.sha256 for obj in stored]),
+            or_(models.StoredUpload.processed_at.is_(None), models.StoredUpload.processing_error.isnot(None))
+        ).all()
+        for row in rows:
+            self.submit(row.storage_key, row.sha256)
+
+    def _run_db(self, fn: Callable[..., Any], *args):
+        db = self.session_factory()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    async def _process(self, job: ImageJob):
+        storage = self.storage_factory()
+        loop = asyncio.get_running_loop()
+        try:
+            source = storage.local_path(job.key) or await asyncio.to_thread(storage.read_bytes, job.key)
+            rendered = await loop.run_in_executor(self._pool, render_variants, source)
+            keys = await asyncio.to_thread(store_variants, storage, job.sha256, rendered)
+            product_ids = [job.product_id] if job.product_id else []
+            await asyncio.to_thread(self._run_db, mark_processed, storage, job.sha256, rendered, keys, product_ids)
+            render_seconds.observe(rendered["seconds"])
+            images_processed.inc()
+        except Exception as e:
+            images_failed.inc()
+            logger.warning(f"Image processing failed for {job.key}: {e}")
+            await asyncio.to_thread(self._run_db, mark_failed, job.sha256, f"{type(e).__name__}: {e}")
+
+    async def _consume(self):
+        while True:
+            job = await self._queue.get()
+            queue_depth.set(self._queue.qsize())
+            try:
+                await self._process(job)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Image pipeline error: {e}")
+            finally:
+                self._queued.discard(job.sha256)
+
+    async def _sweep(self):
+        while True:
+            try:
+                room = self._queue.maxsize - self._queue.qsize()
+                if room > 0:
+                    for job in await asyncio.to_thread(self._run_db, find_unprocessed, room):
+                        self.submit(job.key, job.sha256)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Image pipeline sweep error: {e}")
+            await asyncio.sleep(SWEEP_INTERVAL_SECONDS)
+
+    async def run(self):
+        self._pool = _create_pool(self.workers)
+        # One consumer per worker process keeps every process busy and no more
+        tasks = [asyncio.create_task(self._consume()) for _ in range(self.workers)]
+        tasks.append(asyncio.create_task(self._sweep()))
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+image_pipeline = ImagePipeline()
+
+# Product thumbnail backfill
+
+def fetch_into_storage(storage: Storage, url: str) -> StoredObject:
+    """Stream a remote catalog image into storage, hashing as it downloads"""
+    with requests.get(url, stream=True, timeout=(5, 30)) as response:
+        response.raise_for_status()
+        staged = storage.begin()
+        try:
+            head = b""
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                if not head:
+                    head = chunk[:16]
+                staged.write(chunk)
+                if staged.size > MAX_FILE_BYTES:
+                    raise ValueError("image too large")
+            content_type = sniff_image_type(head)
+            if content_type not in ALLOWED_IMAGE_TYPES:
+                raise ValueError("not a supported image")
+            return staged.commit(ALLOWED_IMAGE_TYPES[content_type], content_type)
+        except Exception:
+            staged.abort()
+            raise
+
+def backfill_product_thumbnails(db: Session, storage: Storage, workers: int, limit: Optional[int] = None,
+                                batch_size: int = 64) -> Dict[str, int]:
+    """Generate thumbnail_url for products that have images but no thumbnail"""
+    processed = failed = 0
+    after_id = 0
+    with _create_pool(workers) as pool:
+        while limit is None or processed + failed < limit:
+            products = db.query(models.Product.id, models.Product.image_urls).filter(
+                models.Product.id > after_id,
+                models.Product.thumbnail_url.is_(None),
+                models.Product.image_urls.isnot(None)
+            ).order_by(models.Product.id).limit(batch_size).all()
+            if not products:
+                break
+            after_id = products[-1].id
+
+            jobs = []
+            for product in products:
+                urls = product.image_urls or []
+                if not urls:
+                    continue
+                try:
+                    key = key_from_url(urls[0])
+                    if key is None:
+                        stored = fetch_into_storage(storage, urls[0])
+                        record_uploads(db, None, [stored])
+                        key, sha256 = stored.key, stored.sha256
+                    else:
+                        sha256 = sha256_of_key(key)
+                    jobs.append((product.id, key, sha256))
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"Product {product.id}: could not fetch {urls[0]}: {e}")
+            db.commit()
+
+            sources = [storage.local_path(key) or storage.read_bytes(key) for _, key, _ in jobs]
+            futures = [pool.submit(render_variants, source) for source in sources]
+            for (product_id, key, sha256), future in zip(jobs, futures):
+                try:
+                    rendered = future.result()
+                    keys = store_variants(storage, sha256, rendered)
+                    mark_processed(db, storage, sha256, rendered, keys, [product_id])
+                    processed += 1
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"Product {product_id}: thumbnail failed: {e}")
+            logger.info(f"Thumbnails: {processed} done, {failed} failed, last product {after_id}")
+
+    return {"processed": processed, "failed": failed}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Image pipeline maintenance")
+    parser.add_argument("command", choices=["products"])
+    parser.add_argument("--workers", type=int, default=PIPELINE_WORKERS)
+    parser.add_argument("--limit", type=int, default=None)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        summary = backfill_product_thumbnails(db, get_storage(), args.workers, args.limit)
+        print(f"✅ {summary}")
+    finally:
+        db.close()
@@ -0,0 +1,235 @@
+# app/inference.py
+"""
+In-process dynamic-batching inference for authentication photos.
+
+Analysis workers submit the photo tensors of one authentication and block
+until their scores come back. Every photo is queued individually. A single
+batcher task takes the first waiting photo and keeps collecting until either
+max_batch_size photos are in hand or max_wait has passed since that first
+photo was queued. It then runs one vectorized forward pass over the stacked
+batch, so photos from different authentications share a matmul, and resolves
+each caller's future with its row.
+
+The model is pluggable (INFERENCE_MODEL=stub or "package.module:Class"). The
+stub is a fixed-weight NumPy MLP, so the whole path works offline.
+"""
+import asyncio
+import importlib
+import io
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Set, Tuple, Union
+
+import numpy as np
+from PIL import Image
+
+from . import metrics
+from .analysis import AnalysisJob, AnalysisResult, Analyzer
+from .storage import Storage
+
+logger = logging.getLogger(__name__)
+
+LABELS = ("AUTHENTIC", "FAKE", "INCONCLUSIVE")
+INPUT_SIZE = 64  # Model input is INPUT_SIZE x INPUT_SIZE RGB
+
+MAX_BATCH_SIZE = int(os.getenv("INFERENCE_MAX_BATCH", "32"))
+MAX_WAIT_SECONDS = float(os.getenv("INFERENCE_MAX_WAIT_MS", "5")) / 1000
+RESULT_TIMEOUT_SECONDS = 30.0
+# Batches handed to the model but not finished; collection continues meanwhile
+MAX_BATCHES_IN_FLIGHT = 2
+
+batch_size_histogram = metrics.histogram(
+    "inference.batch_size", "Photos per forward pass", buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+queue_wait_histogram = metrics.histogram(
+    "inference.queue_wait_seconds", "Time a photo waited to be batched",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+forward_seconds = metrics.histogram(
+    "inference.forward_seconds", "Forward pass time per batch",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+)
+queued_photos = metrics.gauge("inference.queued", "Photos waiting for a batch")
+
+class StubModel:
+    """Fixed-weight two-layer MLP over flattened 64x64 RGB photos"""
+
+    def __init__(self, hidden: int = 128, seed: int = 7):
+        rng = np.random.default_rng(seed)
+        inputs = INPUT_SIZE * INPUT_SIZE * 3
+        self.w1 = (rng.standard_normal((inputs, hidden)) / np.sqrt(inputs)).astype(np.float32)
+        self.b1 = np.zeros(hidden, dtype=np.float32)
+        self.w2 = (rng.standard_normal((hidden, len(LABELS))) / np.sqrt(hidden)).astype(np.float32)
+        self.b2 = np.array([1.0, 0.0, -0.5], dtype=np.float32)  # Bias toward AUTHENTIC, like real traffic
+
+    def forward(self, batch: np.ndarray) -> np.ndarray:
+        """(B, 64, 64, 3) float32 -> (B, 3) class probabilities"""
+        hidden = batch.reshape(len(batch), -1) @ self.w1
+        hidden += self.b1
+        np.maximum(hidden, 0, out=hidden)
+        logits = hidden @ self.w2 + self.b2
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+def load_model(spec: Optional[str] = None):
+    spec = spec or os.getenv("INFERENCE_MODEL", "stub")
+    if spec == "stub":
+        return StubModel()
+    module_name, _, class_name = spec.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
+
+def preprocess(source: Union[str, bytes]) -> np.ndarray:
+    """Decode a photo into the model's (64, 64, 3) float32 input in [-1, 1]"""
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+        img.draft("RGB", (INPUT_SIZE * 2, INPUT_SIZE * 2))
+        img = img.convert("RGB").resize((INPUT_SIZE, INPUT_SIZE), Image.BILINEAR)
+        array = np.asarray(img, dtype=np.float32)
+    array *= 2.0 / 255.0
+    array -= 1.0
+    return array
+
+_Item = Tuple[np.ndarray, asyncio.Future, float]
+
+def _fail(items: List[_Item], error: Exception):
+    for _, future, _ in items:
+        if not future.done():
+            future.set_exception(error)
+
+class BatchingInferenceServer:
+    def __init__(self, model=None, max_batch_size: int = MAX_BATCH_SIZE, max_wait: float = MAX_WAIT_SECONDS):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: Optional["asyncio.Queue[_Item]"] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._in_flight: Optional[asyncio.Semaphore] = None
+        # Strong references to running batches; the loop only keeps weak ones
+        self._tasks: Set[asyncio.Task] = set()
+
+    @property
+    def running(self) -> bool:
+        return self._loop is not None
+
+    async def infer(self, tensors: np.ndarray) -> np.ndarray:
+        """Score (N, 64, 64, 3) photos; returns (N, len(LABELS)) probabilities"""
+        if not self.running:
+            raise RuntimeError("Inference server is not running")
+        loop = asyncio.get_running_loop()
+        futures = []
+        now = time.monotonic()
+        for tensor in tensors:
+            future = loop.create_future()
+            self._queue.put_nowait((tensor, future, now))
+            futures.append(future)
+        queued_photos.set(self._queue.qsize())
+        return np.stack(await asyncio.gather(*futures))
+
+    def infer_threadsafe(self, tensors: np.ndarray, timeout: float = RESULT_TIMEOUT_SECONDS) -> np.ndarray:
+        """Blocking variant for worker threads (the analysis pool)"""
+        if not self.running:
+            raise RuntimeError("Inference server is not running")
+        return asyncio.run_coroutine_threadsafe(self.infer(tensors), self._loop).result(timeout)
+
+    async def _collect(self) -> List[_Item]:
+        batch = [await self._queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        try:
+            while len(batch) < self.max_batch_size:
+                # Take whatever is already queued without touching the timer
+                while len(batch) < self.max_batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                remaining = deadline - time.monotonic()
+                if len(batch) >= self.max_batch_size or remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+        except BaseException:
+            _fail(batch, RuntimeError("Inference server stopped"))
+            raise
+        return batch
+
+    async def _run_batch(self, batch: List[_Item]):
+        try:
+            started = time.monotonic()
+            for _, _, queued_at in batch:
+                queue_wait_histogram.observe(started - queued_at)
+            batch_size_histogram.observe(len(batch))
+
+            inputs = np.stack([tensor for tensor, _, _ in batch])
+            try:
+                outputs = await self._loop.run_in_executor(self._executor, self.model.forward, inputs)
+            except Exception as e:
+                logger.error(f"Inference batch of {len(batch)} failed: {e}")
+                _fail(batch, e)
+                return
+            forward_seconds.observe(time.monotonic() - started)
+
+            for row, (_, future, _) in enumerate(batch):
+                if not future.done():  # Caller may have timed out
+                    future.set_result(outputs[row])
+        finally:
+            self._in_flight.release()
+
+    async def run(self):
+        self.model = self.model or load_model()
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        # NumPy releases the GIL in matmul; one thread keeps batches ordered
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="inference")
+        self._in_flight = asyncio.Semaphore(MAX_BATCHES_IN_FLIGHT)
+        try:
+            while True:
+                await self._in_flight.acquire()
+                try:
+                    batch = await self._collect()
+                except BaseException:
+                    self._in_flight.release()
+                    raise
+                queued_photos.set(self._queue.qsize())
+                task = asyncio.create_task(self._run_batch(batch))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+        finally:
+            self._loop = None
+            queued = []
+            while not self._queue.empty():
+                queued.append(self._queue.get_nowait())
+            _fail(queued, RuntimeError("Inference server stopped"))
+            queued_photos.set(0)
+            self._executor.shutdown(wait=False)
+
+inference_server = BatchingInferenceServer()
+
+class ModelAnalyzer(Analyzer):
+    """Scores every photo of an authentication through the batching server"""
+    name = "model"
+
+    def __init__(self, server: BatchingInferenceServer = inference_server):
+        self.server = server
+
+    def analyze(self, job: AnalysisJob, storage: Storage) -> AnalysisResult:
+        if not job.photo_keys:
+            return AnalysisResult("INCONCLUSIVE", 0.0, "No photos to analyze")
+        tensors = np.stack([
+            preprocess(storage.local_path(key) or storage.read_bytes(key)) for key in job.photo_keys
+        ])
+        probabilities = self.server.infer_threadsafe(tensors)
+
+        # The weakest photo decides: one suspicious detail outweighs the rest
+        per_photo = probabilities.argmax(axis=1)
+        mean = probabilities.mean(axis=0)
+        label = int(mean.argmax())
+        if label == 0 and (per_photo == 1).any():
+            label = 2
+        flagged = [i for i, value in enumerate(per_photo) if value == 1]
+        notes = f"Model scored {len(job.photo_keys)} photos"
+        if flagged:
+            notes += f"; photos {', '.join(str(i + 1) for i in flagged)} look inconsistent"
+        return AnalysisResult(LABELS[label], round(float(mean[label]), 3), notes)
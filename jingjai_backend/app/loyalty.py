@@ -0,0 +1,253 @@
+# app/loyalty.py
+"""
+Loyalty points accrual and Wallet balance sync.
+
+Points are only ever added as rows in the append-only points_ledger. Each
+entry bumps the user's loyalty_balances row (balance and version) in the same
+transaction. The ledger is unique per source event, so outbox redeliveries
+never double-award.
+
+LoyaltySyncWorker pushes balances to Google Wallet. Every interval it claims
+balances whose version moved past synced_version, sends one PATCH per pass
+with the current balance, however many ledger entries landed since the last
+sync, and reverts the claim if the PATCH fails.
+"""
+import asyncio
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .database import SessionLocal
+from .google_pay import GooglePayService, GoogleWalletError
+from .outbox import register_handler
+
+logger = logging.getLogger(__name__)
+
+POINTS_PER_CURRENCY_UNIT = int(os.getenv("LOYALTY_POINTS_PER_UNIT", "1"))
+AUTHENTICATION_POINTS = int(os.getenv("LOYALTY_AUTHENTICATION_POINTS", "10"))
+SYNC_INTERVAL_SECONDS = float(os.getenv("LOYALTY_SYNC_INTERVAL", "30"))
+SYNC_BATCH_SIZE = 200
+
+points_awarded = metrics.counter("loyalty.points_awarded", "Net points written to the ledger")
+ledger_entries = metrics.counter("loyalty.ledger_entries", "Ledger entries written")
+wallet_patches = metrics.counter("loyalty.wallet_patches", "Balance PATCH calls sent to Wallet")
+coalesced_changes = metrics.counter("loyalty.coalesced_changes", "Balance changes folded into an existing PATCH")
+sync_failures = metrics.counter("loyalty.sync_failures", "Balance PATCH calls that failed")
+
+def award_points(db: Session, user_id: int, delta: int, reason: str, source_type: str, source_id: str) -> bool:
+    """
+    Append a ledger entry and update the balance (caller commits).
+
+    Returns False if this source event was already recorded.
+    """
+    if not delta:
+        return False
+
+    inserted = db.execute(
+        insert(models.PointsLedgerEntry)
+        .values(
+            user_id=user_id,
+            delta=delta,
+            reason=reason,
+            source_type=source_type,
+            source_id=source_id,
+            created_at=datetime.utcnow(),
+        )
+        .on_conflict_do_nothing(index_elements=["source_type", "source_id", "reason"])
+    ).rowcount
+    if not inserted:
+        return False
+
+    stmt = insert(models.LoyaltyBalance).values(
+        user_id=user_id, balance=delta, version=1, synced_version=0, updated_at=datetime.utcnow()
+    )
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["user_id"],
+        set_={
+            "balance": models.LoyaltyBalance.balance + stmt.excluded.balance,
+            "version": models.LoyaltyBalance.version + 1,
+            "updated_at": stmt.excluded.updated_at,
+        }
+    ))
+    ledger_entries.inc()
+    points_awarded.inc(delta)
+    return True
+
+def get_balance(db: Session, user_id: int) -> int:
+    balance = db.query(models.LoyaltyBalance.balance).filter(
+        models.LoyaltyBalance.user_id == user_id
+    ).scalar()
+    return balance or 0
+
+def points_for_amount(amount: float) -> int:
+    return int(math.floor((amount or 0) * POINTS_PER_CURRENCY_UNIT))
+
+# Outbox consumers: accrual runs off committed payment/authentication events
+
+def _apply_event(fn: Callable[[Session, Dict[str, Any]], None], event: Dict[str, Any]):
+    db = SessionLocal()
+    try:
+        fn(db, event)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+def _on_payment_completed(db: Session, event: Dict[str, Any]):
+    data = event["data"]
+    award_points(db, data["user_id"], points_for_amount(data["amount"]), "payment", "payment", data["transaction_id"])
+
+def _on_refund_completed(db: Session, event: Dict[str, Any]):
+    data = event["data"]
+    award_points(db, data["user_id"], -points_for_amount(data["amount"]), "refund", "refund", data["refund_id"])
+
+def _on_authentication_completed(db: Session, event: Dict[str, Any]):
+    data = event["data"]
+    award_points(db, data["user_id"], AUTHENTICATION_POINTS, "authentication", "authentication",
+                 str(data["authentication_id"]))
+
+async def handle_payment_completed(event: Dict[str, Any]):
+    await asyncio.to_thread(_apply_event, _on_payment_completed, event)
+
+async def handle_refund_completed(event: Dict[str, Any]):
+    await asyncio.to_thread(_apply_event, _on_refund_completed, event)
+
+async def handle_authentication_completed(event: Dict[str, Any]):
+    await asyncio.to_thread(_apply_event, _on_authentication_completed, event)
+
+register_handler("payment.completed", handle_payment_completed)
+register_handler("refund.completed", handle_refund_completed)
+register_handler("authentication.completed", handle_authentication_completed)
+
+# Wallet sync
+
+def claim_dirty_balances(db: Session, batch_size: int = SYNC_BATCH_SIZE) -> List[Tuple[int, int, int, int, List[str]]]:
+    """
+    Claim balances changed since their last sync.
+
+    Marks them synced up front (so other workers skip them) and returns
+    (user_id, balance, version, previous_synced_version, pass object ids).
+    """
+    balances = db.query(models.LoyaltyBalance).filter(
+        models.LoyaltyBalance.version > models.LoyaltyBalance.synced_version
+    ).order_by(models.LoyaltyBalance.user_id).limit(batch_size).with_for_update(skip_locked=True).all()
+    if not balances:
+        db.commit()
+        return []
+
+    passes: Dict[int, List[str]] = {}
+    for user_id, object_id in db.query(models.GooglePayPass.user_id, models.GooglePayPass.object_id).filter(
+        models.GooglePayPass.user_id.in_([balance.user_id for balance in balances]),
+        models.GooglePayPass.status == "ISSUED"
+    ):
+        passes.setdefault(user_id, []).append(object_id)
+
+    claimed = []
+    for balance in balances:
+        claimed.append((balance.user_id, balance.balance, balance.version, balance.synced_version,
+                        passes.get(balance.user_id, [])))
+        coalesced_changes.inc(max(0, balance.version - balance.synced_version - 1))
+        balance.synced_version = balance.version
+    db.commit()
+    return claimed
+
+def finish_sync(db: Session, synced: List[Tuple[int, int]], failed: List[Tuple[int, int, int]]):
+    """Record pushed balances on the passes and un-claim failures"""
+    for user_id, balance in synced:
+        db.query(models.GooglePayPass).filter(
+            models.GooglePayPass.user_id == user_id,
+            models.GooglePayPass.status == "ISSUED"
+        ).update({"points_balance": balance}, synchronize_session=False)
+
+    for user_id, version, previous in failed:
+        # Only revert if nothing newer has claimed the row meanwhile
+        db.query(models.LoyaltyBalance).filter(
+            models.LoyaltyBalance.user_id == user_id,
+            models.LoyaltyBalance.synced_version == version
+        ).update({"synced_version": previous}, synchronize_session=False)
+    db.commit()
+
+class LoyaltySyncWorker:
+    """Pushes coalesced balance changes to Google Wallet on an interval"""
+
+    def __init__(self, session_factory: Callable[[], Session], service: GooglePayService,
+                 interval: float = SYNC_INTERVAL_SECONDS, concurrency: int = 8):
+        self.session_factory = session_factory
+        self.service = service
+        self.interval = interval
+        self._pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="loyalty-sync")
+
+    def _run_db(self, fn: Callable[..., Any], *args):
+        db = self.session_factory()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    def _patch(self, object_id: str, balance: int) -> Optional[str]:
+        try:
+            self.service.patch_loyalty_object(
+                object_id, {"loyaltyPoints": {"label": "Points", "balance": {"int": balance}}}
+            )
+            return None
+        except GoogleWalletError as e:
+            return str(e)
+
+    async def sync_once(self) -> int:
+        claimed = await asyncio.to_thread(self._run_db, claim_dirty_balances)
+        if not claimed:
+            return 0
+
+        # One gather across every claimed pass, so the whole batch shares the pool;
+        # users without a pass yet get their balance when one is issued
+        loop = asyncio.get_running_loop()
+        patches = [
+            (index, loop.run_in_executor(self._pool, self._patch, object_id, balance))
+            for index, (_, balance, _, _, object_ids) in enumerate(claimed)
+            for object_id in object_ids
+        ]
+        results = await asyncio.gather(*(future for _, future in patches))
+        wallet_patches.inc(len(patches))
+
+        errors: Dict[int, List[str]] = {}
+        for (index, _), error in zip(patches, results):
+            errors.setdefault(index, []).append(error)
+
+        synced, failed = [], []
+        for index, (user_id, balance, version, previous, object_ids) in enumerate(claimed):
+            if not object_ids:
+                continue
+            user_errors = [error for error in errors[index] if error]
+            if user_errors:
+                sync_failures.inc()
+                logger.warning(f"Loyalty sync failed for user {user_id}: {user_errors[0]}")
+                failed.append((user_id, version, previous))
+            else:
+                synced.append((user_id, balance))
+
+        await asyncio.to_thread(self._run_db, finish_sync, synced, failed)
+        return len(claimed)
+
+    async def run(self):
+        try:
+            while True:
+                try:
+                    # Drain everything that is dirty, then wait for more to accumulate
+                    while await self.sync_once() >= SYNC_BATCH_SIZE:
+                        pass
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Loyalty sync error: {e}")
+                await asyncio.sleep(self.interval)
+        finally:
+            self._pool.shutdown(wait=False)
@@ -5,6 +5,7 @@ from sqlalchemy.orm import Session
 from passlib.context import CryptContext
 from pydantic import BaseModel, EmailStr
 import uvicorn
+import asyncio
 import os
 from dotenv import load_dotenv
 
@@ -12,11 +13,15 @@ from dotenv import load_dotenv
 load_dotenv()
 
 # Add this import to your existing main.py imports
-from .google_pay_payments import router as payments_router
 from .google_pay_routes import router as google_pay_router
 from .brands_routes import router as brands_router
 from .products_routes import router as products_router
 from .profile_routes import router as profile_router
+from .favorites_routes import router as favorites_router
+from .revenue_routes import router as revenue_router
+from .uploads_routes import router as uploads_router
+from .reviews_routes import router as reviews_router
+from .catalog_routes import router as catalog_router
 
 # Import from the same directory (app folder)
 from . import models
@@ -24,6 +29,19 @@ from . import schemas
 from . import crud
 from .database import SessionLocal, engine, get_db
 from .utils import create_access_token
+from .idempotency import cleanup_loop as idempotency_cleanup_loop
+from .payment_gateways import close_gateway
+from .outbox import OutboxDispatcher
+from .loyalty import LoyaltySyncWorker
+from .google_pay import GooglePayService
+from .images import image_pipeline
+from .analysis import AnalysisWorkerPool
+from .inference import inference_server
+from .reviews import maintenance_loop as review_maintenance_loop
+from .status_stream import StatusListener, retention_loop as status_event_retention_loop
+from .catalog_changes import retention_loop as catalog_tombstone_retention_loop
+from .auth_utils import require_admin_key
+from . import metrics
 
 # Initialize FastAPI app
 app = FastAPI(title="JINGJAI API", description="Authentication API for JINGJAI app")
@@ -55,6 +73,11 @@ def read_root():
 def health_check():
     return {"status": "healthy", "message": "API is running properly"}
 
+# In-process metrics for background workers and queues
+@app.get("/metrics", dependencies=[Depends(require_admin_key)])
+def get_metrics():
+    return metrics.snapshot()
+
 # Test environment variables endpoint
 @app.get("/test-env")
 def test_env():
@@ -67,6 +90,39 @@ def test_env():
 # Create database tables
 models.Base.metadata.create_all(bind=engine)
 
+# Background maintenance tasks
+_background_tasks = []
+
+@app.on_event("startup")
+async def start_background_tasks():
+    _background_tasks.append(asyncio.create_task(idempotency_cleanup_loop(SessionLocal)))
+    if os.getenv("OUTBOX_DISPATCHER_ENABLED", "1") == "1":
+        _background_tasks.append(asyncio.create_task(OutboxDispatcher(SessionLocal).run()))
+    if os.getenv("IMAGE_PIPELINE_ENABLED", "1") == "1":
+        _background_tasks.append(asyncio.create_task(image_pipeline.run()))
+    if os.getenv("AI_ANALYZER") == "model":
+        _background_tasks.append(asyncio.create_task(inference_server.run()))
+    if os.getenv("AI_ANALYSIS_ENABLED", "1") == "1":
+        _background_tasks.append(asyncio.create_task(AnalysisWorkerPool(SessionLocal).run()))
+    _background_tasks.append(asyncio.create_task(review_maintenance_loop(SessionLocal)))
+    _background_tasks.append(asyncio.create_task(catalog_tombstone_retention_loop(SessionLocal)))
+    if os.getenv("STATUS_STREAM_ENABLED", "1") == "1":
+        _background_tasks.append(asyncio.create_task(StatusListener().run()))
+        _background_tasks.append(asyncio.create_task(status_event_retention_loop(SessionLocal)))
+    # Balance sync needs Wallet credentials; without them points still accrue
+    service_account_file = os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE")
+    issuer_id = os.getenv("GOOGLE_PAY_ISSUER_ID")
+    if service_account_file and issuer_id and os.path.exists(service_account_file):
+        service = GooglePayService(service_account_file, issuer_id)
+        _background_tasks.append(asyncio.create_task(LoyaltySyncWorker(SessionLocal, service).run()))
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in _background_tasks:
+        task.cancel()
+    _background_tasks.clear()
+    await close_gateway()
+
 # Test database connection
 @app.get("/test-db")
 def test_database(db: Session = Depends(get_db)):
@@ -148,10 +204,14 @@ def login_user(login_data: LoginRequest, db: Session = Depends(get_db)):
 from .auth_routes import router as auth_router
 app.include_router(auth_router)
 app.include_router(google_pay_router)
-app.include_router(payments_router)
 app.include_router(brands_router)
 app.include_router(products_router)
 app.include_router(profile_router)
+app.include_router(favorites_router)
+app.include_router(revenue_router)
+app.include_router(uploads_router)
+app.include_router(reviews_router)
+app.include_router(catalog_router)
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
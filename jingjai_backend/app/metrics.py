@@ -0,0 +1,129 @@
+# app/metrics.py
+"""
+Minimal in-process metrics registry.
+
+Background workers and queues record counters, gauges and histograms here,
+and GET /metrics returns a JSON snapshot. Values are per worker process.
+"""
+import bisect
+import threading
+from typing import Dict, List, Optional, Sequence
+
+# Seconds; suits request, queue-wait and job latencies
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Counter:
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> Dict:
+        return {"type": "counter", "description": self.description, "value": self._value}
+
+class Gauge:
+    def __init__(self, name: str, description: str = ""):
+        self.name = name
+        self.description = description
+        self._value = 0.0
+
+    def set(self, value: float):
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def snapshot(self) -> Dict:
+        return {"type": "gauge", "description": self.description, "value": self._value}
+
+class Histogram:
+    """Fixed-bucket histogram with count, sum and approximate quantiles"""
+
+    def __init__(self, name: str, description: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.description = description
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation"""
+        with self._lock:
+            if not self._count:
+                return None
+            target = q * self._count
+            running = 0
+            for index, count in enumerate(self._counts):
+                running += count
+                if running >= target:
+                    return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return None
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            counts = list(self._counts)
+            count = self._count
+            total = self._sum
+        bounds = [str(bound) for bound in self.buckets] + ["+Inf"]
+        return {
+            "type": "histogram",
+            "description": self.description,
+            "count": count,
+            "sum": total,
+            "mean": total / count if count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+            "buckets": dict(zip(bounds, counts)),
+        }
+
+_registry: Dict[str, object] = {}
+_registry_lock = threading.Lock()
+
+def _get_or_create(cls, name: str, description: str, **kwargs):
+    with _registry_lock:
+        metric = _registry.get(name)
+        if metric is None:
+            metric = cls(name, description, **kwargs)
+            _registry[name] = metric
+        elif not isinstance(metric, cls):
+            raise ValueError(f"Metric {name} is already registered as {type(metric).__name__}")
+        return metric
+
+def counter(name: str, description: str = "") -> Counter:
+    return _get_or_create(Counter, name, description)
+
+def gauge(name: str, description: str = "") -> Gauge:
+    return _get_or_create(Gauge, name, description)
+
+def histogram(name: str, description: str = "", buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return _get_or_create(Histogram, name, description, buckets=buckets)
+
+def snapshot(prefix: Optional[str] = None) -> Dict[str, Dict]:
+    """All registered metrics, optionally restricted to a name prefix"""
+    with _registry_lock:
+        metrics: List = sorted(_registry.items())
+    return {
+        name: metric.snapshot()
+        for name, metric in metrics
+        if prefix is None or name.startswith(prefix)
+    }
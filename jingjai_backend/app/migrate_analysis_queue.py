@@ -0,0 +1,32 @@
+# app/migrate_analysis_queue.py
+from sqlalchemy import text
+from database import engine
+
+def migrate_analysis_queue():
+    """Add analysis queue columns and the open-rows index to authentications"""
+    
+    # CONCURRENTLY cannot run inside a transaction block, so use autocommit
+    migrations = [
+        "ALTER TABLE authentications ADD COLUMN IF NOT EXISTS analysis_attempts INTEGER NOT NULL DEFAULT 0;",
+        "ALTER TABLE authentications ADD COLUMN IF NOT EXISTS analysis_visible_at TIMESTAMP;",
+        "ALTER TABLE authentications ADD COLUMN IF NOT EXISTS analysis_error TEXT;",
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_authentications_analysis_queue
+        ON authentications (created_at)
+        WHERE status IN ('PENDING', 'PROCESSING');
+        """,
+    ]
+    
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for migration in migrations:
+                conn.execute(text(migration))
+                print(f"✅ Applied: {' '.join(migration.split())}")
+        
+        print(" Migration completed successfully!")
+        
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+
+if __name__ == "__main__":
+    migrate_analysis_queue()
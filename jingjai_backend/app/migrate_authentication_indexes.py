@@ -0,0 +1,53 @@
+# app/migrate_authentication_indexes.py
+from sqlalchemy import text
+from database import engine
+
+def migrate_authentication_indexes():
+    """Add the (user_id, created_at desc, id desc) history index to authentications"""
+    
+    # Keyset pagination needs a created_at on every row. Legacy rows without
+    # one take their completion time, else the next later row's (ids follow
+    # insertion order), so they keep their place in the history.
+    backfill = [
+        """
+        UPDATE authentications a
+        SET created_at = coalesce(
+            a.completed_at,
+            (SELECT min(b.created_at) FROM authentications b
+             WHERE b.id > a.id AND b.created_at IS NOT NULL),
+            now() AT TIME ZONE 'utc'
+        )
+        WHERE a.created_at IS NULL;
+        """,
+        "ALTER TABLE authentications ALTER COLUMN created_at SET DEFAULT (now() AT TIME ZONE 'utc');",
+        "ALTER TABLE authentications ALTER COLUMN created_at SET NOT NULL;",
+    ]
+    
+    # CONCURRENTLY cannot run inside a transaction block, so use autocommit
+    migrations = [
+        """
+        CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_authentications_user_created_id
+        ON authentications (user_id, created_at DESC, id DESC)
+        INCLUDE (brand_name, product_name, authentication_result, confidence_score,
+                 cost, status, completed_at);
+        """,
+    ]
+    
+    try:
+        with engine.begin() as conn:
+            for migration in backfill:
+                conn.execute(text(migration))
+                print(f"✅ Applied: {' '.join(migration.split())}")
+        
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for migration in migrations:
+                conn.execute(text(migration))
+                print(f"✅ Applied: {' '.join(migration.split())}")
+        
+        print(" Migration completed successfully!")
+        
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+
+if __name__ == "__main__":
+    migrate_authentication_indexes()
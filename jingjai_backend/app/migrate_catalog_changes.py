@@ -0,0 +1,70 @@
+# app/migrate_catalog_changes.py
+from sqlalchemy import text
+from database import engine
+
+TOMBSTONE_FUNCTION = """
+CREATE OR REPLACE FUNCTION catalog_tombstone() RETURNS trigger AS $$
+BEGIN
+    INSERT INTO catalog_tombstones (entity, entity_id, deleted_at)
+    VALUES (TG_ARGV[0], OLD.id, now() AT TIME ZONE 'utc');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+"""
+
+def migrate_catalog_changes():
+    """Add change tracking (updated_at, tombstones) for the catalog delta sync"""
+
+    migrations = [
+        "ALTER TABLE brands ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;",
+        "UPDATE brands SET updated_at = coalesce(created_at, now() AT TIME ZONE 'utc') WHERE updated_at IS NULL;",
+        "ALTER TABLE product_categories ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP;",
+        "UPDATE product_categories SET updated_at = now() AT TIME ZONE 'utc' WHERE updated_at IS NULL;",
+        "UPDATE products SET updated_at = coalesce(created_at, now() AT TIME ZONE 'utc') WHERE updated_at IS NULL;",
+        # Rows inserted outside the ORM must still land in the change feed
+        "ALTER TABLE brands ALTER COLUMN updated_at SET DEFAULT (now() AT TIME ZONE 'utc');",
+        "ALTER TABLE product_categories ALTER COLUMN updated_at SET DEFAULT (now() AT TIME ZONE 'utc');",
+        "ALTER TABLE products ALTER COLUMN updated_at SET DEFAULT (now() AT TIME ZONE 'utc');",
+        "CREATE TABLE IF NOT EXISTS catalog_tombstones ("
+        "id BIGSERIAL PRIMARY KEY, entity VARCHAR NOT NULL, entity_id INTEGER NOT NULL, "
+        "deleted_at TIMESTAMP NOT NULL DEFAULT (now() AT TIME ZONE 'utc'));",
+        TOMBSTONE_FUNCTION,
+        "DROP TRIGGER IF EXISTS brands_tombstone ON brands;",
+        "CREATE TRIGGER brands_tombstone AFTER DELETE ON brands "
+        "FOR EACH ROW EXECUTE FUNCTION catalog_tombstone('brand');",
+        "DROP TRIGGER IF EXISTS product_categories_tombstone ON product_categories;",
+        "CREATE TRIGGER product_categories_tombstone AFTER DELETE ON product_categories "
+        "FOR EACH ROW EXECUTE FUNCTION catalog_tombstone('category');",
+        "DROP TRIGGER IF EXISTS products_tombstone ON products;",
+        "CREATE TRIGGER products_tombstone AFTER DELETE ON products "
+        "FOR EACH ROW EXECUTE FUNCTION catalog_tombstone('product');",
+    ]
+
+    # CONCURRENTLY cannot run inside a transaction block
+    indexes = [
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_products_updated_at ON products (updated_at, id);",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_brands_updated_at ON brands (updated_at, id);",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_product_categories_updated_at "
+        "ON product_categories (updated_at, id);",
+        "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_catalog_tombstones_deleted_at "
+        "ON catalog_tombstones (deleted_at, id);",
+    ]
+
+    try:
+        with engine.begin() as conn:
+            for migration in migrations:
+                conn.execute(text(migration))
+                print(f"✅ Applied: {migration.strip().splitlines()[0]}")
+
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for migration in indexes:
+                conn.execute(text(migration))
+                print(f"✅ Applied: {migration}")
+
+        print(" Migration completed successfully!")
+
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+
+if __name__ == "__main__":
+    migrate_catalog_changes()
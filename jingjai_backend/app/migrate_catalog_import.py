@@ -0,0 +1,46 @@
+# app/migrate_catalog_import.py
+from sqlalchemy import text
+from database import engine
+
+# Same slug as catalog_import.derive_sku ("brand-slug:name-slug"), so re-running
+# the seed scripts upserts rows seeded before skus existed instead of copying
+# them. Where several rows share a derived sku only the oldest gets it.
+BACKFILL_SKUS = """
+WITH derived AS (
+    SELECT p.id,
+           trim(both '-' from regexp_replace(lower(b.name), '[^a-z0-9]+', '-', 'g')) || ':' ||
+           trim(both '-' from regexp_replace(lower(p.name), '[^a-z0-9]+', '-', 'g')) AS sku
+    FROM products p JOIN brands b ON b.id = p.brand_id
+    WHERE p.sku IS NULL AND p.name IS NOT NULL
+), first AS (
+    SELECT DISTINCT ON (sku) id, sku FROM derived ORDER BY sku, id
+)
+UPDATE products p SET sku = f.sku, updated_at = now() AT TIME ZONE 'utc'
+FROM first f
+WHERE p.id = f.id AND NOT EXISTS (SELECT 1 FROM products t WHERE t.sku = f.sku);
+"""
+
+def migrate_catalog_import():
+    """Add the (brand_id, name) unique index the catalog importer upserts on, and backfill skus"""
+    
+    # CONCURRENTLY cannot run inside a transaction block
+    migrations = [
+        "CREATE UNIQUE INDEX CONCURRENTLY IF NOT EXISTS uq_product_categories_brand_name "
+        "ON product_categories (brand_id, name);",
+        BACKFILL_SKUS,
+    ]
+    
+    try:
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            for migration in migrations:
+                conn.execute(text(migration))
+                print(f"✅ Applied: {migration.strip().splitlines()[0]}")
+        
+        print(" Migration completed successfully!")
+        
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+        print("   Merge duplicate (brand_id, name) categories first, drop the invalid index and re-run.")
+
+if __name__ == "__main__":
+    migrate_catalog_import()
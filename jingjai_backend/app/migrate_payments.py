@@ -0,0 +1,25 @@
+# app/migrate_payments.py
+from sqlalchemy import text
+from database import engine
+
+def migrate_payment_tables():
+    """Add gateway reference columns to existing payments and refunds tables"""
+    
+    migrations = [
+        "ALTER TABLE payments ADD COLUMN IF NOT EXISTS gateway_reference VARCHAR;",
+        "ALTER TABLE refunds ADD COLUMN IF NOT EXISTS gateway_reference VARCHAR;",
+    ]
+    
+    try:
+        with engine.begin() as conn:
+            for migration in migrations:
+                conn.execute(text(migration))
+                print(f"✅ Applied: {migration}")
+        
+        print(" Migration completed successfully!")
+        
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+
+if __name__ == "__main__":
+    migrate_payment_tables()
@@ -0,0 +1,38 @@
+# app/migrate_photo_hashes.py
+from sqlalchemy import text
+from database import engine
+
+UNIQUE_PHOTO = """
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'uq_photo_hashes_photo') THEN
+        ALTER TABLE photo_hashes
+            ADD CONSTRAINT uq_photo_hashes_photo UNIQUE (authentication_id, photo_index);
+    END IF;
+END $$;
+"""
+
+def migrate_photo_hashes():
+    """Add the photo duplicate column to existing authentications and one hash row per photo"""
+    
+    migrations = [
+        "ALTER TABLE authentications ADD COLUMN IF NOT EXISTS photo_duplicates JSON;",
+        # Keep the first row of any photo recorded twice before the constraint existed
+        "DELETE FROM photo_hashes a USING photo_hashes b "
+        "WHERE a.authentication_id = b.authentication_id AND a.photo_index = b.photo_index AND a.id > b.id;",
+        UNIQUE_PHOTO,
+    ]
+    
+    try:
+        with engine.begin() as conn:
+            for migration in migrations:
+                conn.execute(text(migration))
+                print(f"✅ Applied: {migration.strip().splitlines()[0]}")
+        
+        print(" Migration completed successfully!")
+        
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+
+if __name__ == "__main__":
+    migrate_photo_hashes()
@@ -0,0 +1,24 @@
+# app/migrate_product_candidates.py
+from sqlalchemy import text
+from database import engine
+
+def migrate_product_candidates():
+    """Add the catalog match column to existing authentications"""
+    
+    migrations = [
+        "ALTER TABLE authentications ADD COLUMN IF NOT EXISTS product_candidates JSON;",
+    ]
+    
+    try:
+        with engine.begin() as conn:
+            for migration in migrations:
+                conn.execute(text(migration))
+                print(f"✅ Applied: {migration}")
+        
+        print(" Migration completed successfully!")
+        
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+
+if __name__ == "__main__":
+    migrate_product_candidates()
@@ -0,0 +1,29 @@
+# app/migrate_uploads.py
+from sqlalchemy import text
+from database import engine
+
+def migrate_uploads_table():
+    """Add image pipeline columns to an existing uploads table"""
+    
+    migrations = [
+        "ALTER TABLE uploads ADD COLUMN IF NOT EXISTS width INTEGER;",
+        "ALTER TABLE uploads ADD COLUMN IF NOT EXISTS height INTEGER;",
+        "ALTER TABLE uploads ADD COLUMN IF NOT EXISTS variants JSON;",
+        "ALTER TABLE uploads ADD COLUMN IF NOT EXISTS processed_at TIMESTAMP;",
+        "ALTER TABLE uploads ADD COLUMN IF NOT EXISTS processing_error TEXT;",
+        "CREATE INDEX IF NOT EXISTS ix_uploads_unprocessed ON uploads (created_at) WHERE processed_at IS NULL;",
+    ]
+    
+    try:
+        with engine.begin() as conn:
+            for migration in migrations:
+                conn.execute(text(migration))
+                print(f"✅ Applied: {migration}")
+        
+        print(" Migration completed successfully!")
+        
+    except Exception as e:
+        print(f"❌ Migration failed: {e}")
+
+if __name__ == "__main__":
+    migrate_uploads_table()
@@ -12,7 +12,8 @@ def migrate_user_table():
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS verification_level VARCHAR DEFAULT 'Unverified';",
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS notification_preferences JSON;",
         "ALTER TABLE users ADD COLUMN IF NOT EXISTS privacy_settings JSON;",
-        "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_login TIMESTAMP;"
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS last_login TIMESTAMP;",
+        "ALTER TABLE users ADD COLUMN IF NOT EXISTS favorites_count INTEGER NOT NULL DEFAULT 0;"
     ]
     
     try:
@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Float, Text, JSON
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, DateTime, Date, ForeignKey, Float, Numeric, Text, JSON, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
@@ -27,11 +27,13 @@ class User(Base):
     notification_preferences = Column(JSON, nullable=True)  # Store as JSON
     privacy_settings = Column(JSON, nullable=True)
     last_login = Column(DateTime, nullable=True)
+    favorites_count = Column(Integer, default=0, nullable=False)  # Maintained on add/remove
     
     # Relationships
     passes = relationship("GooglePayPass", back_populates="owner")
     payments = relationship("Payment", back_populates="user")
     authentications = relationship("Authentication", back_populates="user")  # New relationship
+    favorites = relationship("Favorite", back_populates="user")
 
 class GooglePayPass(Base):
     __tablename__ = "google_pay_passes"
@@ -51,6 +53,50 @@ class GooglePayPass(Base):
 
     owner = relationship("User", back_populates="passes")
 
+class BulkJobCheckpoint(Base):
+    __tablename__ = "bulk_job_checkpoints"
+
+    # Last source row id a resumable bulk job finished, committed per batch
+    job_name = Column(String, primary_key=True)
+    last_id = Column(Integer, default=0, nullable=False)
+    processed = Column(Integer, default=0, nullable=False)
+    failed = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class PointsLedgerEntry(Base):
+    __tablename__ = "points_ledger"
+
+    # Append-only; the balance is the sum of deltas per user
+    id = Column(BigInteger, primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True, nullable=False)
+    delta = Column(Integer, nullable=False)
+    reason = Column(String, nullable=False)  # payment, refund, authentication
+    source_type = Column(String, nullable=False)
+    source_id = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # One entry per source event, so redelivered events can't double-award
+        Index("ux_points_ledger_source", "source_type", "source_id", "reason", unique=True),
+    )
+
+class LoyaltyBalance(Base):
+    __tablename__ = "loyalty_balances"
+
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    balance = Column(Integer, default=0, nullable=False)
+    version = Column(Integer, default=0, nullable=False)  # Bumped on every ledger entry
+    synced_version = Column(Integer, default=0, nullable=False)  # Last version pushed to Wallet
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    __table_args__ = (
+        Index(
+            "ix_loyalty_balances_dirty",
+            "user_id",
+            postgresql_where=(version > synced_version),
+        ),
+    )
+
 class Payment(Base):
     __tablename__ = "payments"
 
@@ -63,6 +109,7 @@ class Payment(Base):
     payment_method = Column(String)
     status = Column(String)
     description = Column(Text, nullable=True)
+    gateway_reference = Column(String, nullable=True)  # Charge id at the payment gateway
     created_at = Column(DateTime, default=datetime.utcnow)
 
     user = relationship("User", back_populates="payments")
@@ -75,11 +122,63 @@ class Refund(Base):
     refund_id = Column(String, unique=True, index=True)
     amount = Column(Float)
     reason = Column(Text, nullable=True)
-    status = Column(String)
+    status = Column(String)  # pending (sent to the gateway), completed, failed
+    gateway_reference = Column(String, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     payment = relationship("Payment")
 
+class RevenueRollup(Base):
+    __tablename__ = "revenue_rollups"
+
+    # One row per UTC day and currency, updated with each payment/refund
+    day = Column(Date, primary_key=True)
+    currency = Column(String, primary_key=True)
+    gross_amount = Column(Numeric(14, 2), default=0, nullable=False)
+    refunded_amount = Column(Numeric(14, 2), default=0, nullable=False)
+    payment_count = Column(Integer, default=0, nullable=False)
+    refund_count = Column(Integer, default=0, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class OutboxEvent(Base):
+    __tablename__ = "outbox_events"
+
+    id = Column(BigInteger, primary_key=True)
+    event_type = Column(String, nullable=False)  # e.g. payment.completed, refund.completed
+    aggregate_type = Column(String, nullable=False)  # payment, refund
+    aggregate_id = Column(String, nullable=False)  # transaction_id / refund_id
+    payload = Column(JSON, nullable=False)
+    status = Column(String, default="PENDING")  # PENDING, DELIVERED, FAILED
+    attempts = Column(Integer, default=0, nullable=False)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    delivered_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        # The dispatcher only ever scans due PENDING events in id order
+        Index(
+            "ix_outbox_events_pending",
+            "next_attempt_at",
+            "id",
+            postgresql_where=(status == "PENDING"),
+        ),
+    )
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_keys"
+
+    # Keys are scoped per endpoint so clients can reuse UUIDs across routes
+    scope = Column(String, primary_key=True)
+    key = Column(String, primary_key=True)
+    fingerprint = Column(String, nullable=False)  # sha256 of the request payload
+    status = Column(String, default="IN_PROGRESS")  # IN_PROGRESS, COMPLETED
+    response_status = Column(Integer, nullable=True)
+    response_body = Column(JSON, nullable=True)
+    locked_until = Column(DateTime, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    expires_at = Column(DateTime, index=True)
+
 class Brand(Base):
     __tablename__ = "brands"
     
@@ -93,11 +192,17 @@ class Brand(Base):
     website_url = Column(String, nullable=True)
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     products = relationship("Product", back_populates="brand")
     categories = relationship("ProductCategory", back_populates="brand")
 
+    __table_args__ = (
+        # Catalog delta sync: keyset scan of changes after a watermark
+        Index("ix_brands_updated_at", "updated_at", "id"),
+    )
+
 class ProductCategory(Base):
     __tablename__ = "product_categories"
     
@@ -106,11 +211,18 @@ class ProductCategory(Base):
     name = Column(String, index=True)  # e.g., "handbags", "backpacks", "crossbody"
     display_name = Column(String)  # e.g., "Hand Bags", "Back Packs"
     is_active = Column(Boolean, default=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     brand = relationship("Brand", back_populates="categories")
     products = relationship("Product", back_populates="category")
 
+    __table_args__ = (
+        # Upsert target for catalog imports
+        Index("uq_product_categories_brand_name", "brand_id", "name", unique=True),
+        Index("ix_product_categories_updated_at", "updated_at", "id"),
+    )
+
 class Product(Base):
     __tablename__ = "products"
     
@@ -147,6 +259,36 @@ class Product(Base):
     brand = relationship("Brand", back_populates="products")
     category = relationship("ProductCategory", back_populates="products")
 
+    __table_args__ = (
+        Index("ix_products_updated_at", "updated_at", "id"),
+    )
+
+class CatalogTombstone(Base):
+    __tablename__ = "catalog_tombstones"
+
+    # Written by an AFTER DELETE trigger on brands, product_categories and
+    # products (see migrate_catalog_changes.py), so raw SQL deletes count too
+    id = Column(BigInteger, primary_key=True)
+    entity = Column(String, nullable=False)  # brand, category, product
+    entity_id = Column(Integer, nullable=False)
+    deleted_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+    __table_args__ = (
+        Index("ix_catalog_tombstones_deleted_at", "deleted_at", "id"),
+    )
+
+class Favorite(Base):
+    __tablename__ = "favorites"
+    
+    # One row per (user, product); the composite key doubles as the lookup index
+    user_id = Column(Integer, ForeignKey("users.id"), primary_key=True)
+    product_id = Column(Integer, ForeignKey("products.id"), primary_key=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    
+    # Relationships
+    user = relationship("User", back_populates="favorites")
+    product = relationship("Product")
+
 # NEW MODEL - Authentication History
 class Authentication(Base):
     __tablename__ = "authentications"
@@ -161,10 +303,140 @@ class Authentication(Base):
     photos_uploaded = Column(JSON, nullable=True)  # Store photo URLs
     authenticator_notes = Column(Text, nullable=True)
     cost = Column(Float, nullable=True)
-    status = Column(String, default="PENDING")  # PENDING, COMPLETED, CANCELLED
-    created_at = Column(DateTime, default=datetime.utcnow)
+    status = Column(String, default="PENDING")  # PENDING, PROCESSING, COMPLETED, FAILED, CANCELLED
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
     completed_at = Column(DateTime, nullable=True)
     
+    # Analysis queue bookkeeping
+    analysis_attempts = Column(Integer, default=0, nullable=False)
+    analysis_visible_at = Column(DateTime, nullable=True)  # Lease expiry / retry time
+    analysis_error = Column(Text, nullable=True)
+    # Near-duplicate photos found in earlier authentications
+    photo_duplicates = Column(JSON, nullable=True)
+    # Catalog matches for submissions without a product: [{"product_id", "score"}]
+    product_candidates = Column(JSON, nullable=True)
+    
     # Relationships
     user = relationship("User", back_populates="authentications")
     product = relationship("Product")
+
+    __table_args__ = (
+        # Covers the profile history query: filter on user_id, newest first,
+        # with id as the tie-breaker for keyset pagination. The INCLUDE list
+        # holds the AuthenticationResponse columns so pages are index-only.
+        Index(
+            "ix_authentications_user_created_id",
+            "user_id",
+            created_at.desc(),
+            id.desc(),
+            postgresql_include=[
+                "brand_name",
+                "product_name",
+                "authentication_result",
+                "confidence_score",
+                "cost",
+                "status",
+                "completed_at",
+            ],
+        ),
+        # The analysis workers' claim query only ever touches open rows
+        Index(
+            "ix_authentications_analysis_queue",
+            "created_at",
+            postgresql_where=status.in_(["PENDING", "PROCESSING"]),
+        ),
+    )
+
+class StoredUpload(Base):
+    __tablename__ = "uploads"
+
+    sha256 = Column(String(64), primary_key=True)  # Content address
+    storage_key = Column(String, unique=True, nullable=False)
+    content_type = Column(String, nullable=False)
+    size = Column(BigInteger, nullable=False)
+    uploaded_by = Column(Integer, ForeignKey("users.id"), nullable=True)  # First uploader
+    width = Column(Integer, nullable=True)  # After EXIF orientation
+    height = Column(Integer, nullable=True)
+    variants = Column(JSON, nullable=True)  # {"thumb": key, "analysis": key}
+    processed_at = Column(DateTime, nullable=True)
+    processing_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # The image pipeline's backlog sweep
+        Index(
+            "ix_uploads_unprocessed",
+            "created_at",
+            postgresql_where=(processed_at.is_(None)),
+        ),
+    )
+
+class PhotoHash(Base):
+    __tablename__ = "photo_hashes"
+
+    id = Column(BigInteger, primary_key=True)  # Index sync watermark
+    authentication_id = Column(Integer, ForeignKey("authentications.id"), nullable=False, index=True)
+    photo_index = Column(Integer, nullable=False)  # Position in photos_uploaded
+    sha256 = Column(String(64), nullable=False)
+    phash = Column(BigInteger, nullable=False)  # 64-bit DCT hash, stored signed
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Redelivered analysis jobs must not record a photo twice
+        UniqueConstraint("authentication_id", "photo_index", name="uq_photo_hashes_photo"),
+    )
+
+class ReviewTask(Base):
+    __tablename__ = "review_tasks"
+
+    id = Column(BigInteger, primary_key=True)
+    authentication_id = Column(Integer, ForeignKey("authentications.id"), unique=True, nullable=False)
+    reason = Column(String, nullable=False)  # inconclusive, low_confidence, duplicate_photos
+    tier = Column(String, nullable=False)  # priority (paid) or standard
+    priority = Column(Integer, nullable=False)  # 0 = paid; tie-breaker after the deadline
+    due_at = Column(DateTime, nullable=False)  # SLA deadline
+    status = Column(String, default="PENDING", nullable=False)  # PENDING, CLAIMED, DONE
+    reviewer = Column(String, nullable=True)
+    claims = Column(Integer, default=0, nullable=False)  # Fencing token, bumped on every claim
+    lease_expires_at = Column(DateTime, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)
+    completed_at = Column(DateTime, nullable=True)
+    decision = Column(String, nullable=True)  # AUTHENTIC, FAKE, INCONCLUSIVE
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        # Claim order: one index range scan from the front, however deep the backlog
+        Index(
+            "ix_review_tasks_pending",
+            "due_at", "priority", "id",
+            postgresql_where=(status == "PENDING"),
+        ),
+        # The lease reaper only looks at claimed rows
+        Index(
+            "ix_review_tasks_leases",
+            "lease_expires_at",
+            postgresql_where=(status == "CLAIMED"),
+        ),
+        # Throughput stats scan recent completions
+        Index(
+            "ix_review_tasks_completed",
+            "completed_at",
+            postgresql_where=(status == "DONE"),
+        ),
+    )
+
+class AuthenticationEvent(Base):
+    __tablename__ = "authentication_events"
+
+    id = Column(BigInteger, primary_key=True)  # SSE event id; clients resume after it
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    authentication_id = Column(Integer, ForeignKey("authentications.id"), nullable=False)
+    status = Column(String, nullable=False)
+    authentication_result = Column(String, nullable=True)
+    confidence_score = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+    __table_args__ = (
+        # Resume query: one user's events after a given id
+        Index("ix_authentication_events_user_id", "user_id", "id"),
+    )
@@ -0,0 +1,281 @@
+# app/outbox.py
+"""
+Transactional outbox for payment events.
+
+Routes call enqueue_event() before committing, so an event row exists if and
+only if the payment/refund change it describes was committed. The dispatcher
+claims due events in batches with FOR UPDATE SKIP LOCKED (several workers can
+run it side by side), delivers each event to every matching local handler and
+webhook, and reschedules failures with exponential backoff and jitter. Events
+that exhaust their attempts are parked as FAILED.
+
+Delivery is at-least-once: consumers should dedupe on the event ``id``.
+"""
+import asyncio
+import hashlib
+import hmac
+import inspect
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+import httpx
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "100"))
+POLL_INTERVAL_SECONDS = float(os.getenv("OUTBOX_POLL_INTERVAL", "0.5"))
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "12"))
+# A claimed event is invisible to other dispatchers for this long
+CLAIM_LEASE = timedelta(seconds=60)
+BASE_BACKOFF_SECONDS = 2.0
+MAX_BACKOFF_SECONDS = 3600.0
+DELIVERED_RETENTION = timedelta(days=7)
+
+PENDING = "PENDING"
+DELIVERED = "DELIVERED"
+FAILED = "FAILED"
+
+Handler = Callable[[Dict[str, Any]], Union[None, Awaitable[None]]]
+
+@dataclass
+class Webhook:
+    url: str
+    event_types: List[str] = field(default_factory=lambda: ["*"])
+    secret: Optional[str] = None
+
+    def matches(self, event_type: str) -> bool:
+        return "*" in self.event_types or event_type in self.event_types
+
+_handlers: Dict[str, List[Handler]] = {}
+_webhooks: List[Webhook] = []
+
+events_enqueued = metrics.counter("outbox.events_enqueued", "Events written to the outbox")
+events_delivered = metrics.counter("outbox.events_delivered", "Events delivered to all subscribers")
+delivery_failures = metrics.counter("outbox.delivery_failures", "Delivery attempts that failed")
+events_dead = metrics.counter("outbox.events_failed", "Events parked after exhausting retries")
+pending_events = metrics.gauge("outbox.pending", "Undelivered events")
+oldest_pending_age = metrics.gauge("outbox.lag_seconds", "Age of the oldest undelivered event")
+delivery_latency = metrics.histogram("outbox.delivery_latency_seconds", "Time from enqueue to delivery")
+batch_duration = metrics.histogram("outbox.batch_seconds", "Time to deliver one claimed batch")
+
+def register_handler(event_type: str, handler: Handler):
+    """Subscribe an in-process handler; ``"*"`` receives every event"""
+    _handlers.setdefault(event_type, []).append(handler)
+
+def register_webhook(url: str, event_types: Optional[List[str]] = None, secret: Optional[str] = None):
+    """Subscribe an HTTP endpoint; deliveries are signed if ``secret`` is set"""
+    _webhooks.append(Webhook(url=url, event_types=event_types or ["*"], secret=secret))
+
+def _load_webhooks_from_env():
+    # OUTBOX_WEBHOOK_URLS="https://a.example/hook,https://b.example/hook"
+    secret = os.getenv("OUTBOX_WEBHOOK_SECRET")
+    for url in filter(None, (value.strip() for value in os.getenv("OUTBOX_WEBHOOK_URLS", "").split(","))):
+        register_webhook(url, secret=secret)
+
+_load_webhooks_from_env()
+
+def enqueue_event(db: Session, event_type: str, aggregate_type: str, aggregate_id: str, payload: Dict[str, Any]):
+    """Add an event to the caller's transaction; it is sent only if that commits"""
+    db.add(models.OutboxEvent(
+        event_type=event_type,
+        aggregate_type=aggregate_type,
+        aggregate_id=aggregate_id,
+        payload=payload,
+        status=PENDING,
+        next_attempt_at=datetime.utcnow(),
+    ))
+    events_enqueued.inc()
+
+def _backoff(attempts: int) -> timedelta:
+    delay = min(MAX_BACKOFF_SECONDS, BASE_BACKOFF_SECONDS * (2 ** (attempts - 1)))
+    return timedelta(seconds=random.uniform(delay / 2, delay))
+
+def claim_batch(db: Session, batch_size: int = BATCH_SIZE) -> List[Dict[str, Any]]:
+    """Lease up to ``batch_size`` due events and return them as plain dicts"""
+    now = datetime.utcnow()
+    events = db.query(models.OutboxEvent).filter(
+        models.OutboxEvent.status == PENDING,
+        models.OutboxEvent.next_attempt_at <= now
+    ).order_by(models.OutboxEvent.next_attempt_at, models.OutboxEvent.id).limit(
+        batch_size
+    ).with_for_update(skip_locked=True).all()
+
+    claimed = []
+    for event in events:
+        event.next_attempt_at = now + CLAIM_LEASE
+        event.attempts += 1
+        claimed.append({
+            "id": event.id,
+            "event_type": event.event_type,
+            "aggregate_type": event.aggregate_type,
+            "aggregate_id": event.aggregate_id,
+            "payload": event.payload,
+            "attempts": event.attempts,
+            "created_at": event.created_at,
+        })
+    db.commit()
+    return claimed
+
+def record_results(db: Session, delivered: List[int], failed: Dict[int, tuple]):
+    """Mark delivered events and reschedule or park failed ones"""
+    now = datetime.utcnow()
+    if delivered:
+        db.query(models.OutboxEvent).filter(
+            models.OutboxEvent.id.in_(delivered)
+        ).update({
+            "status": DELIVERED,
+            "delivered_at": now,
+            "last_error": None,
+        }, synchronize_session=False)
+
+    for event_id, (attempts, error) in failed.items():
+        if attempts >= MAX_ATTEMPTS:
+            values = {"status": FAILED, "last_error": error}
+            events_dead.inc()
+            logger.error(f"Outbox event {event_id} failed permanently: {error}")
+        else:
+            values = {"next_attempt_at": now + _backoff(attempts), "last_error": error}
+        db.query(models.OutboxEvent).filter(
+            models.OutboxEvent.id == event_id
+        ).update(values, synchronize_session=False)
+    db.commit()
+
+def refresh_lag_metrics(db: Session):
+    count, oldest = db.query(
+        func.count(models.OutboxEvent.id),
+        func.min(models.OutboxEvent.created_at)
+    ).filter(models.OutboxEvent.status == PENDING).one()
+    db.commit()
+    pending_events.set(count)
+    oldest_pending_age.set((datetime.utcnow() - oldest).total_seconds() if oldest else 0.0)
+
+def purge_delivered(db: Session) -> int:
+    removed = db.query(models.OutboxEvent).filter(
+        models.OutboxEvent.status == DELIVERED,
+        models.OutboxEvent.delivered_at < datetime.utcnow() - DELIVERED_RETENTION
+    ).delete(synchronize_session=False)
+    db.commit()
+    return removed
+
+def _envelope(event: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": event["id"],
+        "type": event["event_type"],
+        "aggregate_type": event["aggregate_type"],
+        "aggregate_id": event["aggregate_id"],
+        "created_at": event["created_at"].isoformat() if event["created_at"] else None,
+        "data": event["payload"],
+    }
+
+class OutboxDispatcher:
+    """Claims due outbox events and delivers them until stopped"""
+
+    def __init__(self, session_factory: Callable[[], Session], batch_size: int = BATCH_SIZE,
+                 poll_interval: float = POLL_INTERVAL_SECONDS):
+        self.session_factory = session_factory
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _run_db(self, fn: Callable[..., Any], *args):
+        db = self.session_factory()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    async def _deliver_webhook(self, webhook: Webhook, body: bytes):
+        headers = {"Content-Type": "application/json"}
+        if webhook.secret:
+            signature = hmac.new(webhook.secret.encode(), body, hashlib.sha256).hexdigest()
+            headers["X-Jingjai-Signature"] = f"sha256={signature}"
+        response = await self._client.post(webhook.url, content=body, headers=headers)
+        if response.status_code >= 300:
+            raise RuntimeError(f"{webhook.url} returned {response.status_code}")
+
+    async def _deliver(self, event: Dict[str, Any]) -> Optional[str]:
+        """Deliver one event to all subscribers; returns an error string on failure"""
+        envelope = _envelope(event)
+        event_type = event["event_type"]
+        errors = []
+
+        for handler in _handlers.get(event_type, []) + _handlers.get("*", []):
+            try:
+                result = handler(envelope)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                errors.append(f"{getattr(handler, '__name__', handler)}: {e}")
+
+        webhooks = [webhook for webhook in _webhooks if webhook.matches(event_type)]
+        if webhooks:
+            body = json.dumps(envelope, separators=(",", ":")).encode()
+            results = await asyncio.gather(
+                *(self._deliver_webhook(webhook, body) for webhook in webhooks),
+                return_exceptions=True
+            )
+            errors.extend(str(result) for result in results if isinstance(result, Exception))
+
+        return "; ".join(errors) if errors else None
+
+    async def run_once(self) -> int:
+        """Claim and deliver one batch; returns the number of events claimed"""
+        events = await asyncio.to_thread(self._run_db, claim_batch, self.batch_size)
+        if not events:
+            return 0
+
+        started = time.perf_counter()
+        outcomes = await asyncio.gather(*(self._deliver(event) for event in events))
+
+        delivered, failed = [], {}
+        now = datetime.utcnow()
+        for event, error in zip(events, outcomes):
+            if error is None:
+                delivered.append(event["id"])
+                events_delivered.inc()
+                if event["created_at"]:
+                    delivery_latency.observe((now - event["created_at"]).total_seconds())
+            else:
+                failed[event["id"]] = (event["attempts"], error[:1000])
+                delivery_failures.inc()
+
+        await asyncio.to_thread(self._run_db, record_results, delivered, failed)
+        batch_duration.observe(time.perf_counter() - started)
+        return len(events)
+
+    async def run(self):
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(10.0, connect=3.0),
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=10),
+        )
+        last_metrics = last_purge = 0.0
+        try:
+            while True:
+                try:
+                    claimed = await self.run_once()
+                    if time.monotonic() - last_metrics > 5:
+                        await asyncio.to_thread(self._run_db, refresh_lag_metrics)
+                        last_metrics = time.monotonic()
+                    if time.monotonic() - last_purge > 3600:
+                        await asyncio.to_thread(self._run_db, purge_delivered)
+                        last_purge = time.monotonic()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    logger.error(f"Outbox dispatcher error: {e}")
+                    claimed = 0
+                # A full batch means there is probably more waiting
+                if claimed < self.batch_size:
+                    await asyncio.sleep(self.poll_interval)
+        finally:
+            await self._client.aclose()
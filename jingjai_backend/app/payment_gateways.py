@@ -0,0 +1,217 @@
+# app/payment_gateways.py
+"""
+Payment gateway abstraction used by the payments routes.
+
+Gateways are async and share one pooled HTTP client each, so a slow gateway
+never blocks the event loop and connections are reused across requests.
+FakeGateway runs entirely in-process with configurable latency and failure
+rate, for local development and offline load testing.
+"""
+import asyncio
+import logging
+import os
+import random
+from abc import ABC, abstractmethod
+from typing import Dict, Optional
+
+import httpx
+from pydantic import BaseModel
+
+from .ids import new_id
+
+logger = logging.getLogger(__name__)
+
+# Strict per-phase timeouts; a payment call should fail fast rather than hang
+GATEWAY_TIMEOUT = httpx.Timeout(connect=3.0, read=10.0, write=5.0, pool=2.0)
+GATEWAY_LIMITS = httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=30.0)
+
+class GatewayError(Exception):
+    """Raised when a gateway cannot be reached or returns an unexpected response"""
+
+class ChargeResult(BaseModel):
+    success: bool
+    reference: Optional[str] = None  # Gateway-side id, needed for refunds
+    status: str
+    message: Optional[str] = None
+
+class RefundResult(BaseModel):
+    success: bool
+    reference: Optional[str] = None
+    status: str
+    message: Optional[str] = None
+
+class PaymentGateway(ABC):
+    """Interface every payment gateway implements"""
+
+    name = "base"
+
+    @abstractmethod
+    async def charge(self, token: str, amount: float, currency: str, transaction_id: str) -> ChargeResult:
+        """Charge a Google Pay token; ``transaction_id`` is our id for the payment"""
+
+    @abstractmethod
+    async def refund(self, reference: str, amount: float, currency: str, refund_id: str) -> RefundResult:
+        """Refund part or all of the charge identified by its gateway ``reference``"""
+
+    @abstractmethod
+    def tokenization_parameters(self) -> Dict[str, str]:
+        """Google Pay ``tokenizationSpecification.parameters`` for this gateway"""
+
+    async def close(self):
+        pass
+
+class StripeGateway(PaymentGateway):
+    """Stripe over its REST API with a shared async connection pool"""
+
+    name = "stripe"
+
+    def __init__(self, secret_key: str, publishable_key: Optional[str] = None,
+                 api_version: str = "2018-10-31", base_url: str = "https://api.stripe.com/v1"):
+        self.publishable_key = publishable_key
+        self.api_version = api_version
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            auth=(secret_key, ""),
+            headers={"Stripe-Version": api_version},
+            timeout=GATEWAY_TIMEOUT,
+            limits=GATEWAY_LIMITS,
+        )
+
+    async def _post(self, path: str, data: Dict, idempotency_key: str) -> Dict:
+        try:
+            response = await self._client.post(path, data=data, headers={"Idempotency-Key": idempotency_key})
+        except httpx.HTTPError as e:
+            raise GatewayError(f"Stripe request failed: {e}") from e
+
+        if response.status_code >= 500:
+            raise GatewayError(f"Stripe returned {response.status_code}")
+        try:
+            return response.json()
+        except ValueError as e:
+            raise GatewayError("Stripe returned a non-JSON response") from e
+
+    async def charge(self, token: str, amount: float, currency: str, transaction_id: str) -> ChargeResult:
+        body = await self._post(
+            "/payment_intents",
+            {
+                "amount": int(round(amount * 100)),  # Stripe uses cents
+                "currency": currency.lower(),
+                "payment_method_data[type]": "card",
+                "payment_method_data[card][token]": token,
+                "confirm": "true",
+                "metadata[transaction_id]": transaction_id,
+            },
+            idempotency_key=transaction_id,
+        )
+        if "error" in body:
+            return ChargeResult(success=False, status="failed", message=body["error"].get("message"))
+        return ChargeResult(
+            success=body.get("status") == "succeeded",
+            reference=body.get("id"),
+            status=body.get("status", "unknown"),
+        )
+
+    async def refund(self, reference: str, amount: float, currency: str, refund_id: str) -> RefundResult:
+        body = await self._post(
+            "/refunds",
+            {"payment_intent": reference, "amount": int(round(amount * 100))},
+            idempotency_key=refund_id,
+        )
+        if "error" in body:
+            return RefundResult(success=False, status="failed", message=body["error"].get("message"))
+        return RefundResult(
+            success=body.get("status") in ("succeeded", "pending"),
+            reference=body.get("id"),
+            status=body.get("status", "unknown"),
+        )
+
+    def tokenization_parameters(self) -> Dict[str, str]:
+        return {
+            "gateway": "stripe",
+            "stripe:version": self.api_version,
+            "stripe:publishableKey": self.publishable_key or "",
+        }
+
+    async def close(self):
+        await self._client.aclose()
+
+class FakeGateway(PaymentGateway):
+    """
+    In-process gateway for development and load tests.
+
+    Every call sleeps for ``latency`` plus up to ``jitter`` seconds and fails
+    with probability ``failure_rate``. A token of ``"decline"`` is always
+    declined so client error paths can be exercised.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self._random = random.Random(seed)
+        self.charges = 0
+        self.refunds = 0
+
+    async def _delay(self):
+        delay = self.latency + (self._random.random() * self.jitter if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _fails(self) -> bool:
+        return self.failure_rate > 0 and self._random.random() < self.failure_rate
+
+    async def charge(self, token: str, amount: float, currency: str, transaction_id: str) -> ChargeResult:
+        await self._delay()
+        self.charges += 1
+        if token == "decline" or self._fails():
+            return ChargeResult(success=False, status="declined", message="Card declined")
+        return ChargeResult(success=True, reference=new_id("fake_ch"), status="succeeded")
+
+    async def refund(self, reference: str, amount: float, currency: str, refund_id: str) -> RefundResult:
+        await self._delay()
+        self.refunds += 1
+        if self._fails():
+            return RefundResult(success=False, status="failed", message="Refund failed")
+        return RefundResult(success=True, reference=new_id("fake_re"), status="succeeded")
+
+    def tokenization_parameters(self) -> Dict[str, str]:
+        return {"gateway": "example", "gatewayMerchantId": "exampleGatewayMerchantId"}
+
+_gateway: Optional[PaymentGateway] = None
+
+def create_gateway_from_env() -> PaymentGateway:
+    """Build the gateway named by PAYMENT_GATEWAY (``stripe`` or ``fake``)"""
+    name = os.getenv("PAYMENT_GATEWAY", "stripe" if os.getenv("STRIPE_SECRET_KEY") else "fake")
+    if name == "stripe":
+        return StripeGateway(
+            secret_key=os.environ["STRIPE_SECRET_KEY"],
+            publishable_key=os.getenv("STRIPE_PUBLIC_KEY"),
+        )
+    if name == "fake":
+        return FakeGateway(
+            latency=float(os.getenv("FAKE_GATEWAY_LATENCY", "0")),
+            jitter=float(os.getenv("FAKE_GATEWAY_JITTER", "0")),
+            failure_rate=float(os.getenv("FAKE_GATEWAY_FAILURE_RATE", "0")),
+        )
+    raise ValueError(f"Unknown PAYMENT_GATEWAY: {name}")
+
+def get_gateway() -> PaymentGateway:
+    """FastAPI dependency returning the process-wide gateway"""
+    global _gateway
+    if _gateway is None:
+        _gateway = create_gateway_from_env()
+        logger.info(f"Using payment gateway: {_gateway.name}")
+    return _gateway
+
+def set_gateway(gateway: Optional[PaymentGateway]):
+    """Swap the process-wide gateway (load tests, local tooling)"""
+    global _gateway
+    _gateway = gateway
+
+async def close_gateway():
+    global _gateway
+    if _gateway is not None:
+        await _gateway.close()
+        _gateway = None
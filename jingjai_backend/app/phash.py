@@ -0,0 +1,356 @@
+# app/phash.py
+"""
+Perceptual hashes of authentication photos and a near-duplicate index.
+
+Each photo gets a 64-bit DCT hash (pHash): the photo is reduced to 32x32
+grayscale, a 2-D DCT is taken, and each of the 8x8 lowest frequencies is
+compared with their median. Re-encoding, resizing and mild edits move the
+hash only a few bits, so "same photo" means Hamming distance <= k.
+
+photo_hashes is the source of truth. PhotoHashIndex holds every hash in
+NumPy arrays and answers queries with a vectorized XOR + popcount scan over
+8 bytes per photo, a few milliseconds per million per query photo. The bulk
+of the index is a memory-mapped snapshot file (loaded without copying). Rows
+added since the snapshot are pulled from the table by id watermark, so
+several API processes each stay current.
+
+Snapshot from the jingjai_backend directory:
+    python -m app.phash snapshot
+"""
+import argparse
+import io
+import logging
+import os
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from PIL import Image
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .storage import UPLOAD_DIR, Storage, content_key, sha256_of_key
+
+logger = logging.getLogger(__name__)
+
+INDEX_PATH = os.getenv("PHOTO_HASH_INDEX_PATH", os.path.join(UPLOAD_DIR, "photo_hashes.idx"))
+MAX_DISTANCE = int(os.getenv("PHOTO_HASH_MAX_DISTANCE", "6"))
+SCAN_BLOCK = 1 << 15  # Hashes per vectorized step; keeps the scratch arrays in L2
+AUTO_SNAPSHOT_ROWS = 200_000  # Rewrite the snapshot once this many rows sit in the tail
+REFRESH_LOOKBACK = 1000
+
+_MAGIC = b"JJPHASH1"
+# File layout: header, then `count` hashes, `count` authentication ids and
+# `count` photo_hashes ids. Hashes are contiguous so a scan streams exactly
+# 8 bytes per photo.
+_HEADER = np.dtype([("magic", "S8"), ("count", "<u8"), ("max_id", "<i8")])
+
+query_seconds = metrics.histogram(
+    "phash.query_seconds", "Near-duplicate lookup time per authentication",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25)
+)
+indexed_hashes = metrics.gauge("phash.indexed", "Photo hashes in the in-memory index")
+duplicates_found = metrics.counter("phash.duplicates", "Photos matching an earlier authentication")
+
+def _dct_matrix(n: int) -> np.ndarray:
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    matrix = np.cos(np.pi * (2 * i + 1) * k / (2 * n)) * np.sqrt(2 / n)
+    matrix[0] /= np.sqrt(2)
+    return matrix.astype(np.float32)
+
+_DCT32 = _dct_matrix(32)
+_BIT_WEIGHTS = (np.uint64(1) << np.arange(64, dtype=np.uint64))
+
+def phash64(source: Union[str, bytes]) -> int:
+    with Image.open(io.BytesIO(source) if isinstance(source, bytes) else source) as img:
+        img.draft("L", (64, 64))
+        pixels = np.asarray(img.convert("L").resize((32, 32), Image.LANCZOS), dtype=np.float32)
+    coefficients = (_DCT32 @ pixels @ _DCT32.T)[:8, :8].ravel()
+    # Median without the DC term, which only encodes overall brightness
+    bits = coefficients > np.median(coefficients[1:])
+    return int((_BIT_WEIGHTS[bits]).sum(dtype=np.uint64))
+
+def to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= 1 << 63 else value
+
+def to_unsigned(value: int) -> int:
+    return value & 0xFFFFFFFFFFFFFFFF
+
+def popcount64(values: np.ndarray, out: Optional[np.ndarray] = None) -> np.ndarray:
+    if hasattr(np, "bitwise_count"):  # NumPy >= 2.0
+        return np.bitwise_count(values, out=out)
+    return _POPCOUNT8[values.view(np.uint8)].reshape(values.shape + (8,)).sum(axis=-1, dtype=np.uint8, out=out)
+
+_POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+class PhotoHashIndex:
+    def __init__(self):
+        self._hashes = np.zeros(0, dtype=np.uint64)  # Snapshot (memory-mapped)
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._row_ids = np.zeros(0, dtype=np.int64)
+        # Rows since the snapshot, in arrays grown by doubling
+        self._tail_hashes = np.zeros(1024, dtype=np.uint64)
+        self._tail_ids = np.zeros(1024, dtype=np.int64)
+        self._tail_row_ids = np.zeros(1024, dtype=np.int64)
+        self._tail_len = 0
+        self._max_id = 0
+        # Ids seen within REFRESH_LOOKBACK of the watermark; sequence values
+        # can commit out of order, so refresh re-reads that window
+        self._recent_ids = set()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._hashes) + self._tail_len
+
+    @property
+    def tail_size(self) -> int:
+        return self._tail_len
+
+    @property
+    def max_id(self) -> int:
+        return self._max_id
+
+    @staticmethod
+    def _map(path: str):
+        header = np.fromfile(path, dtype=_HEADER, count=1)[0]
+        if header["magic"] != _MAGIC:
+            raise ValueError(f"{path} is not a photo hash index")
+        count = int(header["count"])
+        if count:
+            offset = _HEADER.itemsize
+            hashes = np.memmap(path, dtype=np.uint64, mode="r", offset=offset, shape=(count,))
+            ids = np.memmap(path, dtype=np.int64, mode="r", offset=offset + 8 * count, shape=(count,))
+            row_ids = np.memmap(path, dtype=np.int64, mode="r", offset=offset + 16 * count, shape=(count,))
+        else:
+            hashes = np.zeros(0, dtype=np.uint64)
+            ids = row_ids = np.zeros(0, dtype=np.int64)
+        return hashes, ids, row_ids, int(header["max_id"])
+
+    def load(self, path: str = INDEX_PATH) -> bool:
+        """Map a snapshot file read-only; returns False if there is none"""
+        if not os.path.exists(path):
+            return False
+        hashes, ids, row_ids, max_id = self._map(path)
+        with self._lock:
+            self._hashes, self._ids, self._row_ids = hashes, ids, row_ids
+            # Anything newer than the snapshot is pulled again by refresh()
+            self._tail_len = 0
+            self._max_id = max_id
+            tail = np.asarray(row_ids[-REFRESH_LOOKBACK:])
+            self._recent_ids = set(tail[tail > max_id - REFRESH_LOOKBACK].tolist())
+        indexed_hashes.set(len(self))
+        return True
+
+    def save(self, path: str = INDEX_PATH, min_tail: int = 0) -> bool:
+        """
+        Write the whole index as a new snapshot (atomic rename) and switch to it.
+
+        The saved rows then leave the tail. Saves are serialized; with
+        ``min_tail`` a save is skipped (False) unless the tail is still that
+        long once it gets its turn, so racing auto-saves write only once.
+        """
+        with self._save_lock:
+            with self._lock:
+                n = self._tail_len
+                if n < min_tail:
+                    return False
+                sections = [
+                    (self._hashes, self._tail_hashes[:n].copy()),
+                    (self._ids, self._tail_ids[:n].copy()),
+                    (self._row_ids, self._tail_row_ids[:n].copy()),
+                ]
+                max_id = self._max_id
+            # Rows added from here on are not in the file; count only what is written
+            count = len(sections[0][0]) + n
+            header = np.array([(_MAGIC, count, max_id)], dtype=_HEADER)
+
+            directory = os.path.dirname(path) or "."
+            os.makedirs(directory, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=os.path.basename(path) + ".", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    header.tofile(f)
+                    for snapshot, tail in sections:
+                        np.ascontiguousarray(snapshot).tofile(f)
+                        tail.tofile(f)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+
+            hashes, ids, row_ids, _ = self._map(path)
+            with self._lock:
+                # Fresh tail arrays: searches may still be scanning views of the old ones
+                remaining = self._tail_len - n
+                capacity = max(1024, 2 * remaining)
+                tail_hashes = np.zeros(capacity, dtype=np.uint64)
+                tail_ids = np.zeros(capacity, dtype=np.int64)
+                tail_row_ids = np.zeros(capacity, dtype=np.int64)
+                tail_hashes[:remaining] = self._tail_hashes[n:self._tail_len]
+                tail_ids[:remaining] = self._tail_ids[n:self._tail_len]
+                tail_row_ids[:remaining] = self._tail_row_ids[n:self._tail_len]
+                self._hashes, self._ids, self._row_ids = hashes, ids, row_ids
+                self._tail_hashes, self._tail_ids, self._tail_row_ids = tail_hashes, tail_ids, tail_row_ids
+                self._tail_len = remaining
+        return True
+
+    def add(self, rows: Sequence[Tuple[int, int, int]]):
+        """Append (photo_hashes.id, unsigned hash, authentication_id) rows not seen yet"""
+        with self._lock:
+            floor = self._max_id - REFRESH_LOOKBACK
+            rows = [row for row in rows if row[0] > floor and row[0] not in self._recent_ids]
+            if not rows:
+                return
+            needed = self._tail_len + len(rows)
+            if needed > len(self._tail_hashes):
+                capacity = max(needed, 2 * len(self._tail_hashes))
+                self._tail_hashes = np.resize(self._tail_hashes, capacity)
+                self._tail_ids = np.resize(self._tail_ids, capacity)
+                self._tail_row_ids = np.resize(self._tail_row_ids, capacity)
+            self._tail_row_ids[self._tail_len:needed] = [row[0] for row in rows]
+            self._tail_hashes[self._tail_len:needed] = [row[1] for row in rows]
+            self._tail_ids[self._tail_len:needed] = [row[2] for row in rows]
+            self._tail_len = needed
+
+            self._max_id = max(self._max_id, max(row[0] for row in rows))
+            self._recent_ids.update(row[0] for row in rows)
+            if len(self._recent_ids) > 4 * REFRESH_LOOKBACK:
+                floor = self._max_id - REFRESH_LOOKBACK
+                self._recent_ids = {row_id for row_id in self._recent_ids if row_id > floor}
+        indexed_hashes.set(len(self))
+
+    def refresh(self, db: Session, batch_size: int = 50_000) -> int:
+        """Pull rows other processes added since our watermark"""
+        added = 0
+        after_id = self._max_id - REFRESH_LOOKBACK
+        while True:
+            rows = db.query(models.PhotoHash.id, models.PhotoHash.phash, models.PhotoHash.authentication_id).filter(
+                models.PhotoHash.id > after_id
+            ).order_by(models.PhotoHash.id).limit(batch_size).all()
+            if not rows:
+                break
+            before = len(self)
+            self.add([(row.id, to_unsigned(row.phash), row.authentication_id) for row in rows])
+            added += len(self) - before
+            after_id = rows[-1].id
+        db.commit()
+        return added
+
+    def search(self, queries: Sequence[int], max_distance: int = MAX_DISTANCE) -> List[List[Tuple[int, int]]]:
+        """For each query hash, (authentication_id, distance) pairs within max_distance, nearest first"""
+        q = np.array(queries, dtype=np.uint64)
+        matches: List[List[Tuple[int, int]]] = [[] for _ in queries]
+        with self._lock:
+            segments = [(self._hashes, self._ids),
+                        (self._tail_hashes[:self._tail_len], self._tail_ids[:self._tail_len])]
+        # Per-call scratch sized to stay in cache; every step writes into it
+        xor = np.empty(SCAN_BLOCK, dtype=np.uint64)
+        counts = np.empty(SCAN_BLOCK, dtype=np.uint8)
+        hits = np.empty(SCAN_BLOCK, dtype=bool)
+        for hashes, ids in segments:
+            for start in range(0, len(hashes), SCAN_BLOCK):
+                block = hashes[start:start + SCAN_BLOCK]
+                n = len(block)
+                for query_index, query in enumerate(q):
+                    np.bitwise_xor(block, query, out=xor[:n])
+                    popcount64(xor[:n], out=counts[:n])
+                    np.less_equal(counts[:n], max_distance, out=hits[:n])
+                    if not hits[:n].any():
+                        continue
+                    for column in np.flatnonzero(hits[:n]):
+                        matches[query_index].append((int(ids[start + column]), int(counts[column])))
+        return [sorted(found, key=lambda match: match[1]) for found in matches]
+
+photo_hash_index = PhotoHashIndex()
+_index_ready = False
+_index_lock = threading.Lock()
+
+def _ensure_loaded(db: Session):
+    global _index_ready
+    if _index_ready:
+        return
+    with _index_lock:
+        if not _index_ready:
+            try:
+                photo_hash_index.load()
+            except Exception as e:
+                logger.warning(f"Ignoring unreadable photo hash snapshot: {e}")
+            photo_hash_index.refresh(db)
+            _index_ready = True
+
+def _hash_source(storage: Storage, key: str) -> Union[str, bytes]:
+    # The thumbnail hashes the same as the original and decodes far faster
+    thumb = content_key(sha256_of_key(key), "jpg", variant="thumb")
+    if storage.exists(thumb):
+        key = thumb
+    return storage.local_path(key) or storage.read_bytes(key)
+
+def check_photos(db: Session, storage: Storage, authentication_id: int, photo_keys: List[str],
+                 max_distance: int = MAX_DISTANCE) -> List[Dict]:
+    """
+    Hash an authentication's photos, record them and return earlier near-duplicates.
+
+    Hashes are committed before the lookup, so two concurrent submissions
+    reusing the same photos each see the other.
+    """
+    _ensure_loaded(db)
+
+    existing = {row.photo_index: to_unsigned(row.phash) for row in db.query(models.PhotoHash).filter(
+        models.PhotoHash.authentication_id == authentication_id
+    )}
+    hashes, new_rows = [], []
+    for photo_index, key in enumerate(photo_keys):
+        if photo_index not in existing:
+            value = phash64(_hash_source(storage, key))
+            new_rows.append({"authentication_id": authentication_id, "photo_index": photo_index,
+                             "sha256": sha256_of_key(key), "phash": to_signed(value)})
+            existing[photo_index] = value
+        hashes.append(existing[photo_index])
+    if new_rows:
+        # A concurrent run for the same authentication may have recorded them first; same photos, same hashes
+        db.execute(insert(models.PhotoHash).values(new_rows).on_conflict_do_nothing(
+            index_elements=["authentication_id", "photo_index"]
+        ))
+    db.commit()
+    photo_hash_index.refresh(db)
+
+    started = time.perf_counter()
+    results = photo_hash_index.search(hashes, max_distance) if hashes else []
+    query_seconds.observe(time.perf_counter() - started)
+
+    duplicates = []
+    for photo_index, found in enumerate(results):
+        seen = set()
+        for other_id, distance in found:  # Nearest first, so the first hit per authentication wins
+            if other_id != authentication_id and other_id not in seen:
+                seen.add(other_id)
+                duplicates.append({"photo": photo_index, "authentication_id": other_id, "distance": distance})
+    duplicates_found.inc(len({d["photo"] for d in duplicates}))
+
+    if photo_hash_index.tail_size >= AUTO_SNAPSHOT_ROWS:
+        photo_hash_index.save(min_tail=AUTO_SNAPSHOT_ROWS)
+    return duplicates
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Photo hash index maintenance")
+    parser.add_argument("command", choices=["snapshot"])
+    parser.add_argument("--path", default=INDEX_PATH)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        photo_hash_index.load(args.path)
+        added = photo_hash_index.refresh(db)
+        photo_hash_index.save(args.path)
+        print(f"✅ {len(photo_hash_index)} hashes ({added} new) written to {args.path}")
+    finally:
+        db.close()
@@ -1,23 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Query
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 from typing import Optional
 from .database import get_db
-from .models import Product, Brand, ProductCategory
-from .schemas import ProductWithBrand, ProductsResponse
+from .models import Product, Brand, ProductCategory, User
+from .schemas import ProductCandidate, ProductSuggestions, ProductWithBrand, ProductsResponse
+from .auth_utils import get_current_user, get_optional_current_user
+from .favorites import annotate_favorites
+from .serialization import JSONBytesResponse, Projection, product_dicts, product_fields
+from .storage import Storage, get_storage
+from .uploads import receive_multipart, record_uploads, to_uploaded_photo
+from .embeddings import suggest_products
 
 router = APIRouter(prefix="/products", tags=["products"])
 
-@router.get("/{product_id}", response_model=ProductWithBrand)
-def get_product_by_id(product_id: int, db: Session = Depends(get_db)):
-    """Get a specific product with brand information"""
-    product = db.query(Product).filter(Product.id == product_id).first()
-    
-    if not product:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    return product
-
 @router.get("/search", response_model=ProductsResponse)
 def search_products(
     q: str = Query(..., description="Search query"),
@@ -27,6 +24,8 @@ def search_products(
     max_price: Optional[float] = Query(None, description="Maximum price filter"),
     limit: Optional[int] = Query(50, description="Limit number of results"),
     offset: Optional[int] = Query(0, description="Offset for pagination"),
+    projection: Projection = Depends(product_fields),
+    current_user: Optional[User] = Depends(get_optional_current_user),
     db: Session = Depends(get_db)
 ):
     """Search products across all brands or within a specific brand"""
@@ -60,9 +59,67 @@ def search_products(
     total = query.count()
     
     # Apply pagination
-    products = query.offset(offset).limit(limit).all()
+    rows = query.with_entities(*projection.columns).offset(offset).limit(limit)
     
-    return ProductsResponse(
-        products=products,
-        total=total
-    )
+    return JSONBytesResponse({
+        "products": product_dicts(db, current_user, rows, projection),
+        "total": total,
+        "brand": None
+    })
+
+@router.get("/{product_id}", response_model=ProductWithBrand)
+def get_product_by_id(
+    product_id: int,
+    current_user: Optional[User] = Depends(get_optional_current_user),
+    db: Session = Depends(get_db)
+):
+    """Get a specific product with brand information"""
+    product = db.query(Product).filter(Product.id == product_id).first()
+    
+    if not product:
+        raise HTTPException(status_code=404, detail="Product not found")
+    
+    response = ProductWithBrand.model_validate(product)
+    annotate_favorites(db, current_user, [response])
+    
+    return response
+
+@router.post("/identify", response_model=ProductSuggestions)
+async def identify_product(
+    request: Request,
+    limit: int = Query(5, ge=1, le=20, description="Maximum number of candidates"),
+    current_user: User = Depends(get_current_user),
+    storage: Storage = Depends(get_storage),
+    db: Session = Depends(get_db)
+):
+    """
+    Suggest catalog products for one photo (multipart/form-data).
+
+    Used when an authentication starts from the camera without a product.
+    The photo is stored like any upload, so its URL can be reused in the
+    authentication that follows.
+    """
+    result = await receive_multipart(request, storage, max_files=1)
+    if not result.files:
+        raise HTTPException(status_code=400, detail="No photo in request")
+    upload = result.files[0]
+    if upload.stored is None:
+        raise HTTPException(status_code=422, detail=upload.error)
+
+    record_uploads(db, current_user.id, [upload.stored])
+    db.commit()
+    matches = await asyncio.to_thread(suggest_products, storage, [upload.stored.key], limit)
+
+    products = {
+        product.id: product
+        for product in db.query(Product).filter(
+            Product.id.in_([product_id for product_id, _ in matches]),
+            Product.is_active == True
+        )
+    }
+    candidates = [
+        ProductCandidate(product=ProductWithBrand.model_validate(products[product_id]), score=score)
+        for product_id, score in matches if product_id in products
+    ]
+    annotate_favorites(db, current_user, [candidate.product for candidate in candidates])
+    return ProductSuggestions(photo=to_uploaded_photo(storage, upload), candidates=candidates)
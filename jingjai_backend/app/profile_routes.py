@@ -1,9 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import func, desc
+from sqlalchemy import func, desc, tuple_
 from typing import Optional, List
 from datetime import datetime, timedelta
-from .database import get_db
+from .database import SessionLocal, get_db
 from .models import User, Authentication, Product
 from .schemas import (
     UserProfile, 
@@ -11,14 +12,37 @@ from .schemas import (
     UserStats, 
     AuthenticationResponse,
     AuthenticationCreate,
+    AuthenticationSubmission,
     UserSettings,
     NotificationSettings,
     PrivacySettings
 )
-from .auth_utils import get_current_user
+from .auth_utils import get_current_user, get_current_user_id
+from .utils import encode_cursor, decode_cursor
+from .storage import Storage, get_storage
+from .uploads import receive_multipart, record_uploads, to_uploaded_photo
+from .images import image_pipeline
+from .status_stream import TooManyStreams, record_status_change, status_broker, stream_events
 
 router = APIRouter(prefix="/profile", tags=["profile"])
 
+MIN_AUTHENTICATION_PHOTOS = 5
+MAX_AUTHENTICATION_PHOTOS = 8
+
+# Only the columns AuthenticationResponse renders; skips the photos_uploaded
+# JSON and notes so history pages can be served from the covering index.
+AUTHENTICATION_RESPONSE_COLUMNS = (
+    Authentication.id,
+    Authentication.brand_name,
+    Authentication.product_name,
+    Authentication.authentication_result,
+    Authentication.confidence_score,
+    Authentication.cost,
+    Authentication.status,
+    Authentication.created_at,
+    Authentication.completed_at,
+)
+
 @router.get("/me", response_model=UserProfile)
 async def get_current_user_profile(
     current_user: User = Depends(get_current_user),
@@ -53,24 +77,44 @@ async def update_profile(
         db.rollback()
         raise HTTPException(status_code=400, detail="Failed to update profile")
 
-@router.post("/upload-photo")
+# The body is parsed by receive_multipart, not FastAPI, so describe it for the schema
+PROFILE_PHOTO_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+@router.post("/upload-photo", openapi_extra=PROFILE_PHOTO_BODY)
 async def upload_profile_photo(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user),
+    storage: Storage = Depends(get_storage),
     db: Session = Depends(get_db)
 ):
-    """Upload and update profile picture"""
-    
-    # Validate file type
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="File must be an image")
+    """Upload and update profile picture (multipart/form-data, one image)"""
     
-    # Save file logic (implement based on your storage solution)
-    # This is a placeholder - you'd implement actual file storage
-    file_url = f"https://your-storage.com/profiles/{current_user.id}_{file.filename}"
+    # Streamed straight into storage; type and size are checked as it arrives
+    result = await receive_multipart(request, storage, max_files=1, concurrent_writes=True)
+    if not result.files:
+        raise HTTPException(status_code=400, detail="No file in request")
+    upload = result.files[0]
+    if upload.stored is None:
+        raise HTTPException(status_code=400, detail=upload.error)
     
+    file_url = storage.url(upload.stored.key)
+    record_uploads(db, current_user.id, [upload.stored])
     current_user.profile_picture = file_url
     db.commit()
+    image_pipeline.submit_uploads(db, [upload.stored])
     
     return {"profile_picture": file_url}
 
@@ -92,8 +136,8 @@ async def get_user_stats(
         Authentication.status == "COMPLETED"
     ).scalar() or 0
     
-    # Get favorite items count (you'd need to implement favorites)
-    favorite_items = 0  # Placeholder
+    # Favorites count is maintained on add/remove, no scan needed
+    favorite_items = current_user.favorites_count or 0
     
     # Calculate member since
     member_since = current_user.created_at.strftime("%Y")
@@ -107,19 +151,78 @@ async def get_user_stats(
 
 @router.get("/authentications", response_model=List[AuthenticationResponse])
 async def get_authentication_history(
+    response: Response,
     skip: int = 0,
-    limit: int = 20,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="Keyset cursor from the X-Next-Cursor header"),
     current_user: User = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
-    """Get user's authentication history"""
+    """Get user's authentication history
     
-    authentications = db.query(Authentication).filter(
+    Pass the X-Next-Cursor value from the previous page as ``cursor`` to page
+    by keyset instead of ``skip``; the header is omitted on the last page.
+    """
+    
+    query = db.query(*AUTHENTICATION_RESPONSE_COLUMNS).filter(
         Authentication.user_id == current_user.id
-    ).order_by(desc(Authentication.created_at)).offset(skip).limit(limit).all()
+    )
+    
+    if cursor is not None:
+        position = decode_cursor(cursor)
+        if position is None:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        query = query.filter(
+            tuple_(Authentication.created_at, Authentication.id) < position
+        )
+    elif skip:
+        query = query.offset(skip)
+    
+    authentications = query.order_by(
+        desc(Authentication.created_at), desc(Authentication.id)
+    ).limit(limit).all()
+    
+    if len(authentications) == limit:
+        last = authentications[-1]
+        response.headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
     
     return authentications
 
+@router.get("/authentications/events")
+async def stream_authentication_events(
+    request: Request,
+    last_event_id: Optional[str] = Header(None, alias="Last-Event-ID"),
+    user_id: int = Depends(get_current_user_id)
+):
+    """
+    Server-Sent Events stream of the current user's authentication status changes.
+
+    Each event is {authentication_id, status, authentication_result,
+    confidence_score, created_at}. Comment lines are sent as heartbeats.
+    Reconnect with Last-Event-ID to receive what was missed.
+    """
+    
+    resume_after = int(last_event_id) if last_event_id and last_event_id.isdigit() else None
+    if not status_broker.has_room(user_id):
+        raise HTTPException(status_code=429, detail="Too many open status streams")
+    
+    # Subscribe only once the body runs, so a response that never starts can't leak a slot
+    async def body():
+        try:
+            subscription = status_broker.subscribe(user_id)
+        except TooManyStreams:
+            return  # Lost the last slot to a concurrent stream since the check above
+        try:
+            async for chunk in stream_events(subscription, SessionLocal, resume_after, request.is_disconnected):
+                yield chunk
+        finally:
+            status_broker.unsubscribe(subscription)
+    
+    return StreamingResponse(body(), media_type="text/event-stream", headers={
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no",
+    })
+
 @router.post("/authentications", response_model=AuthenticationResponse)
 async def create_authentication_request(
     auth_data: AuthenticationCreate,
@@ -138,11 +241,79 @@ async def create_authentication_request(
     )
     
     db.add(authentication)
+    db.flush()
+    record_status_change(db, current_user.id, authentication.id, "PENDING")
     db.commit()
     db.refresh(authentication)
     
     return authentication
 
+@router.post("/authentications/submit", response_model=AuthenticationSubmission)
+async def submit_authentication(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    storage: Storage = Depends(get_storage),
+    db: Session = Depends(get_db)
+):
+    """
+    Create an authentication request together with its photos in one call.
+
+    multipart/form-data with brand_name, product_name, optional product_id
+    and 5-8 image parts (field name = photo slot, e.g. "front", "label").
+    The row is created only if enough photos were stored; every photo's
+    outcome is reported either way.
+    """
+    
+    result = await receive_multipart(request, storage, max_files=MAX_AUTHENTICATION_PHOTOS, concurrent_writes=True)
+    photos = [to_uploaded_photo(storage, upload) for upload in result.files]
+    stored = [upload.stored for upload in result.files if upload.stored]
+    
+    brand_name = result.fields.get("brand_name", "").strip()
+    product_name = result.fields.get("product_name", "").strip()
+    product_id = result.fields.get("product_id", "").strip()
+    problem = None
+    if not brand_name or not product_name:
+        problem = "brand_name and product_name are required"
+    elif product_id and not product_id.isdigit():
+        problem = "product_id must be an integer"
+    elif len(stored) < MIN_AUTHENTICATION_PHOTOS:
+        problem = f"At least {MIN_AUTHENTICATION_PHOTOS} valid photos are required, got {len(stored)}"
+    if problem:
+        # Stored photos are content-addressed, so a retry re-uses them
+        raise HTTPException(status_code=422, detail={
+            "message": problem,
+            "photos": [photo.model_dump() for photo in photos],
+        })
+    
+    # Upload records and the authentication row commit together
+    record_uploads(db, current_user.id, stored)
+    authentication = Authentication(
+        user_id=current_user.id,
+        product_id=int(product_id) if product_id else None,
+        brand_name=brand_name,
+        product_name=product_name,
+        photos_uploaded=[photo.url for photo in photos if photo.url],
+        status="PENDING"
+    )
+    db.add(authentication)
+    try:
+        db.flush()
+        record_status_change(db, current_user.id, authentication.id, "PENDING")
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise HTTPException(status_code=400, detail="Failed to create authentication")
+    db.refresh(authentication)
+    
+    for obj in stored:
+        if not obj.deduplicated:
+            image_pipeline.submit(obj.key, obj.sha256)
+    
+    return AuthenticationSubmission(
+        authentication=AuthenticationResponse.model_validate(authentication),
+        photos=photos
+    )
+
 @router.get("/settings", response_model=UserSettings)
 async def get_user_settings(
     current_user: User = Depends(get_current_user)
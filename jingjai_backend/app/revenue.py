@@ -0,0 +1,269 @@
+# app/revenue.py
+"""
+Daily revenue rollups and payment/refund reconciliation.
+
+record_payment/record_refund upsert into revenue_rollups inside the caller's
+transaction, so the rollups always move together with the payments and
+refunds they summarize. reconcile() is the offline check: it streams every
+payment with its refund total through a server-side cursor, flags payments
+whose refunds or status don't add up, and recomputes the per-day totals to
+compare against (and optionally correct) the rollup table.
+
+Run the reconciliation from the jingjai_backend directory:
+    python -m app.revenue [--fix] [--batch-size N]
+"""
+import argparse
+import logging
+from collections import defaultdict
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Date, cast, func, tuple_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import models
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal("0.01")
+
+def _to_decimal(value) -> Decimal:
+    return Decimal(str(value or 0)).quantize(CENT)
+
+def _bump(db: Session, day: date, currency: str, gross: Decimal = Decimal(0), refunded: Decimal = Decimal(0),
+          payments: int = 0, refunds: int = 0):
+    stmt = insert(models.RevenueRollup).values(
+        day=day,
+        currency=currency.upper(),
+        gross_amount=gross,
+        refunded_amount=refunded,
+        payment_count=payments,
+        refund_count=refunds,
+        updated_at=datetime.utcnow(),
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["day", "currency"],
+        set_={
+            "gross_amount": models.RevenueRollup.gross_amount + stmt.excluded.gross_amount,
+            "refunded_amount": models.RevenueRollup.refunded_amount + stmt.excluded.refunded_amount,
+            "payment_count": models.RevenueRollup.payment_count + stmt.excluded.payment_count,
+            "refund_count": models.RevenueRollup.refund_count + stmt.excluded.refund_count,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+    db.execute(stmt)
+
+def record_payment(db: Session, payment: models.Payment):
+    """Add a completed payment to its day's rollup (caller commits)"""
+    created_at = payment.created_at or datetime.utcnow()
+    _bump(db, created_at.date(), payment.currency, gross=_to_decimal(payment.amount), payments=1)
+
+def record_refund(db: Session, payment: models.Payment, refund: models.Refund):
+    """Add a completed refund to its day's rollup (caller commits)"""
+    created_at = refund.created_at or datetime.utcnow()
+    _bump(db, created_at.date(), payment.currency, refunded=_to_decimal(refund.amount), refunds=1)
+
+def refunded_total(db: Session, payment_id: int, include_pending: bool = False) -> float:
+    """Sum of completed refunds (and, optionally, ones still at the gateway) against a payment"""
+    statuses = ["completed", "pending"] if include_pending else ["completed"]
+    return db.query(func.coalesce(func.sum(models.Refund.amount), 0)).filter(
+        models.Refund.payment_id == payment_id,
+        models.Refund.status.in_(statuses)
+    ).scalar()
+
+def get_rollups(db: Session, start: date, end: date, currency: Optional[str] = None) -> List[models.RevenueRollup]:
+    query = db.query(models.RevenueRollup).filter(
+        models.RevenueRollup.day >= start,
+        models.RevenueRollup.day <= end
+    )
+    if currency:
+        query = query.filter(models.RevenueRollup.currency == currency)
+    return query.order_by(models.RevenueRollup.day, models.RevenueRollup.currency).all()
+
+def _expected_status(amount: Decimal, refunded: Decimal, status: str) -> str:
+    if refunded <= 0:
+        return status
+    if refunded >= amount:
+        return "refunded"
+    return "partially_refunded"
+
+def reconcile(db: Session, batch_size: int = 5000, fix: bool = False) -> Dict:
+    """
+    Walk all payments in batches and check them against their refunds.
+
+    Returns a report with per-payment issues and per-(day, currency) rollup
+    mismatches. With ``fix`` the mismatched rollups are rewritten from the
+    recomputed totals.
+
+    Everything runs in one REPEATABLE READ transaction, so the totals come
+    from a single snapshot. If a payment or refund bumps a rollup the fix is
+    rewriting after that snapshot, the fix fails with a serialization error
+    instead of overwriting the increment; run it again.
+    """
+    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    refund_totals = db.query(
+        models.Refund.payment_id.label("payment_id"),
+        func.sum(models.Refund.amount).label("refunded"),
+    ).filter(
+        models.Refund.status == "completed"
+    ).group_by(models.Refund.payment_id).subquery()
+
+    rows = db.query(
+        models.Payment.id,
+        models.Payment.transaction_id,
+        models.Payment.amount,
+        models.Payment.currency,
+        models.Payment.status,
+        models.Payment.created_at,
+        func.coalesce(refund_totals.c.refunded, 0),
+    ).outerjoin(
+        refund_totals, refund_totals.c.payment_id == models.Payment.id
+    ).order_by(models.Payment.id).execution_options(stream_results=True).yield_per(batch_size)
+
+    issues = []
+    expected: Dict[Tuple[date, str], list] = defaultdict(lambda: [Decimal(0), Decimal(0), 0, 0])
+    scanned = 0
+
+    for payment_id, transaction_id, amount, currency, status, created_at, refunded in rows:
+        scanned += 1
+        amount = _to_decimal(amount)
+        refunded = _to_decimal(refunded)
+
+        if refunded > amount:
+            issues.append({
+                "transaction_id": transaction_id,
+                "issue": "over_refunded",
+                "amount": amount,
+                "refunded": refunded,
+            })
+        if status in ("completed", "refunded", "partially_refunded"):
+            expected_status = _expected_status(amount, refunded, "completed")
+            if status != expected_status:
+                issues.append({
+                    "transaction_id": transaction_id,
+                    "issue": "status_mismatch",
+                    "status": status,
+                    "expected_status": expected_status,
+                })
+            if created_at is not None:
+                totals = expected[(created_at.date(), currency.upper())]
+                totals[0] += amount
+                totals[2] += 1
+        elif refunded > 0:
+            issues.append({
+                "transaction_id": transaction_id,
+                "issue": "refund_on_unsettled_payment",
+                "status": status,
+                "refunded": refunded,
+            })
+
+        if scanned % batch_size == 0:
+            logger.info(f"Reconciled {scanned} payments")
+
+    # Refunds are attributed to the day they were issued
+    refunds_by_day = db.query(
+        cast(models.Refund.created_at, Date),
+        models.Payment.currency,
+        func.sum(models.Refund.amount),
+        func.count(models.Refund.id),
+    ).join(
+        models.Payment, models.Payment.id == models.Refund.payment_id
+    ).filter(
+        models.Refund.status == "completed",
+        # Undated refunds have no day to land on, like undated payments above
+        models.Refund.created_at.isnot(None)
+    ).group_by(cast(models.Refund.created_at, Date), models.Payment.currency).all()
+
+    for day, currency, refunded, count in refunds_by_day:
+        totals = expected[(day, currency.upper())]
+        totals[1] += _to_decimal(refunded)
+        totals[3] += count
+
+    stored = {
+        (rollup.day, rollup.currency): rollup
+        for rollup in db.query(models.RevenueRollup).all()
+    }
+
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        gross, refunded, payments, refunds = expected.get(key, [Decimal(0), Decimal(0), 0, 0])
+        rollup = stored.get(key)
+        actual = (
+            (_to_decimal(rollup.gross_amount), _to_decimal(rollup.refunded_amount),
+             rollup.payment_count, rollup.refund_count)
+            if rollup else (Decimal(0), Decimal(0), 0, 0)
+        )
+        if actual != (gross, refunded, payments, refunds):
+            mismatches.append({
+                "day": key[0],
+                "currency": key[1],
+                "expected": {"gross": gross, "refunded": refunded, "payments": payments, "refunds": refunds},
+                "stored": {"gross": actual[0], "refunded": actual[1], "payments": actual[2], "refunds": actual[3]},
+            })
+
+    if fix and mismatches:
+        # Only the mismatched keys are written; rows that already agree are left to the live path
+        stale = [(m["day"], m["currency"]) for m in mismatches if (m["day"], m["currency"]) not in expected]
+        if stale:
+            db.query(models.RevenueRollup).filter(
+                tuple_(models.RevenueRollup.day, models.RevenueRollup.currency).in_(stale)
+            ).delete(synchronize_session=False)
+        rows = [
+            {
+                "day": m["day"],
+                "currency": m["currency"],
+                "gross_amount": m["expected"]["gross"],
+                "refunded_amount": m["expected"]["refunded"],
+                "payment_count": m["expected"]["payments"],
+                "refund_count": m["expected"]["refunds"],
+                "updated_at": datetime.utcnow(),
+            }
+            for m in mismatches if (m["day"], m["currency"]) in expected
+        ]
+        if rows:
+            stmt = insert(models.RevenueRollup).values(rows)
+            db.execute(stmt.on_conflict_do_update(
+                index_elements=["day", "currency"],
+                set_={
+                    "gross_amount": stmt.excluded.gross_amount,
+                    "refunded_amount": stmt.excluded.refunded_amount,
+                    "payment_count": stmt.excluded.payment_count,
+                    "refund_count": stmt.excluded.refund_count,
+                    "updated_at": stmt.excluded.updated_at,
+                },
+            ))
+    db.commit()
+
+    return {
+        "payments_scanned": scanned,
+        "issues": issues,
+        "rollup_mismatches": mismatches,
+        "rollups_rebuilt": bool(fix and mismatches),
+    }
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Reconcile payments, refunds and revenue rollups")
+    parser.add_argument("--fix", action="store_true", help="Rewrite mismatched revenue_rollups from payments and refunds")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        report = reconcile(db, batch_size=args.batch_size, fix=args.fix)
+    finally:
+        db.close()
+
+    print(f"Payments scanned: {report['payments_scanned']}")
+    print(f"Payment issues: {len(report['issues'])}")
+    for issue in report["issues"]:
+        print(f"  ❌ {issue}")
+    print(f"Rollup mismatches: {len(report['rollup_mismatches'])}")
+    for mismatch in report["rollup_mismatches"]:
+        print(f"  ❌ {mismatch}")
+    if report["rollups_rebuilt"]:
+        print("✅ Mismatched rollups rewritten")
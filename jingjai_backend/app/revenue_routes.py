@@ -0,0 +1,66 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Optional, Dict
+from datetime import date, datetime, timedelta
+from .database import get_db
+from .schemas import RevenueDay, RevenueTotals, RevenueReport
+from .auth_utils import require_admin_key
+from .revenue import get_rollups
+
+router = APIRouter(
+    prefix="/reports",
+    tags=["reports"],
+    dependencies=[Depends(require_admin_key)]
+)
+
+MAX_REPORT_DAYS = 366
+
+@router.get("/revenue", response_model=RevenueReport)
+def get_revenue_report(
+    start: Optional[date] = Query(None, description="First day (UTC), defaults to 30 days ago"),
+    end: Optional[date] = Query(None, description="Last day (UTC), defaults to today"),
+    currency: Optional[str] = Query(None, description="Filter by currency code"),
+    db: Session = Depends(get_db)
+):
+    """Daily gross/refunded/net revenue per currency, served from the rollup table"""
+    
+    end = end or datetime.utcnow().date()
+    start = start or end - timedelta(days=30)
+    
+    if start > end:
+        raise HTTPException(status_code=400, detail="start must be on or before end")
+    if (end - start).days > MAX_REPORT_DAYS:
+        raise HTTPException(status_code=400, detail=f"Reports are limited to {MAX_REPORT_DAYS} days")
+    
+    rollups = get_rollups(db, start, end, currency.upper() if currency else None)
+    
+    days = []
+    totals: Dict[str, RevenueTotals] = {}
+    for rollup in rollups:
+        gross = float(rollup.gross_amount)
+        refunded = float(rollup.refunded_amount)
+        days.append(RevenueDay(
+            day=rollup.day,
+            currency=rollup.currency,
+            gross=gross,
+            refunded=refunded,
+            net=round(gross - refunded, 2),
+            payment_count=rollup.payment_count,
+            refund_count=rollup.refund_count
+        ))
+        
+        total = totals.setdefault(rollup.currency, RevenueTotals(
+            currency=rollup.currency, gross=0, refunded=0, net=0, payment_count=0, refund_count=0
+        ))
+        total.gross = round(total.gross + gross, 2)
+        total.refunded = round(total.refunded + refunded, 2)
+        total.net = round(total.gross - total.refunded, 2)
+        total.payment_count += rollup.payment_count
+        total.refund_count += rollup.refund_count
+    
+    return RevenueReport(
+        start=start,
+        end=end,
+        days=days,
+        totals=list(totals.values())
+    )
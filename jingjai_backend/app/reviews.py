@@ -0,0 +1,306 @@
+# app/reviews.py
+"""
+Human review queue for authentications the model could not settle.
+
+An ``authentication.completed`` outbox handler queues a review_tasks row
+when the verdict is INCONCLUSIVE, the confidence is low, or the photos were
+seen on an earlier authentication. Each task gets an SLA deadline from its
+tier: paid authentications (a cost, or a Premium account) get the shorter
+one. Reviewers always get the pending task with the earliest deadline, with
+the paid tier first on ties. That is earliest-deadline-first, so standard
+tasks still move while paid ones jump ahead.
+
+A claim is a single range scan over a partial index on (due_at, priority,
+id) of PENDING rows, locked with FOR UPDATE SKIP LOCKED, so its cost does
+not depend on the backlog size. The claimed row gets a lease. Reviewers
+extend it with heartbeats, and a maintenance loop returns expired leases to
+PENDING. Expired claims are handled there, not in the claim query, so the
+claim can stay on that index. ``claims`` is bumped on every claim and acts
+as a fencing token: heartbeats and decisions only apply to the claim they
+came from.
+"""
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import case, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .database import SessionLocal
+from .outbox import enqueue_event, register_handler
+from .status_stream import record_status_change
+
+logger = logging.getLogger(__name__)
+
+PENDING = "PENDING"
+CLAIMED = "CLAIMED"
+DONE = "DONE"
+DECISIONS = ("AUTHENTIC", "FAKE", "INCONCLUSIVE")
+
+CONFIDENCE_THRESHOLD = float(os.getenv("REVIEW_CONFIDENCE_THRESHOLD", "0.8"))
+LEASE = timedelta(seconds=int(os.getenv("REVIEW_LEASE_SECONDS", "600")))
+SLA = {
+    "priority": timedelta(hours=float(os.getenv("REVIEW_SLA_PRIORITY_HOURS", "2"))),
+    "standard": timedelta(hours=float(os.getenv("REVIEW_SLA_STANDARD_HOURS", "24"))),
+}
+TIER_PRIORITY = {"priority": 0, "standard": 1}
+REAP_BATCH_SIZE = 1000
+
+reviews_enqueued = metrics.counter("reviews.enqueued", "Authentications queued for human review")
+reviews_claimed = metrics.counter("reviews.claimed", "Review tasks handed to reviewers")
+reviews_completed = metrics.counter("reviews.completed", "Review decisions recorded")
+reviews_late = metrics.counter("reviews.late", "Review decisions recorded after the SLA deadline")
+leases_expired = metrics.counter("reviews.leases_expired", "Claims returned to the queue after their lease lapsed")
+stale_decisions = metrics.counter("reviews.stale_decisions", "Heartbeats or decisions for a lost claim")
+pending_reviews = metrics.gauge("reviews.pending", "Review tasks waiting for a reviewer")
+overdue_reviews = metrics.gauge("reviews.overdue", "Pending review tasks past their deadline")
+wait_seconds = metrics.histogram(
+    "reviews.wait_seconds", "Time from queueing to first claim",
+    buckets=(60, 300, 900, 1800, 3600, 7200, 14400, 43200, 86400)
+)
+handle_seconds = metrics.histogram(
+    "reviews.handle_seconds", "Time from claim to decision",
+    buckets=(15, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+)
+
+def review_reason(authentication: models.Authentication) -> Optional[str]:
+    if authentication.photo_duplicates:
+        return "duplicate_photos"
+    if authentication.authentication_result == "INCONCLUSIVE":
+        return "inconclusive"
+    if authentication.confidence_score is not None and authentication.confidence_score < CONFIDENCE_THRESHOLD:
+        return "low_confidence"
+    return None
+
+def review_tier(db: Session, authentication: models.Authentication) -> str:
+    if (authentication.cost or 0) > 0:
+        return "priority"
+    level = db.query(models.User.verification_level).filter(models.User.id == authentication.user_id).scalar()
+    return "priority" if level == "Premium" else "standard"
+
+def enqueue_review(db: Session, authentication: models.Authentication, reason: str,
+                   tier: Optional[str] = None) -> bool:
+    """Queue a review once per authentication (redelivered events are no-ops); caller commits"""
+    tier = tier or review_tier(db, authentication)
+    now = datetime.utcnow()
+    inserted = db.execute(insert(models.ReviewTask).values(
+        authentication_id=authentication.id,
+        reason=reason,
+        tier=tier,
+        priority=TIER_PRIORITY[tier],
+        due_at=now + SLA[tier],
+        status=PENDING,
+        claims=0,
+        created_at=now,
+    ).on_conflict_do_nothing(index_elements=["authentication_id"]))
+    if inserted.rowcount:
+        reviews_enqueued.inc()
+    return bool(inserted.rowcount)
+
+def _on_authentication_completed(db: Session, event: Dict[str, Any]):
+    authentication = db.query(models.Authentication).filter(
+        models.Authentication.id == event["data"]["authentication_id"]
+    ).first()
+    if authentication is None:
+        return
+    reason = review_reason(authentication)
+    if reason:
+        enqueue_review(db, authentication, reason)
+
+def _apply_event(fn: Callable[[Session, Dict[str, Any]], None], event: Dict[str, Any]):
+    db = SessionLocal()
+    try:
+        fn(db, event)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+async def handle_authentication_completed(event: Dict[str, Any]):
+    await asyncio.to_thread(_apply_event, _on_authentication_completed, event)
+
+register_handler("authentication.completed", handle_authentication_completed)
+
+# Reviewer operations
+
+def claim_next(db: Session, reviewer: str, lease: timedelta = LEASE) -> Optional[models.ReviewTask]:
+    """Lease the most urgent pending task to ``reviewer``"""
+    task = db.query(models.ReviewTask).filter(
+        models.ReviewTask.status == PENDING
+    ).order_by(
+        models.ReviewTask.due_at, models.ReviewTask.priority, models.ReviewTask.id
+    ).limit(1).with_for_update(skip_locked=True).first()
+    if task is None:
+        db.rollback()
+        return None
+
+    now = datetime.utcnow()
+    if task.claims == 0:
+        wait_seconds.observe((now - task.created_at).total_seconds())
+    task.status = CLAIMED
+    task.reviewer = reviewer
+    task.claims += 1
+    task.claimed_at = now
+    task.lease_expires_at = now + lease
+    db.commit()
+    reviews_claimed.inc()
+    return task
+
+def _fenced(db: Session, task_id: int, reviewer: str, claims: int):
+    return db.query(models.ReviewTask).filter(
+        models.ReviewTask.id == task_id,
+        models.ReviewTask.status == CLAIMED,
+        models.ReviewTask.reviewer == reviewer,
+        models.ReviewTask.claims == claims
+    )
+
+def extend_lease(db: Session, task_id: int, reviewer: str, claims: int,
+                 lease: timedelta = LEASE) -> Optional[datetime]:
+    """Heartbeat; returns the new expiry, or None if the claim was lost"""
+    expires_at = datetime.utcnow() + lease
+    updated = _fenced(db, task_id, reviewer, claims).update(
+        {"lease_expires_at": expires_at}, synchronize_session=False
+    )
+    db.commit()
+    if not updated:
+        stale_decisions.inc()
+        return None
+    return expires_at
+
+def release_task(db: Session, task_id: int, reviewer: str, claims: int) -> bool:
+    """Hand a claimed task back without a decision"""
+    updated = _fenced(db, task_id, reviewer, claims).update(
+        {"status": PENDING, "reviewer": None, "lease_expires_at": None}, synchronize_session=False
+    )
+    db.commit()
+    return bool(updated)
+
+def complete_review(db: Session, task_id: int, reviewer: str, claims: int, decision: str,
+                    notes: Optional[str] = None, confidence: Optional[float] = None) -> bool:
+    """Record the reviewer's verdict on the task and the authentication in one commit"""
+    task = _fenced(db, task_id, reviewer, claims).with_for_update().first()
+    if task is None:
+        db.rollback()
+        stale_decisions.inc()
+        return False
+
+    now = datetime.utcnow()
+    task.status = DONE
+    task.decision = decision
+    task.completed_at = now
+    task.lease_expires_at = None
+
+    authentication = db.query(models.Authentication).filter(
+        models.Authentication.id == task.authentication_id
+    ).first()
+    authentication.authentication_result = decision
+    if confidence is not None:
+        authentication.confidence_score = confidence
+    if notes:
+        authentication.authenticator_notes = notes
+    authentication.completed_at = now
+
+    record_status_change(db, authentication.user_id, authentication.id, authentication.status,
+                         decision, authentication.confidence_score)
+    enqueue_event(db, "authentication.reviewed", "authentication", str(authentication.id), {
+        "authentication_id": authentication.id,
+        "user_id": authentication.user_id,
+        "result": decision,
+        "confidence_score": authentication.confidence_score,
+        "reviewer": reviewer,
+    })
+    db.commit()
+    reviews_completed.inc()
+    handle_seconds.observe((now - task.claimed_at).total_seconds())
+    if now > task.due_at:
+        reviews_late.inc()
+    return True
+
+# Maintenance and stats
+
+def release_expired_leases(db: Session, batch_size: int = REAP_BATCH_SIZE) -> int:
+    """Return lapsed claims to the queue, in batches so a backlog never holds one long lock"""
+    released = 0
+    while True:
+        ids = [row.id for row in db.query(models.ReviewTask.id).filter(
+            models.ReviewTask.status == CLAIMED,
+            models.ReviewTask.lease_expires_at < datetime.utcnow()
+        ).limit(batch_size).with_for_update(skip_locked=True)]
+        if not ids:
+            db.commit()
+            break
+        db.query(models.ReviewTask).filter(models.ReviewTask.id.in_(ids)).update(
+            {"status": PENDING, "reviewer": None, "lease_expires_at": None}, synchronize_session=False
+        )
+        db.commit()
+        released += len(ids)
+        if len(ids) < batch_size:
+            break
+    leases_expired.inc(released)
+    return released
+
+def queue_stats(db: Session) -> Dict[str, Any]:
+    now = datetime.utcnow()
+    pending, overdue, oldest_due = db.query(
+        func.count(models.ReviewTask.id),
+        func.count(case((models.ReviewTask.due_at < now, 1))),
+        func.min(models.ReviewTask.due_at)
+    ).filter(models.ReviewTask.status == PENDING).one()
+    claimed = db.query(func.count(models.ReviewTask.id)).filter(models.ReviewTask.status == CLAIMED).scalar()
+    db.commit()
+    pending_reviews.set(pending)
+    overdue_reviews.set(overdue)
+    return {"pending": pending, "overdue": overdue, "claimed": claimed, "oldest_due_at": oldest_due}
+
+def reviewer_stats(db: Session, since: datetime) -> List[Dict[str, Any]]:
+    """Decisions per reviewer since ``since``: count, handling time and SLA hit rate"""
+    handling = func.extract("epoch", models.ReviewTask.completed_at - models.ReviewTask.claimed_at)
+    rows = db.query(
+        models.ReviewTask.reviewer,
+        func.count(models.ReviewTask.id).label("completed"),
+        func.avg(handling).label("mean_seconds"),
+        func.percentile_cont(0.5).within_group(handling).label("median_seconds"),
+        func.count(case((models.ReviewTask.completed_at <= models.ReviewTask.due_at, 1))).label("on_time"),
+    ).filter(
+        models.ReviewTask.status == DONE,
+        models.ReviewTask.completed_at >= since
+    ).group_by(models.ReviewTask.reviewer).order_by(func.count(models.ReviewTask.id).desc()).all()
+
+    hours = max((datetime.utcnow() - since).total_seconds() / 3600, 1e-9)
+    return [
+        {
+            "reviewer": row.reviewer,
+            "completed": row.completed,
+            "per_hour": round(row.completed / hours, 2),
+            "mean_seconds": round(float(row.mean_seconds or 0), 1),
+            "median_seconds": round(float(row.median_seconds or 0), 1),
+            "on_time_ratio": round(row.on_time / row.completed, 3) if row.completed else None,
+        }
+        for row in rows
+    ]
+
+async def maintenance_loop(session_factory: Callable[[], Session], interval_seconds: float = 15.0):
+    """Reap lapsed leases and refresh the queue gauges; run as a background task"""
+    def run_once() -> int:
+        db = session_factory()
+        try:
+            released = release_expired_leases(db)
+            queue_stats(db)
+            return released
+        finally:
+            db.close()
+
+    while True:
+        try:
+            released = await asyncio.to_thread(run_once)
+            if released:
+                logger.info(f"Returned {released} expired review claims to the queue")
+        except Exception as e:
+            logger.error(f"Review queue maintenance failed: {e}")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,111 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from sqlalchemy.orm import Session
+from datetime import datetime, timedelta
+from .database import get_db
+from .models import Authentication
+from .schemas import (
+    ReviewClaimRequest, ReviewLease, ReviewDecision, ReviewTaskResponse,
+    ReviewQueueStats, ReviewerStats, ReviewStatsResponse
+)
+from .auth_utils import require_admin_key
+from .reviews import (
+    DECISIONS, claim_next, extend_lease, release_task, complete_review, queue_stats, reviewer_stats
+)
+
+router = APIRouter(
+    prefix="/reviews",
+    tags=["reviews"],
+    dependencies=[Depends(require_admin_key)]
+)
+
+@router.post("/claim", response_model=ReviewTaskResponse)
+def claim_review(
+    claim: ReviewClaimRequest,
+    db: Session = Depends(get_db)
+):
+    """Lease the most urgent review task; 204 when the queue is empty"""
+    
+    task = claim_next(db, claim.reviewer)
+    if task is None:
+        return Response(status_code=204)
+    
+    authentication = db.query(Authentication).filter(Authentication.id == task.authentication_id).first()
+    return ReviewTaskResponse(
+        id=task.id,
+        authentication_id=task.authentication_id,
+        reason=task.reason,
+        tier=task.tier,
+        due_at=task.due_at,
+        reviewer=task.reviewer,
+        claims=task.claims,
+        lease_expires_at=task.lease_expires_at,
+        brand_name=authentication.brand_name,
+        product_name=authentication.product_name,
+        product_id=authentication.product_id,
+        photos_uploaded=authentication.photos_uploaded,
+        model_result=authentication.authentication_result,
+        model_confidence=authentication.confidence_score,
+        model_notes=authentication.authenticator_notes,
+        photo_duplicates=authentication.photo_duplicates,
+        product_candidates=authentication.product_candidates
+    )
+
+@router.post("/{task_id}/heartbeat")
+def heartbeat_review(
+    task_id: int,
+    lease: ReviewLease,
+    db: Session = Depends(get_db)
+):
+    """Extend the lease on a claimed task"""
+    
+    expires_at = extend_lease(db, task_id, lease.reviewer, lease.claims)
+    if expires_at is None:
+        raise HTTPException(status_code=409, detail="Claim expired or taken over")
+    
+    return {"lease_expires_at": expires_at}
+
+@router.post("/{task_id}/release")
+def release_review(
+    task_id: int,
+    lease: ReviewLease,
+    db: Session = Depends(get_db)
+):
+    """Return a claimed task to the queue without a decision"""
+    
+    if not release_task(db, task_id, lease.reviewer, lease.claims):
+        raise HTTPException(status_code=409, detail="Claim expired or taken over")
+    
+    return {"message": "Task released"}
+
+@router.post("/{task_id}/complete")
+def complete_review_task(
+    task_id: int,
+    decision: ReviewDecision,
+    db: Session = Depends(get_db)
+):
+    """Record the reviewer's verdict on the authentication"""
+    
+    if decision.decision not in DECISIONS:
+        raise HTTPException(status_code=400, detail=f"decision must be one of {', '.join(DECISIONS)}")
+    if decision.confidence is not None and not 0 <= decision.confidence <= 1:
+        raise HTTPException(status_code=400, detail="confidence must be between 0 and 1")
+    
+    if not complete_review(db, task_id, decision.reviewer, decision.claims,
+                           decision.decision, decision.notes, decision.confidence):
+        raise HTTPException(status_code=409, detail="Claim expired or taken over")
+    
+    return {"message": "Review recorded"}
+
+@router.get("/stats", response_model=ReviewStatsResponse)
+def get_review_stats(
+    hours: int = Query(24, ge=1, le=24 * 31, description="Throughput window in hours"),
+    db: Session = Depends(get_db)
+):
+    """Queue depth and per-reviewer throughput"""
+    
+    since = datetime.utcnow() - timedelta(hours=hours)
+    return ReviewStatsResponse(
+        since=since,
+        queue=ReviewQueueStats(**queue_stats(db)),
+        reviewers=[ReviewerStats(**row) for row in reviewer_stats(db, since)]
+    )
@@ -1,7 +1,7 @@
 # schemas.py
 from pydantic import BaseModel, EmailStr
 from typing import List, Optional, Dict, Any
-from datetime import datetime
+from datetime import datetime, date
 
 class UserBase(BaseModel):
     email: EmailStr
@@ -66,6 +66,30 @@ class RefundResponse(RefundBase):
     status: str
     created_at: datetime
 
+# Revenue report schemas
+class RevenueDay(BaseModel):
+    day: date
+    currency: str
+    gross: float
+    refunded: float
+    net: float
+    payment_count: int
+    refund_count: int
+
+class RevenueTotals(BaseModel):
+    currency: str
+    gross: float
+    refunded: float
+    net: float
+    payment_count: int
+    refund_count: int
+
+class RevenueReport(BaseModel):
+    start: date
+    end: date
+    days: List[RevenueDay]
+    totals: List[RevenueTotals]
+
 class Token(BaseModel):
     access_token: str
     token_type: str
@@ -148,6 +172,7 @@ class Product(ProductBase):
     stock_status: str
     created_at: datetime
     updated_at: datetime
+    is_favorited: Optional[bool] = None  # Only set for authenticated requests
     
     class Config:
         from_attributes = True
@@ -166,6 +191,20 @@ class ProductsResponse(BaseModel):
     total: int
     brand: Optional[Brand] = None
 
+class CatalogRemovals(BaseModel):
+    brands: List[int]
+    categories: List[int]
+    products: List[int]
+
+class CatalogChanges(BaseModel):
+    brands: List[Brand]
+    categories: List[ProductCategory]
+    products: List[Product]
+    removed: CatalogRemovals
+    watermark: str
+    has_more: bool
+    reset: bool  # Replace the local copy instead of merging into it
+
 # User profile schemas
 class UserProfileUpdate(BaseModel):
     name: Optional[str] = None
@@ -194,6 +233,37 @@ class UserStats(BaseModel):
     favorite_items: int
     member_since: str
 
+# Favorites schemas
+class FavoriteStatus(BaseModel):
+    product_id: int
+    is_favorited: bool
+    favorites_count: int
+
+class FavoriteCheckResponse(BaseModel):
+    favorites: Dict[int, bool]
+
+# Upload schemas
+class UploadedPhoto(BaseModel):
+    slot: Optional[str] = None  # Multipart field name, e.g. "front", "label"
+    filename: Optional[str] = None
+    url: Optional[str] = None
+    sha256: Optional[str] = None
+    size: Optional[int] = None
+    content_type: Optional[str] = None
+    deduplicated: bool = False
+    error: Optional[str] = None
+
+class UploadResponse(BaseModel):
+    photos: List[UploadedPhoto]
+
+class ProductCandidate(BaseModel):
+    product: ProductWithBrand
+    score: float  # Cosine similarity of the best-matching catalog image
+
+class ProductSuggestions(BaseModel):
+    photo: UploadedPhoto
+    candidates: List[ProductCandidate]
+
 # Authentication history schemas
 class AuthenticationCreate(BaseModel):
     product_id: Optional[int] = None
@@ -215,6 +285,61 @@ class AuthenticationResponse(BaseModel):
     class Config:
         from_attributes = True
 
+class AuthenticationSubmission(BaseModel):
+    authentication: AuthenticationResponse
+    photos: List[UploadedPhoto]
+
+# Review queue schemas
+class ReviewClaimRequest(BaseModel):
+    reviewer: str
+
+class ReviewLease(BaseModel):
+    reviewer: str
+    claims: int  # Token from the claim; stale tokens are rejected
+
+class ReviewDecision(ReviewLease):
+    decision: str  # AUTHENTIC, FAKE, INCONCLUSIVE
+    notes: Optional[str] = None
+    confidence: Optional[float] = None
+
+class ReviewTaskResponse(BaseModel):
+    id: int
+    authentication_id: int
+    reason: str
+    tier: str
+    due_at: datetime
+    reviewer: str
+    claims: int
+    lease_expires_at: datetime
+    brand_name: Optional[str] = None
+    product_name: Optional[str] = None
+    product_id: Optional[int] = None
+    photos_uploaded: Optional[List[str]] = None
+    model_result: Optional[str] = None
+    model_confidence: Optional[float] = None
+    model_notes: Optional[str] = None
+    photo_duplicates: Optional[List[Dict[str, Any]]] = None
+    product_candidates: Optional[List[Dict[str, Any]]] = None
+
+class ReviewQueueStats(BaseModel):
+    pending: int
+    overdue: int
+    claimed: int
+    oldest_due_at: Optional[datetime] = None
+
+class ReviewerStats(BaseModel):
+    reviewer: str
+    completed: int
+    per_hour: float
+    mean_seconds: float
+    median_seconds: float
+    on_time_ratio: Optional[float] = None
+
+class ReviewStatsResponse(BaseModel):
+    since: datetime
+    queue: ReviewQueueStats
+    reviewers: List[ReviewerStats]
+
 # Settings schemas
 class NotificationSettings(BaseModel):
     push_notifications: bool = True
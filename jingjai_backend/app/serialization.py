@@ -0,0 +1,105 @@
+# app/serialization.py
+"""
+Fast path for the catalog list responses.
+
+List endpoints select plain column tuples and encode them straight to JSON
+bytes with orjson. No ORM objects are built, and the Pydantic response
+models never re-validate rows we just read from our own tables. The column
+lists come from the fields of schemas.Brand and schemas.Product, so the
+payload matches the slow path key for key. The models stay on the routes as
+``response_model`` for the OpenAPI schema; FastAPI skips them when a route
+returns a Response.
+
+``?fields=name,thumbnail_url,price`` narrows a list to the named fields.
+Only those columns are selected, and only those keys are sent. Names are
+checked against the schema fields, ``id`` is always included, and each
+distinct field set is resolved to a Projection once and then cached.
+"""
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+import orjson
+from fastapi import HTTPException, Query, Response
+from sqlalchemy.orm import Session
+
+from . import models, schemas
+from .favorites import favorites_cache
+
+BRAND_FIELDS = tuple(schemas.Brand.model_fields)
+PRODUCT_FIELDS = tuple(schemas.Product.model_fields)
+# Per-user values, filled in after the query rather than selected
+COMPUTED_FIELDS = frozenset({"is_favorited"})
+MAX_CACHED_PROJECTIONS = 256
+
+class JSONBytesResponse(Response):
+    """Response for content that is already a JSON-ready dict/list, encoded with orjson"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+@dataclass(frozen=True)
+class Projection:
+    fields: Tuple[str, ...]  # Selected columns, in output order
+    columns: Tuple[Any, ...]
+    computed: Tuple[str, ...] = ()
+
+    def dicts(self, rows: Iterable[Sequence[Any]]) -> List[Dict[str, Any]]:
+        fields = self.fields
+        return [dict(zip(fields, row)) for row in rows]
+
+@lru_cache(maxsize=MAX_CACHED_PROJECTIONS)
+def _projection(model: type, fields: Tuple[str, ...]) -> Projection:
+    selected = tuple(name for name in fields if name not in COMPUTED_FIELDS)
+    return Projection(
+        fields=selected,
+        columns=tuple(getattr(model, name) for name in selected),
+        computed=tuple(name for name in fields if name in COMPUTED_FIELDS),
+    )
+
+def parse_fields(raw: Optional[str], allowed: Sequence[str]) -> Tuple[str, ...]:
+    """Validate a comma-separated field list; returns it in schema order, with id, or every field if empty"""
+    if not raw or not raw.strip():
+        return tuple(allowed)
+    requested = {name.strip() for name in raw.split(",") if name.strip()}
+    unknown = requested.difference(allowed)
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("id")
+    return tuple(name for name in allowed if name in requested)
+
+def projection(model: type, allowed: Sequence[str], raw: Optional[str] = None) -> Projection:
+    return _projection(model, parse_fields(raw, allowed))
+
+BRANDS = projection(models.Brand, BRAND_FIELDS)
+PRODUCTS = projection(models.Product, PRODUCT_FIELDS)
+
+def _dependency(model: type, allowed: Sequence[str]):
+    def resolve(fields: Optional[str] = Query(
+        None, description=f"Comma-separated fields to return, from: {', '.join(allowed)}"
+    )) -> Projection:
+        try:
+            return projection(model, allowed, fields)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return resolve
+
+brand_fields = _dependency(models.Brand, BRAND_FIELDS)
+product_fields = _dependency(models.Product, PRODUCT_FIELDS)
+
+def product_dicts(db: Session, user: Optional[models.User], rows: Iterable[Sequence[Any]],
+                  projection: Projection = PRODUCTS) -> List[Dict[str, Any]]:
+    """Product rows (selected with ``projection.columns``) as response dicts, with is_favorited filled in if asked for"""
+    products = projection.dicts(rows)
+    if "is_favorited" not in projection.computed or not products:
+        return products
+    if user is None:
+        for product in products:
+            product["is_favorited"] = None
+        return products
+
+    flags = favorites_cache.contains_many(db, user.id, (product["id"] for product in products))
+    for product in products:
+        product["is_favorited"] = flags[product["id"]]
+    return products
@@ -1,7 +1,8 @@
-from sqlalchemy.orm import Session
-from .database import SessionLocal
-from .models import Brand, ProductCategory, Product
-from sqlalchemy import and_
+import psycopg
+from sqlalchemy.dialects.postgresql import insert
+from .database import SessionLocal, libpq_dsn
+from .models import Brand, ProductCategory
+from .catalog_import import import_records
 
 def setup_initial_brands_data():
     """Setup initial brands and products data"""
@@ -47,64 +48,42 @@ def setup_initial_brands_data():
             }
         ]
         
-        for brand_data in brands_data:
-            existing_brand = db.query(Brand).filter(Brand.name == brand_data["name"]).first()
-            if not existing_brand:
-                brand = Brand(**brand_data)
-                db.add(brand)
-                db.flush()  # Get the brand.id
-                
-                # Add categories for each brand
-                categories = [
-                    {"name": "handbags", "display_name": "Hand Bags"},
-                    {"name": "backpacks", "display_name": "Backpacks"},
-                    {"name": "crossbody", "display_name": "Crossbody Bags"},
-                    {"name": "totes", "display_name": "Tote Bags"},
-                ]
-                
-                for cat_data in categories:
-                    category = ProductCategory(
-                        brand_id=brand.id,
-                        name=cat_data["name"],
-                        display_name=cat_data["display_name"]
-                    )
-                    db.add(category)
-        
-        # Add Alexander Wang products (as example)
-        alexander_wang = db.query(Brand).filter(Brand.name == "Alexander Wang").first()
-        if alexander_wang:
-            handbags_cat = db.query(ProductCategory).filter(
-                and_(
-                    ProductCategory.brand_id == alexander_wang.id,
-                    ProductCategory.name == "handbags"
-                )
-            ).first()
-            
-            products = [
-                {"name": "Attica", "model": "Alexander Wang", "category_id": handbags_cat.id if handbags_cat else None},
-                {"name": "Attica Fanny Pack", "model": "Alexander Wang", "category_id": handbags_cat.id if handbags_cat else None},
-                {"name": "Rocco", "model": "Alexander Wang", "category_id": handbags_cat.id if handbags_cat else None},
-                {"name": "Rockie", "model": "Alexander Wang", "category_id": handbags_cat.id if handbags_cat else None},
-                {"name": "Mini Marti Backpack", "model": "Alexander Wang"},
-                {"name": "Rhett Tote", "model": "Alexander Wang"},
-            ]
-            
-            for product_data in products:
-                existing_product = db.query(Product).filter(
-                    and_(
-                        Product.brand_id == alexander_wang.id,
-                        Product.name == product_data["name"]
-                    )
-                ).first()
-                
-                if not existing_product:
-                    product = Product(
-                        brand_id=alexander_wang.id,
-                        **product_data
-                    )
-                    db.add(product)
+        # One statement per table; re-running skips rows that already exist
+        db.execute(insert(Brand).values(brands_data).on_conflict_do_nothing())
         
+        # Same categories for each brand
+        categories = [
+            {"name": "handbags", "display_name": "Hand Bags"},
+            {"name": "backpacks", "display_name": "Backpacks"},
+            {"name": "crossbody", "display_name": "Crossbody Bags"},
+            {"name": "totes", "display_name": "Tote Bags"},
+        ]
+        brand_ids = [brand_id for (brand_id,) in db.query(Brand.id).filter(
+            Brand.name.in_([brand["name"] for brand in brands_data])
+        )]
+        db.execute(insert(ProductCategory).values([
+            {"brand_id": brand_id, **category}
+            for brand_id in brand_ids
+            for category in categories
+        ]).on_conflict_do_nothing(index_elements=["brand_id", "name"]))
         db.commit()
+        
+        # Products go through the catalog importer (set-based upsert by sku). Rows seeded
+        # before skus existed need migrate_catalog_import.py's backfill to be matched.
+        products = [
+            {"name": "Attica", "category": "handbags"},
+            {"name": "Attica Fanny Pack", "category": "handbags"},
+            {"name": "Rocco", "category": "handbags"},
+            {"name": "Rockie", "category": "handbags"},
+            {"name": "Mini Marti Backpack"},
+            {"name": "Rhett Tote"},
+        ]
+        with psycopg.connect(libpq_dsn()) as conn:
+            import_records(conn, (
+                {"brand": "Alexander Wang", "model": "Alexander Wang", **product_data}
+                for product_data in products
+            ), derive_skus=True)
+        
         print("✅ Initial brands and products data setup completed!")
         
     except Exception as e:
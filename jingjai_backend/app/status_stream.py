@@ -0,0 +1,310 @@
+# app/status_stream.py
+"""
+Live authentication status updates for the results screens.
+
+Every status transition appends a row to authentication_events and sends
+NOTIFY on the same transaction, so listeners hear about a change exactly
+when it commits. Each API process keeps one LISTEN connection. Its
+StatusBroker fans notifications out to that process's open streams, keyed
+by user. Whichever process or worker made the change, every stream for that
+user sees it.
+
+Streams are Server-Sent Events. The event id is the authentication_events
+id, so a reconnecting client sends Last-Event-ID and first gets what it
+missed from the table. Every event carries the full current status, so a
+client only needs to keep the latest one per authentication.
+
+Memory per connection is one bounded queue. A stream that falls behind
+(queue full), or that was open while the LISTEN connection dropped, is
+marked for resync and catches up from the table; buffered notifications
+are never allowed to grow.
+"""
+import asyncio
+import json
+import logging
+import os
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Callable, Deque, Dict, List, Optional, Set
+
+import psycopg
+from sqlalchemy import func, select
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import metrics, models
+from .database import libpq_dsn
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "authentication_status"
+HEARTBEAT_SECONDS = float(os.getenv("STATUS_STREAM_HEARTBEAT_SECONDS", "15"))
+MAX_QUEUED_EVENTS = 64  # Per connection
+MAX_STREAMS_PER_USER = 5
+RESUME_BATCH_SIZE = 200
+# Sequence ids can commit out of order; catch-up re-reads this many ids back
+# and drops the ones already sent (events are state snapshots, so a repeat
+# after a reconnect is harmless)
+RESUME_LOOKBACK = 256
+RECONNECT_MS = 3000  # Client retry delay sent in the stream
+EVENT_RETENTION = timedelta(days=7)
+MAX_LISTEN_BACKOFF_SECONDS = 30.0
+
+open_streams = metrics.gauge("status_stream.open", "Open authentication status streams")
+events_published = metrics.counter("status_stream.published", "Status notifications fanned out to streams")
+stream_resyncs = metrics.counter("status_stream.resyncs", "Streams that caught up from the table")
+listener_reconnects = metrics.counter("status_stream.listener_reconnects", "LISTEN connection failures")
+
+def _event_dict(event_id: int, values: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": event_id,
+        "user_id": values["user_id"],
+        "authentication_id": values["authentication_id"],
+        "status": values["status"],
+        "authentication_result": values.get("authentication_result"),
+        "confidence_score": values.get("confidence_score"),
+        "created_at": values["created_at"].isoformat(),
+    }
+
+def record_status_change(db: Session, user_id: int, authentication_id: int, status: str,
+                         authentication_result: Optional[str] = None,
+                         confidence_score: Optional[float] = None):
+    """Log a transition and notify listeners; both take effect when the caller commits"""
+    values = {
+        "user_id": user_id,
+        "authentication_id": authentication_id,
+        "status": status,
+        "authentication_result": authentication_result,
+        "confidence_score": confidence_score,
+        "created_at": datetime.utcnow(),
+    }
+    event_id = db.execute(
+        insert(models.AuthenticationEvent).values(**values).returning(models.AuthenticationEvent.id)
+    ).scalar()
+    db.execute(select(func.pg_notify(CHANNEL, json.dumps(_event_dict(event_id, values)))))
+
+def load_events(db: Session, user_id: int, after_id: int, limit: int = RESUME_BATCH_SIZE) -> List[Dict[str, Any]]:
+    rows = db.query(models.AuthenticationEvent).filter(
+        models.AuthenticationEvent.user_id == user_id,
+        models.AuthenticationEvent.id > after_id
+    ).order_by(models.AuthenticationEvent.id).limit(limit).all()
+    db.commit()
+    return [_event_dict(row.id, {
+        "user_id": row.user_id,
+        "authentication_id": row.authentication_id,
+        "status": row.status,
+        "authentication_result": row.authentication_result,
+        "confidence_score": row.confidence_score,
+        "created_at": row.created_at,
+    }) for row in rows]
+
+def latest_event_id(db: Session, user_id: int) -> int:
+    latest = db.query(func.max(models.AuthenticationEvent.id)).filter(
+        models.AuthenticationEvent.user_id == user_id
+    ).scalar()
+    db.commit()
+    return latest or 0
+
+def purge_old_events(db: Session, batch_size: int = 5000) -> int:
+    """Delete events past the resume window in batches; returns the number removed"""
+    removed = 0
+    cutoff = datetime.utcnow() - EVENT_RETENTION
+    while True:
+        ids = [row.id for row in db.query(models.AuthenticationEvent.id).filter(
+            models.AuthenticationEvent.created_at < cutoff
+        ).limit(batch_size)]
+        if not ids:
+            break
+        db.query(models.AuthenticationEvent).filter(
+            models.AuthenticationEvent.id.in_(ids)
+        ).delete(synchronize_session=False)
+        db.commit()
+        removed += len(ids)
+        if len(ids) < batch_size:
+            break
+    return removed
+
+_RESYNC = None  # Queue marker: reload from the table
+
+class TooManyStreams(Exception):
+    pass
+
+class Subscription:
+    def __init__(self, user_id: int, max_queued: int = MAX_QUEUED_EVENTS):
+        self.user_id = user_id
+        self.queue: "asyncio.Queue[Optional[Dict[str, Any]]]" = asyncio.Queue(maxsize=max_queued)
+        self.needs_resync = False
+
+    def push(self, event: Optional[Dict[str, Any]]):
+        if event is _RESYNC:
+            self.needs_resync = True
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Drop it; the stream reloads from the table once it drains
+            self.needs_resync = True
+
+    def drain(self):
+        while not self.queue.empty():
+            self.queue.get_nowait()
+
+class StatusBroker:
+    """In-process fan-out from the LISTEN connection to open streams (event loop only)"""
+
+    def __init__(self, max_streams_per_user: int = MAX_STREAMS_PER_USER):
+        self.max_streams_per_user = max_streams_per_user
+        self._subscriptions: Dict[int, Set[Subscription]] = {}
+
+    def has_room(self, user_id: int) -> bool:
+        return len(self._subscriptions.get(user_id, ())) < self.max_streams_per_user
+
+    def subscribe(self, user_id: int) -> Subscription:
+        if not self.has_room(user_id):
+            raise TooManyStreams()
+        subscriptions = self._subscriptions.setdefault(user_id, set())
+        subscription = Subscription(user_id)
+        subscriptions.add(subscription)
+        open_streams.set(sum(len(subs) for subs in self._subscriptions.values()))
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is not None:
+            subscriptions.discard(subscription)
+            if not subscriptions:
+                del self._subscriptions[subscription.user_id]
+        open_streams.set(sum(len(subs) for subs in self._subscriptions.values()))
+
+    def publish(self, event: Dict[str, Any]):
+        for subscription in self._subscriptions.get(event.get("user_id"), ()):
+            subscription.push(event)
+            events_published.inc()
+
+    def resync_all(self):
+        """Notifications may have been missed (listener reconnect); every stream reloads"""
+        for subscriptions in self._subscriptions.values():
+            for subscription in subscriptions:
+                subscription.push(_RESYNC)
+
+status_broker = StatusBroker()
+
+class StatusListener:
+    """Holds the process's LISTEN connection and feeds the broker until stopped"""
+
+    def __init__(self, broker: StatusBroker = status_broker, dsn: Optional[str] = None):
+        self.broker = broker
+        # LISTEN needs a dedicated async connection, not a pooled session
+        self.dsn = dsn or libpq_dsn()
+
+    async def run(self):
+        backoff = 1.0
+        while True:
+            try:
+                async with await psycopg.AsyncConnection.connect(self.dsn, autocommit=True) as conn:
+                    await conn.execute(f"LISTEN {CHANNEL}")
+                    backoff = 1.0
+                    # Anything committed while we were not listening is only in the table
+                    self.broker.resync_all()
+                    async for notify in conn.notifies():
+                        try:
+                            self.broker.publish(json.loads(notify.payload))
+                        except ValueError:
+                            logger.warning(f"Ignoring malformed {CHANNEL} payload")
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                listener_reconnects.inc()
+                logger.warning(f"Status listener disconnected: {e}")
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, MAX_LISTEN_BACKOFF_SECONDS)
+
+def _format(event: Dict[str, Any]) -> str:
+    data = {key: value for key, value in event.items() if key not in ("id", "user_id")}
+    return f"id: {event['id']}\nevent: status\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+class _RecentIds:
+    """The last few ids sent on a stream, for dropping repeats"""
+
+    def __init__(self, size: int = 2 * RESUME_LOOKBACK):
+        self._order: Deque[int] = deque()
+        self._ids: Set[int] = set()
+        self.size = size
+        self.highest = 0
+
+    def __contains__(self, event_id: int) -> bool:
+        return event_id in self._ids
+
+    def add(self, event_id: int):
+        self._order.append(event_id)
+        self._ids.add(event_id)
+        if len(self._order) > self.size:
+            self._ids.discard(self._order.popleft())
+        self.highest = max(self.highest, event_id)
+
+async def stream_events(subscription: Subscription, session_factory: Callable[[], Session],
+                        last_event_id: Optional[int], is_disconnected: Callable[[], Any]) -> AsyncIterator[str]:
+    """SSE body for one connection; the caller subscribed before calling, so nothing slips in between"""
+    def run_db(fn, *args):
+        db = session_factory()
+        try:
+            return fn(db, *args)
+        finally:
+            db.close()
+
+    sent = _RecentIds()
+    if last_event_id is None:
+        # New stream: only changes from now on
+        floor = await asyncio.to_thread(run_db, latest_event_id, subscription.user_id)
+        sent.highest = floor
+    else:
+        floor = 0
+        sent.highest = last_event_id
+        subscription.needs_resync = True
+
+    yield f"retry: {RECONNECT_MS}\n\n"
+    while True:
+        if subscription.needs_resync:
+            subscription.needs_resync = False
+            subscription.drain()
+            stream_resyncs.inc()
+            # Ids are allocated before commit, so look a little behind the newest id sent
+            after_id = max(floor, sent.highest - RESUME_LOOKBACK)
+            while True:
+                events = await asyncio.to_thread(run_db, load_events, subscription.user_id, after_id)
+                for event in events:
+                    if event["id"] not in sent:
+                        yield _format(event)
+                        sent.add(event["id"])
+                if len(events) < RESUME_BATCH_SIZE:
+                    break
+                after_id = events[-1]["id"]
+
+        try:
+            event = await asyncio.wait_for(subscription.queue.get(), HEARTBEAT_SECONDS)
+        except asyncio.TimeoutError:
+            if await is_disconnected():
+                return
+            yield ": keepalive\n\n"
+            continue
+        if event is _RESYNC or event["id"] in sent or event["id"] <= floor:
+            continue
+        yield _format(event)
+        sent.add(event["id"])
+
+async def retention_loop(session_factory: Callable[[], Session], interval_seconds: float = 3600.0):
+    """Periodically drop events older than the resume window; run as a background task"""
+    def purge_once() -> int:
+        db = session_factory()
+        try:
+            return purge_old_events(db)
+        finally:
+            db.close()
+
+    while True:
+        try:
+            removed = await asyncio.to_thread(purge_once)
+            if removed:
+                logger.info(f"Purged {removed} old authentication events")
+        except Exception as e:
+            logger.error(f"Authentication event cleanup failed: {e}")
+        await asyncio.sleep(interval_seconds)
@@ -0,0 +1,193 @@
+# app/storage.py
+"""
+Content-addressed blob storage for uploaded files.
+
+A file is written to a staging area while its SHA-256 is computed, then
+committed under a key derived from that hash. Identical uploads therefore
+resolve to the same key and are stored once. Backends implement the Storage
+interface; LocalStorage keeps files on the local filesystem.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Optional
+
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(os.getcwd(), "uploads"))
+# Prefix for public URLs, e.g. "https://api.jingjai.app"; relative if unset
+UPLOAD_BASE_URL = os.getenv("UPLOAD_BASE_URL", "").rstrip("/")
+
+# ab/cd/<64 hex chars>[.<variant>].<ext>
+KEY_PATTERN = re.compile(r"^[0-9a-f]{2}/[0-9a-f]{2}/[0-9a-f]{64}(\.[a-z0-9_]+)?\.[a-z0-9]+$")
+
+@dataclass
+class StoredObject:
+    key: str
+    sha256: str
+    size: int
+    content_type: str
+    deduplicated: bool = False  # True if identical content was already stored
+
+def content_key(sha256: str, extension: str, variant: Optional[str] = None) -> str:
+    name = f"{sha256}.{variant}.{extension}" if variant else f"{sha256}.{extension}"
+    return f"{sha256[:2]}/{sha256[2:4]}/{name}"
+
+def is_valid_key(key: str) -> bool:
+    return bool(KEY_PATTERN.match(key))
+
+def public_url(key: str) -> str:
+    return f"{UPLOAD_BASE_URL}/uploads/{key}"
+
+def key_from_url(url: str) -> Optional[str]:
+    """Storage key of one of our own upload URLs, or None for external URLs"""
+    marker = "/uploads/"
+    if marker in url:
+        key = url.split(marker, 1)[1]
+        if is_valid_key(key):
+            return key
+    return None
+
+def sha256_of_key(key: str) -> str:
+    return key.rsplit("/", 1)[-1].split(".", 1)[0]
+
+class StagedWrite(ABC):
+    """An in-progress upload; hashes and counts bytes as they are written"""
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+    def write(self, data: bytes):
+        self._hash.update(data)
+        self.size += len(data)
+        self._write(data)
+
+    @abstractmethod
+    def _write(self, data: bytes):
+        ...
+
+    @abstractmethod
+    def commit(self, extension: str, content_type: str) -> StoredObject:
+        """Move the staged bytes to their content address"""
+
+    @abstractmethod
+    def abort(self):
+        """Discard the staged bytes"""
+
+class Storage(ABC):
+    @abstractmethod
+    def begin(self) -> StagedWrite:
+        ...
+
+    @abstractmethod
+    def exists(self, key: str) -> bool:
+        ...
+
+    @abstractmethod
+    def put_bytes(self, key: str, data: bytes):
+        """Store derived content (thumbnails etc.) under an explicit key"""
+
+    @abstractmethod
+    def read_bytes(self, key: str) -> bytes:
+        ...
+
+    @abstractmethod
+    def local_path(self, key: str) -> Optional[str]:
+        """Filesystem path for serving/processing, or None if not local"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        ...
+
+    def url(self, key: str) -> str:
+        return public_url(key)
+
+class _LocalStagedWrite(StagedWrite):
+    def __init__(self, storage: "LocalStorage"):
+        super().__init__()
+        self._storage = storage
+        fd, self._path = tempfile.mkstemp(dir=storage.staging_dir, suffix=".part")
+        self._file = os.fdopen(fd, "wb", buffering=0)
+
+    def _write(self, data: bytes):
+        self._file.write(data)
+
+    def commit(self, extension: str, content_type: str) -> StoredObject:
+        self._file.close()
+        sha256 = self.sha256
+        key = content_key(sha256, extension)
+        final_path = self._storage.path_for(key)
+        if os.path.exists(final_path):
+            os.unlink(self._path)
+            return StoredObject(key=key, sha256=sha256, size=self.size, content_type=content_type, deduplicated=True)
+
+        os.makedirs(os.path.dirname(final_path), exist_ok=True)
+        # Same filesystem as the staging dir, so this is an atomic rename; a
+        # concurrent identical upload just replaces the file with equal bytes
+        os.replace(self._path, final_path)
+        return StoredObject(key=key, sha256=sha256, size=self.size, content_type=content_type)
+
+    def abort(self):
+        if not self._file.closed:
+            self._file.close()
+        try:
+            os.unlink(self._path)
+        except FileNotFoundError:
+            pass
+
+class LocalStorage(Storage):
+    def __init__(self, root: str = UPLOAD_DIR):
+        self.root = os.path.abspath(root)
+        self.staging_dir = os.path.join(self.root, ".staging")
+        os.makedirs(self.staging_dir, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        if not is_valid_key(key):
+            raise ValueError(f"Invalid storage key: {key}")
+        return os.path.join(self.root, key)
+
+    def begin(self) -> StagedWrite:
+        return _LocalStagedWrite(self)
+
+    def exists(self, key: str) -> bool:
+        return os.path.exists(self.path_for(key))
+
+    def put_bytes(self, key: str, data: bytes):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.staging_dir, suffix=".part")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def read_bytes(self, key: str) -> bytes:
+        with open(self.path_for(key), "rb") as f:
+            return f.read()
+
+    def local_path(self, key: str) -> Optional[str]:
+        return self.path_for(key)
+
+    def delete(self, key: str):
+        try:
+            os.unlink(self.path_for(key))
+        except FileNotFoundError:
+            pass
+
+_storage: Optional[Storage] = None
+
+def get_storage() -> Storage:
+    """FastAPI dependency; defaults to LocalStorage under UPLOAD_DIR"""
+    global _storage
+    if _storage is None:
+        _storage = LocalStorage()
+    return _storage
+
+def set_storage(storage: Storage):
+    global _storage
+    _storage = storage
@@ -0,0 +1,352 @@
+# app/uploads.py
+"""
+Streaming multipart uploads into content-addressed storage.
+
+The request body is fed chunk by chunk through python-multipart's push
+parser instead of letting Starlette spool each file first. File parts go
+straight into a Storage staged write, which hashes as it writes. Limits are
+checked as early as possible:
+- the Content-Length header against the request cap, before reading anything
+- the part's declared type, once its headers arrive
+- the magic bytes, from the first few bytes of data
+- the running size, on every chunk
+"""
+import asyncio
+from dataclasses import dataclass, field
+from datetime import datetime
+import os
+from typing import Dict, List, Optional
+
+from fastapi import HTTPException, Request
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:  # python-multipart < 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
+
+from . import metrics, models
+from .schemas import UploadedPhoto
+from .storage import StagedWrite, Storage, StoredObject
+
+MAX_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_BYTES", str(10 * 1024 * 1024)))
+MAX_FIELD_BYTES = 64 * 1024
+# Received-but-unwritten bytes allowed per file before reading pauses
+MAX_BUFFERED_BYTES = 1024 * 1024
+
+# Sniffed type -> stored extension
+ALLOWED_IMAGE_TYPES = {
+    "image/jpeg": "jpg",
+    "image/png": "png",
+    "image/webp": "webp",
+    "image/heic": "heic",
+}
+_SNIFF_BYTES = 12
+
+upload_bytes = metrics.counter("uploads.bytes", "Bytes received in file parts")
+uploads_stored = metrics.counter("uploads.stored", "Files committed to storage")
+uploads_deduplicated = metrics.counter("uploads.deduplicated", "Uploads matching already stored content")
+uploads_rejected = metrics.counter("uploads.rejected", "File parts rejected for type or size")
+
+class UploadError(HTTPException):
+    pass
+
+@dataclass
+class UploadedFile:
+    field_name: str
+    filename: Optional[str]
+    stored: Optional[StoredObject] = None
+    error: Optional[str] = None
+
+@dataclass
+class MultipartResult:
+    fields: Dict[str, str] = field(default_factory=dict)
+    files: List[UploadedFile] = field(default_factory=list)
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """Identify an image by its magic bytes; the client's content type is not trusted"""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head[4:8] == b"ftyp" and head[8:12] in (b"heic", b"heix", b"mif1", b"msf1"):
+        return "image/heic"
+    return None
+
+_COMMIT = object()
+_ABORT = object()
+
+class _PartWriter:
+    """
+    State for one file part.
+
+    Inline writers touch storage from the parser callbacks. Concurrent
+    writers hand chunks to their own task, which writes them from a worker
+    thread. The next part (and the network read) then proceeds while earlier
+    photos are still being hashed and flushed.
+    """
+
+    def __init__(self, storage: Storage, upload: UploadedFile, max_bytes: int, concurrent: bool = False):
+        self.storage = storage
+        self.upload = upload
+        self.max_bytes = max_bytes
+        self.head = b""
+        self.received = 0
+        self.content_type: Optional[str] = None
+        self.staged: Optional[StagedWrite] = None
+        self.buffered = 0
+        self._closed = False
+        self._queue: Optional[asyncio.Queue] = asyncio.Queue() if concurrent else None
+        self._flushed = asyncio.Event()
+        self.task: Optional[asyncio.Task] = None
+
+    def _submit(self, item):
+        if self._queue is None:
+            self._apply([item])
+            return
+        if self.task is None:
+            self.task = asyncio.create_task(self._drain())
+        if isinstance(item, bytes):
+            self.buffered += len(item)
+        self._queue.put_nowait(item)
+
+    def _apply(self, items: list):
+        """Run queued storage operations (in a worker thread when concurrent)"""
+        for item in items:
+            if item is _COMMIT:
+                stored = self.staged.commit(ALLOWED_IMAGE_TYPES[self.content_type], self.content_type)
+                self.upload.stored = stored
+                uploads_stored.inc()
+                if stored.deduplicated:
+                    uploads_deduplicated.inc()
+            elif item is _ABORT:
+                self.staged.abort()
+            else:
+                self.staged.write(item)
+
+    async def _drain(self):
+        while True:
+            items = [await self._queue.get()]
+            while not self._queue.empty():
+                items.append(self._queue.get_nowait())
+            # Coalesce consecutive chunks into one write per thread hop
+            batch, chunks = [], []
+            for item in items:
+                if isinstance(item, bytes):
+                    chunks.append(item)
+                    continue
+                if chunks:
+                    batch.append(b"".join(chunks))
+                    chunks = []
+                batch.append(item)
+            if chunks:
+                batch.append(b"".join(chunks))
+            try:
+                await asyncio.to_thread(self._apply, batch)
+            except Exception:
+                await asyncio.to_thread(self.staged.abort)
+                raise
+            self.buffered -= sum(len(item) for item in items if isinstance(item, bytes))
+            self._flushed.set()
+            if items[-1] is _COMMIT or items[-1] is _ABORT:
+                return
+
+    async def wait_flushed(self, limit: int):
+        """Backpressure: wait until at most ``limit`` bytes are waiting to be written"""
+        while self.buffered > limit and self.task is not None and not self.task.done():
+            self._flushed.clear()
+            await self._flushed.wait()
+
+    def reject(self, error: str):
+        self.upload.error = error
+        uploads_rejected.inc()
+        self.discard()
+
+    def discard(self):
+        if self.staged is not None and not self._closed:
+            self._closed = True
+            self._submit(_ABORT)
+
+    def write(self, data: bytes):
+        if self.upload.error:
+            return
+        upload_bytes.inc(len(data))
+        self.received += len(data)
+        if self.received > self.max_bytes:
+            return self.reject(f"File exceeds {self.max_bytes} bytes")
+
+        if self.staged is None:
+            # Hold the first bytes back until there are enough to sniff
+            self.head += data
+            if len(self.head) < _SNIFF_BYTES:
+                return
+            self.content_type = sniff_image_type(self.head)
+            if self.content_type not in ALLOWED_IMAGE_TYPES:
+                return self.reject("Unsupported file type")
+            data, self.head = self.head, b""
+            self.staged = self.storage.begin()
+
+        self._submit(data)
+
+    def finish(self):
+        if self.upload.error:
+            return
+        if self.staged is None:
+            # Ended before _SNIFF_BYTES arrived
+            return self.reject("Empty or truncated file" if len(self.head) < _SNIFF_BYTES else "Unsupported file type")
+        self._closed = True
+        self._submit(_COMMIT)
+
+async def receive_multipart(
+    request: Request,
+    storage: Storage,
+    max_files: int = 1,
+    max_file_bytes: int = MAX_FILE_BYTES,
+    concurrent_writes: bool = False,
+) -> MultipartResult:
+    """
+    Stream a multipart/form-data body into storage.
+
+    Per-file problems (type, size) are reported on each UploadedFile so
+    callers can decide whether one bad part fails the request. Malformed
+    bodies, oversized requests and too many files raise UploadError.
+    With ``concurrent_writes`` each file is written by its own task, so
+    multi-photo requests overlap storage I/O with receiving the next part.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise UploadError(status_code=415, detail="Expected multipart/form-data")
+
+    # Room for every file plus headers and small form fields
+    max_request_bytes = max_files * max_file_bytes + MAX_FIELD_BYTES
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_request_bytes:
+        raise UploadError(status_code=413, detail="Request body too large")
+
+    result = MultipartResult()
+    writers: List[_PartWriter] = []
+    state = {"header_field": b"", "header_value": b"", "headers": {}, "writer": None, "field": None}
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["writer"] = None
+        state["field"] = None
+
+    def on_header_field(data: bytes, start: int, end: int):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = state["header_value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        name = options.get(b"name", b"").decode("latin-1")
+        filename = options.get(b"filename")
+        if filename is None:
+            state["field"] = (name, bytearray())
+            return
+
+        upload = UploadedFile(field_name=name, filename=filename.decode("utf-8", "replace"))
+        if len(result.files) >= max_files:
+            raise UploadError(status_code=400, detail=f"At most {max_files} file(s) per request")
+        result.files.append(upload)
+        writer = _PartWriter(storage, upload, max_file_bytes, concurrent=concurrent_writes)
+        writers.append(writer)
+        declared_type = state["headers"].get(b"content-type", b"").decode("latin-1")
+        if declared_type and not declared_type.startswith("image/"):
+            # Reject before reading any of the body
+            writer.reject("File must be an image")
+        state["writer"] = writer
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if state["writer"] is not None:
+            state["writer"].write(data[start:end])
+        elif state["field"] is not None:
+            value = state["field"][1]
+            if len(value) + (end - start) > MAX_FIELD_BYTES:
+                raise UploadError(status_code=413, detail="Form field too large")
+            value.extend(data[start:end])
+
+    def on_part_end():
+        if state["writer"] is not None:
+            state["writer"].finish()
+            state["writer"] = None
+        elif state["field"] is not None:
+            name, value = state["field"]
+            result.fields[name] = value.decode("utf-8", "replace")
+            state["field"] = None
+
+    parser = MultipartParser(boundary, {
+        "on_part_begin": on_part_begin,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+    })
+
+    received = 0
+    try:
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_request_bytes:
+                raise UploadError(status_code=413, detail="Request body too large")
+            parser.write(chunk)
+            if state["writer"] is not None:
+                await state["writer"].wait_flushed(MAX_BUFFERED_BYTES)
+        parser.finalize()
+    except Exception as e:
+        if state["writer"] is not None:
+            state["writer"].discard()
+        await asyncio.gather(*(writer.task for writer in writers if writer.task is not None), return_exceptions=True)
+        if isinstance(e, UploadError):
+            raise
+        raise UploadError(status_code=400, detail=f"Malformed multipart body: {e}")
+
+    await _wait_for_writers(writers)
+    return result
+
+async def _wait_for_writers(writers: List[_PartWriter]):
+    tasks = [writer.task for writer in writers if writer.task is not None]
+    for outcome in await asyncio.gather(*tasks, return_exceptions=True):
+        if isinstance(outcome, Exception):
+            raise UploadError(status_code=500, detail="Failed to store upload") from outcome
+
+def record_uploads(db: Session, user_id: Optional[int], stored: List[StoredObject]):
+    """Register stored files (first uploader wins); caller commits"""
+    if not stored:
+        return
+    db.execute(insert(models.StoredUpload).values([
+        {
+            "sha256": obj.sha256,
+            "storage_key": obj.key,
+            "content_type": obj.content_type,
+            "size": obj.size,
+            "uploaded_by": user_id,
+            "created_at": datetime.utcnow(),
+        }
+        for obj in stored
+    ]).on_conflict_do_nothing(index_elements=["sha256"]))
+
+def to_uploaded_photo(storage: Storage, upload: UploadedFile) -> UploadedPhoto:
+    if upload.stored is None:
+        return UploadedPhoto(slot=upload.field_name, filename=upload.filename, error=upload.error)
+    stored = upload.stored
+    return UploadedPhoto(
+        slot=upload.field_name,
+        filename=upload.filename,
+        url=storage.url(stored.key),
+        sha256=stored.sha256,
+        size=stored.size,
+        content_type=stored.content_type,
+        deduplicated=stored.deduplicated,
+    )
@@ -0,0 +1,56 @@
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import FileResponse, RedirectResponse
+from sqlalchemy.orm import Session
+import logging
+
+from .database import get_db
+from .models import User
+from .schemas import UploadResponse
+from .auth_utils import get_current_user
+from .storage import Storage, get_storage, is_valid_key
+from .uploads import receive_multipart, record_uploads, to_uploaded_photo
+from .images import image_pipeline
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+logger = logging.getLogger(__name__)
+
+MAX_PHOTOS_PER_REQUEST = 8
+
+@router.post("/photos", response_model=UploadResponse)
+async def upload_photos(
+    request: Request,
+    current_user: User = Depends(get_current_user),
+    storage: Storage = Depends(get_storage),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload up to 8 photos as multipart/form-data (any field names).
+
+    Each photo is reported separately; a rejected photo does not fail the
+    others. The returned URLs can be used in photos_uploaded.
+    """
+    result = await receive_multipart(request, storage, max_files=MAX_PHOTOS_PER_REQUEST, concurrent_writes=True)
+    if not result.files:
+        raise HTTPException(status_code=400, detail="No files in request")
+
+    stored = [upload.stored for upload in result.files if upload.stored]
+    record_uploads(db, current_user.id, stored)
+    db.commit()
+    image_pipeline.submit_uploads(db, stored)
+    return UploadResponse(photos=[to_uploaded_photo(storage, upload) for upload in result.files])
+
+@router.get("/{key:path}")
+async def get_upload(key: str, storage: Storage = Depends(get_storage)):
+    """Serve a stored file; content-addressed, so it can be cached forever"""
+    if not is_valid_key(key) or not storage.exists(key):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    path = storage.local_path(key)
+    if path is None:
+        # Remote backends serve their own URLs
+        return RedirectResponse(storage.url(key))
+
+    return FileResponse(path, headers={
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "ETag": f'"{key.rsplit("/", 1)[-1]}"',
+    })
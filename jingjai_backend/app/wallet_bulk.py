@@ -0,0 +1,341 @@
+# app/wallet_bulk.py
+"""
+Bulk Google Wallet pass issuance and balance updates.
+
+Source rows are streamed from the database in keyset batches (users for
+``issue``, existing passes for ``update``), turned into Wallet payloads and
+sent through a bounded thread pool with a shared token-bucket rate limit.
+Each batch's outcomes are written back to google_pay_passes with one
+set-based upsert, and the job's checkpoint advances in the same commit, so a
+crashed run resumes after the last finished batch. A resumed run first
+retries what failed behind the checkpoint: users whose pass is FAILED for
+``issue``, and passes whose pushed balance differs from loyalty_balances for
+``update``. Loyalty object IDs are
+derived from the user id, which makes re-sending an already-created pass a
+harmless 409.
+
+Run from the jingjai_backend directory:
+    python -m app.wallet_bulk issue [--concurrency 16] [--rate 50] [--batch-size 500]
+    python -m app.wallet_bulk update
+"""
+import argparse
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseModel
+from sqlalchemy import and_, exists, func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from . import models
+from .google_pay import GooglePayService, GoogleWalletError
+
+logger = logging.getLogger(__name__)
+
+PROGRAM_NAME = os.getenv("GOOGLE_WALLET_PROGRAM_NAME", "JINGJAI Rewards")
+ISSUER_NAME = os.getenv("GOOGLE_WALLET_ISSUER_NAME", "JINGJAI")
+LOGO_URL = os.getenv("GOOGLE_WALLET_LOGO_URL", "")
+LOYALTY_CLASS_SUFFIX = os.getenv("GOOGLE_WALLET_LOYALTY_CLASS", "jingjai_loyalty")
+
+ISSUED = "ISSUED"
+FAILED = "FAILED"
+
+class PassResult(BaseModel):
+    user_id: int
+    object_id: str
+    account_name: str
+    points_balance: int
+    status: str
+    error: Optional[str] = None
+
+class RateLimiter:
+    """Thread-safe token bucket: at most ``rate`` acquisitions per second"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+def loyalty_class_id(service: GooglePayService) -> str:
+    return f"{service.issuer_id}.{LOYALTY_CLASS_SUFFIX}"
+
+def loyalty_object_id(service: GooglePayService, user_id: int) -> str:
+    """Deterministic per-user object id so re-issuing is idempotent"""
+    return f"{service.issuer_id}.{LOYALTY_CLASS_SUFFIX}_user_{user_id}"
+
+def build_loyalty_object(service: GooglePayService, user_id: int, account_name: str, points: int) -> Dict:
+    return {
+        "id": loyalty_object_id(service, user_id),
+        "classId": loyalty_class_id(service),
+        "state": "ACTIVE",
+        "accountId": str(user_id),
+        "accountName": account_name,
+        "loyaltyPoints": {"label": "Points", "balance": {"int": points}},
+        "barcode": {"type": "QR_CODE", "value": str(user_id)},
+    }
+
+def issue_one(service: GooglePayService, limiter: RateLimiter, user_id: int, account_name: str, points: int) -> PassResult:
+    payload = build_loyalty_object(service, user_id, account_name, points)
+    limiter.acquire()
+    try:
+        service.create_loyalty_object(payload)
+        status, error = ISSUED, None
+    except GoogleWalletError as e:
+        if e.status_code == 409:
+            # Created by an earlier (crashed or repeated) run
+            status, error = ISSUED, None
+        else:
+            status, error = FAILED, str(e)
+    return PassResult(user_id=user_id, object_id=payload["id"], account_name=account_name,
+                      points_balance=points, status=status, error=error)
+
+def update_one(service: GooglePayService, limiter: RateLimiter, user_id: int, account_name: str, points: int) -> PassResult:
+    object_id = loyalty_object_id(service, user_id)
+    limiter.acquire()
+    try:
+        service.patch_loyalty_object(object_id, {"loyaltyPoints": {"label": "Points", "balance": {"int": points}}})
+        status, error = ISSUED, None
+    except GoogleWalletError as e:
+        status, error = FAILED, str(e)
+    return PassResult(user_id=user_id, object_id=object_id, account_name=account_name,
+                      points_balance=points, status=status, error=error)
+
+def send_batch(pool: ThreadPoolExecutor, send: Callable[..., PassResult], service: GooglePayService,
+               limiter: RateLimiter, rows: List[Tuple[int, str, int]]) -> List[PassResult]:
+    """Send one batch of (user_id, account_name, points) rows concurrently"""
+    futures = [pool.submit(send, service, limiter, *row) for row in rows]
+    return [future.result() for future in futures]
+
+def _stream_users_without_pass(db: Session, class_id: str, after_id: int, batch_size: int) -> Iterator[List[tuple]]:
+    while True:
+        has_pass = exists().where(and_(
+            models.GooglePayPass.user_id == models.User.id,
+            models.GooglePayPass.class_id == class_id,
+            models.GooglePayPass.status == ISSUED
+        ))
+        rows = db.query(
+            models.User.id, models.User.name, models.User.email, models.LoyaltyBalance.balance
+        ).outerjoin(
+            models.LoyaltyBalance, models.LoyaltyBalance.user_id == models.User.id
+        ).filter(
+            models.User.id > after_id,
+            models.User.is_active == True,
+            ~has_pass
+        ).order_by(models.User.id).limit(batch_size).all()
+        if not rows:
+            return
+        after_id = rows[-1].id
+        yield [(row.id, row.name or row.email, row.balance or 0) for row in rows]
+
+def _stream_failed_issues(db: Session, class_id: str, up_to: int, batch_size: int) -> Iterator[List[tuple]]:
+    """Users at or below a resumed checkpoint whose pass creation FAILED"""
+    after_id = 0
+    while True:
+        rows = db.query(
+            models.User.id, models.User.name, models.User.email, models.LoyaltyBalance.balance
+        ).join(
+            models.GooglePayPass, and_(
+                models.GooglePayPass.user_id == models.User.id,
+                models.GooglePayPass.class_id == class_id,
+                models.GooglePayPass.status == FAILED
+            )
+        ).outerjoin(
+            models.LoyaltyBalance, models.LoyaltyBalance.user_id == models.User.id
+        ).filter(
+            models.User.id > after_id,
+            models.User.id <= up_to,
+            models.User.is_active == True
+        ).order_by(models.User.id).limit(batch_size).all()
+        if not rows:
+            return
+        after_id = rows[-1].id
+        yield [(row.id, row.name or row.email, row.balance or 0) for row in rows]
+
+def _issued_pass_rows(db: Session, class_id: str):
+    # The balance to push is the ledger's; points_balance is only what was last pushed
+    balance = func.coalesce(models.LoyaltyBalance.balance, 0)
+    return db.query(
+        models.GooglePayPass.user_id,
+        models.GooglePayPass.account_name,
+        balance.label("balance")
+    ).outerjoin(
+        models.LoyaltyBalance, models.LoyaltyBalance.user_id == models.GooglePayPass.user_id
+    ).filter(
+        models.GooglePayPass.class_id == class_id,
+        models.GooglePayPass.status == ISSUED
+    ), balance
+
+def _stream_issued_passes(db: Session, class_id: str, after_id: int, batch_size: int) -> Iterator[List[tuple]]:
+    query, _ = _issued_pass_rows(db, class_id)
+    while True:
+        rows = query.filter(
+            models.GooglePayPass.user_id > after_id
+        ).order_by(models.GooglePayPass.user_id).limit(batch_size).all()
+        if not rows:
+            return
+        after_id = rows[-1].user_id
+        yield [(row.user_id, row.account_name, row.balance) for row in rows]
+
+def _stream_stale_passes(db: Session, class_id: str, up_to: int, batch_size: int) -> Iterator[List[tuple]]:
+    """
+    Passes at or below a resumed checkpoint whose last pushed balance is not
+    the ledger's. A failed update leaves points_balance as it was, so this is
+    how update failures are found again (the pass itself stays ISSUED).
+    """
+    query, balance = _issued_pass_rows(db, class_id)
+    after_id = 0
+    while True:
+        rows = query.filter(
+            models.GooglePayPass.user_id > after_id,
+            models.GooglePayPass.user_id <= up_to,
+            models.GooglePayPass.points_balance.is_distinct_from(balance)
+        ).order_by(models.GooglePayPass.user_id).limit(batch_size).all()
+        if not rows:
+            return
+        after_id = rows[-1].user_id
+        yield [(row.user_id, row.account_name, row.balance) for row in rows]
+
+def upsert_passes(db: Session, service: GooglePayService, results: List[PassResult]):
+    """Write a batch of outcomes into google_pay_passes in one statement"""
+    if not results:
+        return
+    class_id = loyalty_class_id(service)
+    stmt = insert(models.GooglePayPass).values([
+        {
+            "user_id": result.user_id,
+            "program_name": PROGRAM_NAME,
+            "issuer_name": ISSUER_NAME,
+            "account_name": result.account_name,
+            "logo_url": LOGO_URL,
+            "points_balance": result.points_balance,
+            "barcode_value": str(result.user_id),
+            "object_id": result.object_id,
+            "class_id": class_id,
+            "wallet_url": service.generate_add_to_wallet_url(result.object_id),
+            "status": result.status,
+        }
+        for result in results
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["object_id"],
+        set_={
+            "status": stmt.excluded.status,
+            "points_balance": stmt.excluded.points_balance,
+            "wallet_url": stmt.excluded.wallet_url,
+        }
+    )
+    db.execute(stmt)
+
+def _checkpoint(db: Session, job_name: str) -> models.BulkJobCheckpoint:
+    checkpoint = db.query(models.BulkJobCheckpoint).filter(
+        models.BulkJobCheckpoint.job_name == job_name
+    ).first()
+    if checkpoint is None:
+        checkpoint = models.BulkJobCheckpoint(job_name=job_name, last_id=0, processed=0, failed=0)
+        db.add(checkpoint)
+        db.commit()
+    return checkpoint
+
+def run_job(db: Session, service: GooglePayService, mode: str, concurrency: int = 16, rate: float = 50.0,
+            batch_size: int = 500, restart: bool = False) -> Dict:
+    """Run (or resume) a bulk ``issue`` or ``update`` job"""
+    class_id = loyalty_class_id(service)
+    job_name = f"wallet_{mode}:{class_id}"
+    checkpoint = _checkpoint(db, job_name)
+    if restart:
+        checkpoint.last_id, checkpoint.processed, checkpoint.failed = 0, 0, 0
+        db.commit()
+
+    if mode == "issue":
+        retry = _stream_failed_issues
+        batches = _stream_users_without_pass(db, class_id, checkpoint.last_id, batch_size)
+        send = issue_one
+    elif mode == "update":
+        retry = _stream_stale_passes
+        batches = _stream_issued_passes(db, class_id, checkpoint.last_id, batch_size)
+        send = update_one
+    else:
+        raise ValueError(f"Unknown mode: {mode}")
+
+    # On resume, first retry the failures the checkpoint has already moved past
+    sources = [(batches, False)]
+    if checkpoint.last_id:
+        sources.insert(0, (retry(db, class_id, checkpoint.last_id, batch_size), True))
+
+    limiter = RateLimiter(rate)
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for source, retrying in sources:
+            for rows in source:
+                results = send_batch(pool, send, service, limiter, rows)
+                # Only failed issues are recorded; failed updates keep the pass ISSUED
+                upsert_passes(db, service, [r for r in results if mode == "issue" or r.status == ISSUED])
+                failures = [r for r in results if r.status == FAILED]
+                if retrying:
+                    # Already counted when they first failed
+                    checkpoint.failed -= len(results) - len(failures)
+                else:
+                    checkpoint.last_id = rows[-1][0]
+                    checkpoint.processed += len(results)
+                    checkpoint.failed += len(failures)
+                checkpoint.updated_at = datetime.utcnow()
+                db.commit()
+
+                for failure in failures[:5]:
+                    logger.warning(f"Pass {mode} failed for user {failure.user_id}: {failure.error}")
+                elapsed = time.perf_counter() - started
+                logger.info(
+                    f"{job_name}: {checkpoint.processed} processed, {checkpoint.failed} failed, "
+                    f"last user {checkpoint.last_id}, {checkpoint.processed / elapsed:.1f}/s"
+                )
+
+    return {
+        "job": job_name,
+        "processed": checkpoint.processed,
+        "failed": checkpoint.failed,
+        "last_id": checkpoint.last_id,
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+
+if __name__ == "__main__":
+    from .database import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Bulk issue or update Google Wallet loyalty passes")
+    parser.add_argument("mode", choices=["issue", "update"])
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=50.0, help="Max Wallet API calls per second")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--restart", action="store_true", help="Ignore the saved checkpoint")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    service = GooglePayService(os.getenv("GOOGLE_SERVICE_ACCOUNT_FILE"), os.getenv("GOOGLE_PAY_ISSUER_ID"),
+                               pool_size=args.concurrency)
+    db = SessionLocal()
+    try:
+        summary = run_job(db, service, args.mode, args.concurrency, args.rate, args.batch_size, args.restart)
+        print(f"✅ {summary}")
+    finally:
+        db.close()
+        service.close()
@@ -0,0 +1,76 @@
+# benchmarks/bench_catalog_import.py
+"""
+Catalog import throughput: COPY + set-based upserts vs row-by-row ORM.
+
+Needs the app database. Generates a synthetic feed (skus prefixed
+"bench-"), then:
+- imports it with app.catalog_import (cold: every row inserted)
+- imports it again (warm: every row unchanged, nothing rewritten)
+- imports a 5% subset the old way, one SELECT + INSERT per product
+All bench- rows (and the bench brands) are deleted afterwards.
+
+Run from the jingjai_backend directory:
+    python -m benchmarks.bench_catalog_import [rows] [batch_size]
+"""
+import sys
+import time
+
+import psycopg
+
+from app.catalog_import import import_records
+from app.database import SessionLocal, libpq_dsn
+from app.models import Brand, Product
+
+BRANDS = 40
+CATEGORIES = ("handbags", "backpacks", "crossbody", "totes", "wallets")
+
+def make_feed(rows: int):
+    for i in range(rows):
+        yield {
+            "sku": f"bench-{i:08d}",
+            "brand": f"Bench Brand {i % BRANDS}",
+            "category": CATEGORIES[i % len(CATEGORIES)],
+            "name": f"Bench Product {i}",
+            "model": f"M{i % 997}",
+            "price": f"${1000 + i % 5000:,}",
+            "image_urls": [f"https://example.com/bench/{i}.jpg"],
+            "color": ("black", "brown", "beige")[i % 3],
+        }
+
+def bench_orm(records) -> float:
+    db = SessionLocal()
+    started = time.perf_counter()
+    try:
+        brands = {brand.name: brand.id for brand in db.query(Brand).filter(Brand.name.like("Bench Brand %"))}
+        for record in records:
+            sku = record["sku"] + "-orm"
+            if db.query(Product).filter(Product.sku == sku).first() is None:
+                db.add(Product(sku=sku, brand_id=brands[record["brand"]], name=record["name"],
+                               model=record["model"], price=record["price"], image_urls=record["image_urls"]))
+                db.commit()
+    finally:
+        db.close()
+    return time.perf_counter() - started
+
+def cleanup():
+    with psycopg.connect(libpq_dsn()) as conn:
+        conn.execute("DELETE FROM products WHERE sku LIKE 'bench-%'")
+        conn.execute("DELETE FROM product_categories WHERE brand_id IN "
+                     "(SELECT id FROM brands WHERE name LIKE 'Bench Brand %')")
+        conn.execute("DELETE FROM brands WHERE name LIKE 'Bench Brand %'")
+
+if __name__ == "__main__":
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    batch_size = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    cleanup()
+    try:
+        with psycopg.connect(libpq_dsn()) as conn:
+            for label in ("cold", "warm"):
+                stats = import_records(conn, make_feed(rows), batch_size)
+                print(f"import ({label}): {stats.summary()}")
+
+        subset = list(make_feed(max(rows // 20, 1)))
+        elapsed = bench_orm(subset)
+        print(f"row-by-row ORM: {len(subset)} rows, {len(subset) / elapsed:,.0f} rows/s")
+    finally:
+        cleanup()
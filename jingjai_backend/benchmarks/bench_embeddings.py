@@ -0,0 +1,61 @@
+# benchmarks/bench_embeddings.py
+"""
+Query latency of app.embeddings.ProductEmbeddingIndex vs catalog size.
+
+Each synthetic product has 3 catalog images (noisy copies of one vector).
+A query is 2 photos of a random product, perturbed further. Reports the
+median query time for the exact scan and, where built, the IVF layer with
+its recall@1 against the exact answer.
+
+Run from the jingjai_backend directory:
+    python -m benchmarks.bench_embeddings [max_products]
+"""
+import sys
+import time
+
+import numpy as np
+
+from app.embeddings import ProductEmbeddingIndex, normalize
+
+DIM = 256
+IMAGES_PER_PRODUCT = 3
+QUERIES = 50
+
+def make_catalog(products: int, rng: np.random.Generator):
+    centers = normalize(rng.standard_normal((products, DIM)))
+    vectors = np.repeat(centers, IMAGES_PER_PRODUCT, axis=0)
+    vectors += 0.3 / np.sqrt(DIM) * rng.standard_normal(vectors.shape).astype(np.float32)
+    product_ids = np.repeat(np.arange(1, products + 1), IMAGES_PER_PRODUCT)
+    return centers, normalize(vectors), product_ids
+
+def time_queries(index: ProductEmbeddingIndex, queries, **kwargs):
+    timings, answers = [], []
+    for query in queries:
+        started = time.perf_counter()
+        answers.append(index.search(query, k=5, **kwargs)[0][0])
+        timings.append(time.perf_counter() - started)
+    return np.median(timings) * 1000, answers
+
+if __name__ == "__main__":
+    max_products = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rng = np.random.default_rng(0)
+    sizes = [size for size in (1_000, 10_000, 50_000, 200_000, 1_000_000) if size <= max_products]
+
+    print(f"{'products':>9} {'images':>9} {'exact ms':>9} {'ivf ms':>8} {'nlist':>6} {'recall@1':>9}")
+    for products in sizes:
+        centers, vectors, product_ids = make_catalog(products, rng)
+        picks = rng.integers(0, products, QUERIES)
+        queries = [
+            normalize(centers[pick] + 0.5 / np.sqrt(DIM) * rng.standard_normal((2, DIM)))
+            for pick in picks
+        ]
+
+        exact = ProductEmbeddingIndex.build(vectors, product_ids, nlist=0)
+        exact_ms, truth = time_queries(exact, queries)
+        line = f"{products:>9,} {len(vectors):>9,} {exact_ms:>9.2f}"
+        if len(vectors) >= 30_000:
+            ivf = ProductEmbeddingIndex.build(vectors, product_ids, nlist=int(4 * np.sqrt(len(vectors))))
+            ivf_ms, answers = time_queries(ivf, queries)
+            recall = np.mean([a == t for a, t in zip(answers, truth)])
+            line += f" {ivf_ms:>8.2f} {len(ivf.centroids):>6} {recall:>9.2f}"
+        print(line)
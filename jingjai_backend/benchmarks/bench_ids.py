@@ -0,0 +1,63 @@
+# benchmarks/bench_ids.py
+"""
+Throughput and uniqueness check for app.ids.
+
+Run from the jingjai_backend directory:
+    python -m benchmarks.bench_ids [count] [threads]
+"""
+import sys
+import threading
+import time
+
+from app.ids import IdGenerator
+
+def bench_single(count: int):
+    generator = IdGenerator()
+    new = generator.new
+    start = time.perf_counter()
+    ids = [new() for _ in range(count)]
+    elapsed = time.perf_counter() - start
+    assert len(set(ids)) == count, "duplicate IDs generated"
+    assert ids == sorted(ids), "IDs are not monotonic"
+    print(f"new():       {count:>10,} ids in {elapsed:.3f}s  ({count / elapsed:,.0f} ids/s)")
+
+def bench_batch(count: int, batch_size: int = 1000):
+    generator = IdGenerator()
+    start = time.perf_counter()
+    ids = []
+    for _ in range(count // batch_size):
+        ids.extend(generator.new_many(batch_size))
+    elapsed = time.perf_counter() - start
+    assert len(set(ids)) == len(ids), "duplicate IDs generated"
+    assert ids == sorted(ids), "IDs are not monotonic"
+    print(f"new_many():  {len(ids):>10,} ids in {elapsed:.3f}s  ({len(ids) / elapsed:,.0f} ids/s)")
+
+def bench_threads(count: int, threads: int):
+    generator = IdGenerator()
+    per_thread = count // threads
+    results = [None] * threads
+
+    def worker(slot: int):
+        new = generator.new
+        results[slot] = [new() for _ in range(per_thread)]
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    start = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    ids = [value for chunk in results for value in chunk]
+    assert len(set(ids)) == len(ids), "duplicate IDs generated across threads"
+    for chunk in results:
+        assert chunk == sorted(chunk), "IDs are not monotonic within a thread"
+    print(f"{threads} threads:   {len(ids):>10,} ids in {elapsed:.3f}s  ({len(ids) / elapsed:,.0f} ids/s)")
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2_000_000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 4
+    bench_single(count)
+    bench_batch(count)
+    bench_threads(count, threads)
@@ -0,0 +1,66 @@
+# benchmarks/bench_images.py
+"""
+Images/second/core for app.images.render_variants.
+
+Generates synthetic camera-sized JPEGs (with an EXIF orientation tag, like
+phone photos), then renders them through a process pool at increasing
+worker counts, with and without JPEG draft decoding.
+
+Run from the jingjai_backend directory:
+    python -m benchmarks.bench_images [images] [max_workers]
+"""
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from PIL import Image, ImageDraw
+
+from app.images import render_variants
+
+def make_photo(path: str, seed: int, size=(4032, 3024)):
+    rng = random.Random(seed)
+    image = Image.new("RGB", size, (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    draw = ImageDraw.Draw(image)
+    # Enough detail that the encoder and resampler do realistic work
+    for _ in range(400):
+        x, y = rng.randrange(size[0]), rng.randrange(size[1])
+        draw.ellipse((x, y, x + rng.randrange(20, 600), y + rng.randrange(20, 600)),
+                     fill=(rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    exif = Image.Exif()
+    exif[0x0112] = 6  # rotated 90° CW, as most portrait phone shots
+    image.save(path, "JPEG", quality=92, exif=exif.tobytes())
+
+def bench(paths, workers: int, draft: bool) -> float:
+    render = partial(render_variants, draft=draft)
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+        list(pool.map(render, paths[:workers]))  # warm up the worker processes
+        start = time.perf_counter()
+        results = list(pool.map(render, paths))
+        elapsed = time.perf_counter() - start
+    assert all(r["width"] == 3024 and r["height"] == 4032 for r in results), "orientation not applied"
+    return len(paths) / elapsed
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 48
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else (os.cpu_count() or 1)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = []
+        for i in range(count):
+            path = os.path.join(tmp, f"photo_{i}.jpg")
+            make_photo(path, i)
+            paths.append(path)
+        print(f"{count} synthetic 4032x3024 JPEGs, variants: analysis 1024px + thumb 256px")
+
+        workers = 1
+        while workers <= max_workers:
+            for draft in (False, True):
+                rate = bench(paths, workers, draft)
+                print(f"workers={workers:<3} draft={'on ' if draft else 'off'}  "
+                      f"{rate:7.1f} images/s  {rate / workers:6.1f} images/s/core")
+            workers *= 2
@@ -0,0 +1,73 @@
+# benchmarks/bench_inference.py
+"""
+Per-call vs dynamically batched inference with app.inference.StubModel.
+
+Simulates concurrent authentications of 6 photos each. "per-photo" runs one
+forward pass per photo (the naive approach); "batched" routes the same
+photos through BatchingInferenceServer.
+
+Run from the jingjai_backend directory:
+    python -m benchmarks.bench_inference [authentications] [concurrency]
+"""
+import asyncio
+import sys
+import time
+
+import numpy as np
+
+from app import metrics
+from app.inference import INPUT_SIZE, BatchingInferenceServer, StubModel
+
+PHOTOS_PER_AUTHENTICATION = 6
+
+def make_inputs(count: int) -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return rng.uniform(-1, 1, (count, PHOTOS_PER_AUTHENTICATION, INPUT_SIZE, INPUT_SIZE, 3)).astype(np.float32)
+
+def bench_per_photo(model: StubModel, inputs: np.ndarray) -> float:
+    start = time.perf_counter()
+    for photos in inputs:
+        for photo in photos:
+            model.forward(photo[None])
+    return time.perf_counter() - start
+
+async def bench_batched(model: StubModel, inputs: np.ndarray, concurrency: int, max_batch: int, max_wait: float) -> float:
+    server = BatchingInferenceServer(model, max_batch_size=max_batch, max_wait=max_wait)
+    runner = asyncio.create_task(server.run())
+    await asyncio.sleep(0)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(photos):
+        async with semaphore:
+            return await server.infer(photos)
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one(photos) for photos in inputs))
+    elapsed = time.perf_counter() - start
+    runner.cancel()
+
+    # Batching must not change the answers
+    expected = model.forward(inputs[0])
+    assert np.allclose(results[0], expected, atol=1e-5)
+    return elapsed
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    model = StubModel()
+    inputs = make_inputs(count)
+    photos = count * PHOTOS_PER_AUTHENTICATION
+
+    elapsed = bench_per_photo(model, inputs)
+    print(f"per-photo:            {photos / elapsed:10,.0f} photos/s")
+
+    sizes = metrics.histogram("inference.batch_size")
+    waits = metrics.histogram("inference.queue_wait_seconds")
+    for max_batch, max_wait in ((16, 0.002), (32, 0.005), (64, 0.005)):
+        before = sizes.snapshot(), waits.snapshot()
+        elapsed = asyncio.run(bench_batched(model, inputs, concurrency, max_batch, max_wait))
+        after = sizes.snapshot(), waits.snapshot()
+        batches = after[0]["count"] - before[0]["count"]
+        mean_wait = (after[1]["sum"] - before[1]["sum"]) / (after[1]["count"] - before[1]["count"])
+        print(f"batched max={max_batch:<3} wait={max_wait * 1000:.0f}ms: {photos / elapsed:10,.0f} photos/s  "
+              f"mean batch {photos / batches:5.1f}  mean queue wait {mean_wait * 1000:.2f}ms")
@@ -0,0 +1,47 @@
+# benchmarks/bench_payments.py
+"""
+Offline payment throughput against the in-process FakeGateway.
+
+Drives ``concurrency`` concurrent charge calls with the given simulated
+gateway latency, the same way the payments route awaits the gateway.
+Run from the jingjai_backend directory:
+    python -m benchmarks.bench_payments [total] [concurrency] [latency_ms]
+"""
+import asyncio
+import sys
+import time
+
+from app.ids import new_id
+from app.payment_gateways import FakeGateway
+
+async def run(total: int, concurrency: int, latency: float):
+    gateway = FakeGateway(latency=latency, jitter=latency / 2, seed=1)
+    semaphore = asyncio.Semaphore(concurrency)
+    waits = []
+
+    async def one_payment():
+        async with semaphore:
+            start = time.perf_counter()
+            result = await gateway.charge("tok_test", 25.0, "USD", new_id("txn"))
+            waits.append(time.perf_counter() - start)
+            return result.success
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(one_payment() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    await gateway.close()
+
+    waits.sort()
+    p50 = waits[len(waits) // 2] * 1000
+    p99 = waits[int(len(waits) * 0.99) - 1] * 1000
+    print(
+        f"{total:,} charges, concurrency {concurrency}, latency {latency * 1000:.0f}ms: "
+        f"{elapsed:.2f}s ({total / elapsed:,.0f} charges/s), "
+        f"p50 {p50:.1f}ms p99 {p99:.1f}ms, succeeded {sum(results):,}"
+    )
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 50
+    asyncio.run(run(total, concurrency, latency_ms / 1000))
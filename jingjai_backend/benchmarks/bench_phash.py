@@ -0,0 +1,61 @@
+# benchmarks/bench_phash.py
+"""
+Near-duplicate lookups in app.phash.PhotoHashIndex.
+
+Fills an index with random 64-bit hashes, plants a few perturbed copies of
+the query hashes, snapshots it to a memory-mapped file and times one
+authentication's worth of queries (6 photos) against the reloaded index.
+
+Run from the jingjai_backend directory:
+    python -m benchmarks.bench_phash [millions_of_hashes]
+"""
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from app.phash import PhotoHashIndex
+
+QUERIES = 6
+
+def build(count: int, queries: np.ndarray) -> PhotoHashIndex:
+    rng = np.random.default_rng(0)
+    hashes = rng.integers(0, 2 ** 64, count, dtype=np.uint64, endpoint=False)
+    # Plant each query at distance 3 under a known authentication id
+    flips = np.uint64(0b10101)
+    hashes[:len(queries)] = queries ^ flips
+    index = PhotoHashIndex()
+    step = 1_000_000
+    for start in range(0, count, step):
+        chunk = hashes[start:start + step]
+        index.add([(start + i + 1, int(h), (start + i) // 6 + 1) for i, h in enumerate(chunk.tolist())])
+    return index
+
+if __name__ == "__main__":
+    count = int(float(sys.argv[1]) * 1_000_000) if len(sys.argv) > 1 else 2_000_000
+    queries = np.random.default_rng(1).integers(0, 2 ** 64, QUERIES, dtype=np.uint64, endpoint=False)
+
+    started = time.perf_counter()
+    index = build(count, queries)
+    print(f"built {len(index):,} hashes in {time.perf_counter() - started:.1f}s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "photo_hashes.idx")
+        index.save(path)
+        loaded = PhotoHashIndex()
+        started = time.perf_counter()
+        loaded.load(path)
+        print(f"snapshot {os.path.getsize(path) / 2 ** 20:.0f} MiB, mapped in {(time.perf_counter() - started) * 1000:.1f}ms")
+
+        loaded.search(queries.tolist())  # Fault the pages in
+        timings = []
+        for _ in range(10):
+            started = time.perf_counter()
+            results = loaded.search(queries.tolist(), max_distance=6)
+            timings.append(time.perf_counter() - started)
+        assert all(found and found[0][1] == 3 for found in results), results
+        print(f"{QUERIES} queries over {count:,} hashes: median {np.median(timings) * 1000:.1f}ms "
+              f"({count * QUERIES / np.median(timings) / 1e9:.2f}G comparisons/s)")
+        del loaded
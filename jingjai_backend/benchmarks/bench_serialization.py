@@ -0,0 +1,101 @@
+# benchmarks/bench_serialization.py
+"""
+Per-response CPU time for a 50-product page: Pydantic path vs row fast path.
+
+- pydantic: load ORM objects, build ProductsResponse from attributes,
+  then validate and dump it again as FastAPI does for response_model
+- fast: select column tuples, zip into dicts, orjson.dumps
+- fields: the fast path with ?fields=name,thumbnail_url,price (list screens)
+
+Both are measured encode-only (data already in memory) and end to end
+against an in-memory SQLite catalog, so no database server is needed.
+
+Run from the jingjai_backend directory:
+    python -m benchmarks.bench_serialization [page_size] [iterations]
+"""
+import sys
+import time
+from datetime import datetime
+
+import orjson
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, insert
+from sqlalchemy.orm import sessionmaker
+
+from app import models, schemas
+from app.serialization import BRANDS, PRODUCTS, product_dicts, projection
+
+response_adapter = TypeAdapter(schemas.ProductsResponse)
+
+def make_catalog(products: int):
+    engine = create_engine("sqlite://")
+    models.Base.metadata.create_all(engine, tables=[
+        models.Brand.__table__, models.ProductCategory.__table__, models.Product.__table__
+    ])
+    now = datetime.utcnow()
+    with engine.begin() as conn:
+        conn.execute(insert(models.Brand.__table__), [{
+            "id": 1, "name": "Bench Brand", "logo": "BB", "api_endpoint": "bench-brand",
+            "description": "A brand " * 20, "is_featured": True, "is_active": True, "created_at": now,
+        }])
+        conn.execute(insert(models.Product.__table__), [{
+            "brand_id": 1, "name": f"Bench Product {i}", "model": f"M{i}", "description": "Leather bag " * 30,
+            "price": "$2,500", "price_numeric": 2500.0, "currency": "USD",
+            "image_urls": [f"https://example.com/{i}/{n}.jpg" for n in range(4)],
+            "thumbnail_url": f"https://example.com/{i}/thumb.jpg", "sku": f"bench-{i}", "color": "black",
+            "material": "calfskin", "dimensions": "30 x 20 x 10 cm", "is_active": True, "is_featured": False,
+            "stock_status": "in_stock", "created_at": now, "updated_at": now,
+        } for i in range(products)])
+    return sessionmaker(bind=engine)
+
+def pydantic_response(products, brand) -> bytes:
+    response = schemas.ProductsResponse(products=products, total=len(products), brand=brand)
+    return response_adapter.dump_json(response_adapter.validate_python(response, from_attributes=True))
+
+def fast_response(rows, brand_row, products=PRODUCTS) -> bytes:
+    return orjson.dumps({
+        "products": product_dicts(None, None, rows, products),
+        "total": len(rows),
+        "brand": dict(zip(BRANDS.fields, brand_row)),
+    })
+
+def timed(fn, iterations: int) -> float:
+    fn()  # Warm up
+    started = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - started) / iterations * 1e6
+
+if __name__ == "__main__":
+    page_size = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    iterations = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    Session = make_catalog(page_size)
+    db = Session()
+
+    def load_orm():
+        db.expunge_all()
+        brand = db.query(models.Brand).filter(models.Brand.id == 1).first()
+        return db.query(models.Product).order_by(models.Product.name).limit(page_size).all(), brand
+
+    def load_rows(products=PRODUCTS):
+        brand = db.query(*BRANDS.columns).filter(models.Brand.id == 1).first()
+        return db.query(*products.columns).order_by(models.Product.name).limit(page_size).all(), brand
+
+    list_screen = projection(models.Product, PRODUCTS.fields, "name,thumbnail_url,price")
+    products, brand = load_orm()
+    rows, brand_row = load_rows()
+    list_rows, _ = load_rows(list_screen)
+    assert orjson.loads(pydantic_response(products, brand)) == orjson.loads(fast_response(rows, brand_row))
+
+    results = {
+        "encode, pydantic": timed(lambda: pydantic_response(products, brand), iterations),
+        "encode, fast": timed(lambda: fast_response(rows, brand_row), iterations),
+        "query + encode, pydantic": timed(lambda: pydantic_response(*load_orm()), iterations // 5),
+        "query + encode, fast": timed(lambda: fast_response(*load_rows()), iterations // 5),
+        "query + encode, fields": timed(lambda: fast_response(*load_rows(list_screen), list_screen),
+                                        iterations // 5),
+    }
+    for label, micros in results.items():
+        print(f"{label:>26}: {micros:8.0f} µs/response")
+    print(f"payload: {len(fast_response(rows, brand_row)):,} bytes for {page_size} products, "
+          f"{len(fast_response(list_rows, brand_row, list_screen)):,} with fields")
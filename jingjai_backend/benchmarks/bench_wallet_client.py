@@ -0,0 +1,62 @@
+# benchmarks/bench_wallet_client.py
+"""
+Throughput of GooglePayService against the local Wallet stand-in.
+
+Issues loyalty object inserts from a thread pool through one shared client,
+with some injected 429/503s to exercise the retry path.
+Run from the jingjai_backend directory:
+    python -m benchmarks.bench_wallet_client [objects] [threads] [latency_ms] [error_rate]
+"""
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app.google_pay import GooglePayService
+from benchmarks.wallet_standin import StaticCredentials, WalletStandIn
+
+ISSUER_ID = "3388000000000000000"
+
+def run(total: int, threads: int, latency: float, error_rate: float):
+    server = WalletStandIn(latency=latency, error_rate=error_rate, seed=1).start()
+    credentials = StaticCredentials()
+    service = GooglePayService(
+        None, ISSUER_ID,
+        base_url=server.base_url,
+        credentials=credentials,
+        backoff_base=0.01,
+        pool_size=threads
+    )
+
+    def issue(index: int):
+        object_id = service.new_object_id("bench")
+        service.create_loyalty_object({
+            "id": object_id,
+            "classId": f"{ISSUER_ID}.jingjai_loyalty",
+            "state": "ACTIVE",
+            "accountId": str(index),
+            "loyaltyPoints": {"balance": {"int": 0}},
+        })
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(issue, range(total)))
+    elapsed = time.perf_counter() - start
+
+    service.close()
+    server.stop()
+
+    stored = len(server.objects["loyaltyObject"])
+    print(
+        f"{total:,} objects, {threads} threads, latency {latency * 1000:.0f}ms, errors {error_rate:.0%}: "
+        f"{elapsed:.2f}s ({total / elapsed:,.0f} objects/s), "
+        f"{server.requests:,} requests ({server.errors_injected:,} injected errors), "
+        f"stored {stored:,}, token refreshes {credentials.refresh_count}"
+    )
+    assert stored == total, "some objects were not created"
+
+if __name__ == "__main__":
+    total = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    threads = int(sys.argv[2]) if len(sys.argv) > 2 else 16
+    latency_ms = float(sys.argv[3]) if len(sys.argv) > 3 else 20
+    error_rate = float(sys.argv[4]) if len(sys.argv) > 4 else 0.05
+    run(total, threads, latency_ms / 1000, error_rate)
@@ -0,0 +1,61 @@
+# benchmarks/bench_wallet_jwt.py
+"""
+Save-to-wallet URL generation throughput.
+
+Signs RS256 save JWTs with a throwaway 2048-bit key (no service account
+needed) for distinct object sets, then repeats them to measure cache hits.
+Run from the jingjai_backend directory:
+    python -m benchmarks.bench_wallet_jwt [urls] [objects_per_url]
+"""
+import sys
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from google.auth import crypt
+
+from app.google_pay import GooglePayService
+from benchmarks.wallet_standin import StaticCredentials
+
+ISSUER_ID = "3388000000000000000"
+
+def make_signer() -> crypt.RSASigner:
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    return crypt.RSASigner.from_string(pem, key_id="bench")
+
+def run(urls: int, objects_per_url: int):
+    service = GooglePayService(
+        None, ISSUER_ID,
+        credentials=StaticCredentials(),
+        signer=make_signer(),
+        service_account_email="bench@example.iam.gserviceaccount.com",
+        origins=["https://jingjai.example"]
+    )
+    object_sets = [
+        [f"{ISSUER_ID}.bench_{index}_{position}" for position in range(objects_per_url)]
+        for index in range(urls)
+    ]
+
+    start = time.perf_counter()
+    for object_ids in object_sets:
+        service.generate_save_url(loyalty_object_ids=object_ids)
+    cold = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for object_ids in object_sets:
+        service.generate_save_url(loyalty_object_ids=object_ids)
+    warm = time.perf_counter() - start
+
+    service.close()
+    print(f"signed:  {urls:,} urls x {objects_per_url} objects in {cold:.3f}s ({urls / cold:,.0f} urls/s)")
+    print(f"cached:  {urls:,} urls x {objects_per_url} objects in {warm:.3f}s ({urls / warm:,.0f} urls/s)")
+
+if __name__ == "__main__":
+    urls = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    objects_per_url = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    run(urls, objects_per_url)
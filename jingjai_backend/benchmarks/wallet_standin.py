@@ -0,0 +1,173 @@
+# benchmarks/wallet_standin.py
+"""
+Local stand-in for the Google Wallet Objects API.
+
+Implements the subset GooglePayService uses (insert, get and patch for
+loyalty/generic classes and objects) in memory, with optional latency and
+injected 429/503 responses, so the client and the pass pipelines can be
+exercised and benchmarked without Google credentials.
+
+    server = WalletStandIn(latency=0.02, error_rate=0.05).start()
+    service = GooglePayService(None, "3388000000000000000",
+                               base_url=server.base_url, credentials=StaticCredentials())
+    ...
+    server.stop()
+
+Or run it on its own:
+    python -m benchmarks.wallet_standin --port 8765
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+
+RESOURCES = {"loyaltyClass", "loyaltyObject", "genericClass", "genericObject"}
+
+class StaticCredentials:
+    """Drop-in for google-auth credentials that never needs refreshing"""
+
+    def __init__(self, token: str = "standin-token"):
+        self.token = token
+        self.expired = False
+        self.refresh_count = 0
+
+    def refresh(self, request):
+        self.refresh_count += 1
+        self.token = "standin-token"
+
+class WalletStandIn:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0,
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.objects: Dict[str, Dict[str, Dict]] = {resource: {} for resource in RESOURCES}
+        self.requests = 0
+        self.errors_injected = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/walletobjects/v1"
+
+    def start(self) -> "WalletStandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: Dict, headers: Optional[Dict[str, str]] = None):
+                data = json.dumps(body).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            def _read_body(self) -> Dict:
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}")
+
+            def _route(self):
+                parts = self.path.split("?", 1)[0].strip("/").split("/")
+                # walletobjects/v1/<resource>[/<id>]
+                if len(parts) < 3 or parts[:2] != ["walletobjects", "v1"] or parts[2] not in RESOURCES:
+                    return None, None
+                return parts[2], (parts[3] if len(parts) > 3 else None)
+
+            def _preamble(self) -> bool:
+                """Common latency/auth/error injection; returns False if already answered"""
+                with standin._lock:
+                    standin.requests += 1
+                    inject = standin.error_rate and standin._random.random() < standin.error_rate
+                    if inject:
+                        standin.errors_injected += 1
+                if standin.latency:
+                    time.sleep(standin.latency)
+                if not self.headers.get("Authorization", "").startswith("Bearer "):
+                    self._send(401, {"error": {"code": 401, "message": "Missing bearer token"}})
+                    return False
+                if inject:
+                    status = 429 if standin._random.random() < 0.5 else 503
+                    self._send(status, {"error": {"code": status, "message": "Injected error"}},
+                               headers={"Retry-After": "0"})
+                    return False
+                return True
+
+            def do_POST(self):
+                body = self._read_body()
+                if not self._preamble():
+                    return
+                resource, object_id = self._route()
+                if resource is None or object_id is not None:
+                    return self._send(404, {"error": {"code": 404, "message": "Not found"}})
+                object_id = body.get("id")
+                if not object_id:
+                    return self._send(400, {"error": {"code": 400, "message": "id is required"}})
+                with standin._lock:
+                    store = standin.objects[resource]
+                    if object_id in store:
+                        return self._send(409, {"error": {"code": 409, "message": "Resource already exists"}})
+                    store[object_id] = body
+                self._send(200, body)
+
+            def do_GET(self):
+                if not self._preamble():
+                    return
+                resource, object_id = self._route()
+                with standin._lock:
+                    found = standin.objects.get(resource, {}).get(object_id) if resource else None
+                if found is None:
+                    return self._send(404, {"error": {"code": 404, "message": "Not found"}})
+                self._send(200, found)
+
+            def do_PATCH(self):
+                body = self._read_body()
+                if not self._preamble():
+                    return
+                resource, object_id = self._route()
+                with standin._lock:
+                    found = standin.objects.get(resource, {}).get(object_id) if resource else None
+                    if found is not None:
+                        found.update(body)
+                if found is None:
+                    return self._send(404, {"error": {"code": 404, "message": "Not found"}})
+                self._send(200, found)
+
+        return Handler
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local Google Wallet API stand-in")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests answered 429/503")
+    args = parser.parse_args()
+
+    server = WalletStandIn(port=args.port, latency=args.latency, error_rate=args.error_rate).start()
+    print(f"Wallet stand-in listening on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()